@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# Copyright (c) 2012 - 2013 Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+Model instantiation benchmark.
+
+Instantiates 100,000 models and compares the time it takes with the time
+that the previous ``Model.__new__`` inspection (``inspect.getmembers``
+plus a nested loop over ``_storm_columns`` on every instantiation) adds
+to the same number of instantiations. The class metadata is computed
+only once per class now (see :class:`~mamba.application.model.ModelInfo`).
+
+Run it from the repository root with::
+
+    python benchmarks/models.py
+"""
+
+import sys
+import time
+import inspect
+from collections import OrderedDict
+
+sys.path.insert(0, '.')
+
+from storm.properties import PropertyColumn
+from storm.locals import Int, Unicode, DateTime, Decimal, Bool
+
+from mamba.application.model import Model
+
+
+class Customer(Model):
+    __storm_table__ = 'customer'
+
+    id = Int(primary=True, auto_increment=True, unsigned=True)
+    name = Unicode(size=64)
+    email = Unicode(size=128)
+    created = DateTime()
+    balance = Decimal(size=(10, 2))
+    active = Bool()
+
+    def __init__(self):
+        # skip the transactor creation, we measure the class inspection
+        pass
+
+
+def previous_inspection(cls):
+    columns = inspect.getmembers(
+        cls, lambda o: isinstance(o, PropertyColumn)
+    )
+    creation_order = sorted(columns, key=lambda i: i[1]._creation_order)
+    ordered_columns = OrderedDict()
+
+    for _, ordered_property in creation_order:
+        for column, property_ in cls._storm_columns.iteritems():
+            if ordered_property is property_:
+                ordered_columns[column] = property_
+                break
+
+    cls._storm_columns = ordered_columns
+
+
+def main(number=100000):
+    Customer()  # build the class metadata
+
+    started = time.time()
+    for _ in xrange(number):
+        Customer()
+    current = time.time() - started
+
+    started = time.time()
+    for _ in xrange(number):
+        previous_inspection(Customer)
+        Customer()
+    previous = time.time() - started
+
+    print('{:>28} {:>12}'.format('path', 'time (s)'))
+    print('{:>28} {:>12.3f}'.format('previous (inspect per new)', previous))
+    print('{:>28} {:>12.3f}'.format('class level metadata', current))
+    print('{} instantiations, {:.1f}x faster'.format(
+        number, previous / current))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# Copyright (c) 2012 - 2013 Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+Routing dispatch benchmark.
+
+Measures the time that :class:`~mamba.web.routing.RouteDispatcher` takes
+to lookup a route when a controller has from 10 to 10,000 routes installed
+and compares it with a linear scan of the routes (what the dispatcher did
+before the routes trie). The dispatch cache of the router is disabled so
+every lookup goes through the trie. The dispatch latency should remain
+flat regardless of the routes count.
+
+Run it from the repository root with::
+
+    python benchmarks/routing.py
+"""
+
+import sys
+import timeit
+from cStringIO import StringIO
+
+from twisted.web.http_headers import Headers
+from twisted.web.test.requesthelper import DummyRequest
+
+sys.path.insert(0, '.')
+
+from mamba.web.routing import Route, Router, RouteDispatcher
+
+
+class BenchController(object):
+
+    children = {}
+
+    def get_register_path(self):
+        return ''
+
+
+def callback(controller, request, **kwargs):
+    return kwargs
+
+
+def build_router(size):
+    # no dispatch cache, we measure the trie and not the cache hits
+    router = Router(cache_size=0)
+    controller = BenchController()
+    routes = []
+    for i in range(size):
+        for url in ('/static{}/list'.format(i), '/items{}/<int:id>'.format(i)):
+            route = Route('GET', url, callback)
+            route.compile()
+            router.register_route(controller, route, 'callback')
+            routes.append(route)
+
+    return router, controller, routes
+
+
+def linear_lookup(routes, dispatcher):
+    """Validate every route in turn until one of them matches
+    """
+
+    for route in routes:
+        match = route.validate(dispatcher)
+        if match is not None:
+            return match
+
+
+def build_request(postpath):
+    request = DummyRequest(postpath)
+    request.method = 'GET'
+    request.content = StringIO()
+    request.requestHeaders = Headers()
+    return request
+
+
+def main(number=10000):
+    print('{:>8} {:>14} {:>14} {:>14} {:>14}'.format(
+        'routes', 'static (us)', 'linear (us)', 'typed (us)', 'linear (us)'))
+    for size in (10, 100, 1000, 10000):
+        router, controller, routes = build_router(size)
+        last = size - 1
+        static = build_request(['static{}'.format(last), 'list'])
+        typed = build_request(['items{}'.format(last), '12345'])
+        # the linear scan is slow with many routes, run it fewer times
+        scans = max(number // size, 10)
+
+        results = []
+        for request in (static, typed):
+            elapsed = timeit.timeit(
+                lambda: RouteDispatcher(router, controller, request).lookup(),
+                number=number
+            )
+            results.append(elapsed / number * 1e6)
+
+            dispatcher = RouteDispatcher(router, controller, request)
+            elapsed = timeit.timeit(
+                lambda: linear_lookup(routes, dispatcher), number=scans)
+            results.append(elapsed / scans * 1e6)
+
+        print('{:>8} {:>14.2f} {:>14.2f} {:>14.2f} {:>14.2f}'.format(
+            size * 2, *results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# Copyright (c) 2012 - 2013 Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+Response serialization benchmark.
+
+Compares the time that the previous response path (``Converter.serialize``
+in the router plus ``json.dumps`` in ``Controller.sendback``) takes to
+encode a 10,000 element list of dicts, the same items keyed by id and a
+10,000 element list of objects converted by a registered adapter (as
+models are) with the single pass :class:`~mamba.web.serializer.JSONSerializer`
+used by the router now.
+
+The list of dicts is already encoded by a single ``json.dumps`` call in
+both paths so its time is roughly the same, the gain is in nested dicts
+(that ``Converter`` rebuilds). Lists of adapted objects are adapted in
+one go (the adapter is looked up once per list) so they take the same
+time as the route handlers converting the models into dicts themselves.
+
+Run it from the repository root with::
+
+    python benchmarks/serializer.py
+"""
+
+import sys
+import json
+import timeit
+
+sys.path.insert(0, '.')
+
+from mamba.web import serializer
+from mamba.utils.converter import Converter
+
+
+def build_result(size=10000):
+    return [
+        {'id': i, 'name': u'Item {}'.format(i), 'price': i * 1.5,
+         'tags': ['mamba', 'twisted'], 'active': i % 2 == 0}
+        for i in range(size)
+    ]
+
+
+class Item(object):
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+    def dict(self):
+        return dict(self.__dict__)
+
+
+serializer.register_adapter(Item, Item.dict)
+
+
+def previous_path(result):
+    # the route handlers had to convert the models into dicts themselves
+    if isinstance(result, list):
+        result = [
+            item.dict() if isinstance(item, Item) else item for item in result
+        ]
+
+    return json.dumps(Converter.serialize(result))
+
+
+def main(number=20):
+    items = build_result()
+    encoder = serializer.registry.negotiate(items, 'application/json')
+
+    objects = [Item(**item) for item in items]
+
+    print('{:>24} {:>16} {:>16} {:>16}'.format(
+        'path', 'list (ms)', 'dict (ms)', 'objects (ms)'))
+    for name, path in (
+            ('converter + json.dumps', previous_path),
+            ('serializer registry', encoder.serialize)):
+        results = []
+        # the list is not rebuilt by Converter but nested dicts are
+        for result in (
+                items, dict((i['id'], i) for i in items), objects):
+            assert json.loads(path(result)) == json.loads(
+                previous_path(result))
+            elapsed = timeit.timeit(lambda: path(result), number=number)
+            results.append(elapsed / number * 1e3)
+
+        print('{:>24} {:>16.2f} {:>16.2f} {:>16.2f}'.format(
+            name, *results))
+
+
+if __name__ == '__main__':
+    main()
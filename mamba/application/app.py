@@ -23,6 +23,7 @@ from twisted.python import versions, filepath
 
 from mamba.utils import borg
 from mamba.utils import log
+from mamba.web import body
 from mamba.http import headers
 from mamba.core import packages
 from mamba import _version as _mamba_version
@@ -158,6 +159,9 @@ class Mamba(borg.Borg):
             # add new method
             setattr(http.Request, 'getClientProxyIP', getClientProxyIP)
 
+            # add lazy request.json and request.form attributes
+            body.patch_request(http.Request)
+
             # patch getClientIP
             monkey_patcher = MonkeyPatcher(
                 (http.Request, 'getClientIP', getClientIPPatch)
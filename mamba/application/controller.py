@@ -13,14 +13,14 @@
 """
 
 from os.path import normpath
-import json
 
 from mamba.utils import log
 from twisted.web import http, server
+from twisted.internet.task import TaskStopped
 from zope.interface import implementer
 
 from mamba import plugin
-from mamba.web import routing
+from mamba.web import routing, serializer, stream
 from mamba.utils.output import bold
 from mamba.core import module, resource
 from mamba.core.interfaces import IController
@@ -157,9 +157,17 @@ class Controller(resource.Resource, ControllerProvider):
 
         self.prepare_headers(request, result.code, result.headers)
 
+        if stream.is_streamable(result.subject):
+            return self.sendback_stream(result, request)
+
         try:
+            if request.method == 'HEAD':
+                request.finish()
+                return
+
             if type(result.subject) is not str:
-                subject = json.dumps(result.subject)
+                subject = serializer.registry.get(
+                    'application/json').serialize(result.subject)
             else:
                 subject = result.subject
 
@@ -175,6 +183,37 @@ class Controller(resource.Resource, ControllerProvider):
 
         return
 
+    def sendback_stream(self, result, request):
+        """
+        Stream a result which subject is a generator, an iterator or a
+        body producer to the browser, the transport pauses the stream when
+        the browser is slower than us
+
+        :param request: the HTTP request
+        :type request: :class:`~twisted.web.server.Request`
+        :param result: the result for send back to the browser
+        :type result: :class:`~mamba.web.response.Response`
+        """
+
+        if request.method == 'HEAD':
+            close = getattr(result.subject, 'close', None)
+            if close is not None:
+                close()
+            request.finish()
+            return
+
+        def finish(_):
+            request.finish()
+
+        def error(failure):
+            if not failure.check(TaskStopped):
+                log.err(failure, 'Streamed response failed:')
+                # abort, the browser must know that the response is truncated
+                request.loseConnection()
+
+        return stream.stream(result.subject, request).addCallbacks(
+            finish, error)
+
     def prepare_headers(self, request, code, headers):
         """
         Prepare the back response headers
@@ -267,6 +306,17 @@ class ControllerManager(module.ModuleManager):
 
         return self._valid_file(normpath(file_path), 'mamba-controller')
 
+    def reload(self, module):
+        """Reload a controller module and invalidate the router caches
+
+        :param module: the module to reload
+        :type module: str
+        """
+
+        super(ControllerManager, self).reload(module)
+        Controller._router.dispatch_cache.clear()
+        Controller._router.response_cache.clear()
+
     def lookup_path(self, path):
         """Lookup for a controller using its path
 
@@ -15,13 +15,25 @@ try:
 except ImportError:
     import pickle
 
+import time
+import base64
 import inspect
+import itertools
+import functools
 from os.path import normpath
-from collections import OrderedDict
+from collections import OrderedDict, deque
 
 from storm.uri import URI
 from mamba.utils import log
-from storm.expr import Desc, Undef
+from twisted.internet import defer, threads
+from twisted.python.threadable import isInIOThread
+from storm.exceptions import CompileError
+from storm.store import Store
+from storm.expr import (
+    Desc, Undef, Insert, Update, Delete, State, Expr, In, And, Or, Eq, Gt,
+    Lt, Ge, Le, compare_columns
+)
+from storm.info import get_cls_info, get_obj_info
 from storm.twisted.transact import Transactor
 from storm.references import Reference, ReferenceSet
 from storm.properties import PropertyPublisherMeta, PropertyColumn
@@ -32,8 +44,11 @@ from storm.variables import (
 
 from mamba import plugin
 from mamba.utils import config, json
+from mamba.utils.lru import LRUCache
 from mamba.core import interfaces, module
-from mamba.enterprise.database import Database, AdapterFactory, transact
+from mamba.enterprise.database import (
+    Database, AdapterFactory, transact, bind_deadline, get_backend
+)
 
 
 class MambaStorm(PropertyPublisherMeta, plugin.ExtensionPoint):
@@ -74,6 +89,1052 @@ class InvalidModelSchema(ModelError):
     """
 
 
+class InvalidCursor(ModelError):
+    """Fired when a pagination cursor can not be decoded
+    """
+
+
+class Page(object):
+    """
+    I am a page of objects returned by :meth:`Model.paginate`, `cursor` is
+    the opaque token that reads the next page or None if this is the last
+    one. Routes can return me directly, I am serialized as::
+
+        {"items": [...], "cursor": "WzQyXQ=="}
+
+    :param items: the (detached) objects in the page
+    :type items: list
+    :param cursor: the token of the next page
+    :type cursor: str
+    """
+
+    __slots__ = ('items', 'cursor')
+
+    def __init__(self, items, cursor):
+        self.items = items
+        self.cursor = cursor
+
+    def dict(self, traverse=False, json=False, **kwargs):
+        """
+        Return the page as a dictionary, the items are converted with
+        :meth:`Model.dict` with the given options (the references are not
+        traversed by default as the items are detached from the store)
+        """
+
+        return {
+            'items': [
+                item.dict(traverse, json, **kwargs) for item in self.items
+            ],
+            'cursor': self.cursor
+        }
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return 'Page({}, {!r})'.format(len(self.items), self.cursor)
+
+
+class BatchIterator(object):
+    """
+    I deliver the objects read by :meth:`Model.iterate` to the reactor in
+    batches, every call to :meth:`next` returns a Deferred that fires with
+    the next batch (a list of detached objects) or with an empty list when
+    there are no more rows::
+
+        batches = Customer.iterate(Customer.active == True)
+        while True:
+            batch = yield batches.next()
+            if not batch:
+                break
+            report.write(batch)
+
+    The rows are read from a server side cursor by a single thread of the
+    database pool that holds it (and its transaction) until the last batch
+    is read or I am closed. The thread reads the next batch while the
+    current one is processed and then it waits until it is asked for, so
+    there are never more than two batches in memory no matter how many
+    rows the result set has.
+
+    If the next batch is not asked for in `idle_timeout` seconds the
+    transaction is rolled back, the thread released and :meth:`next`
+    fails with :class:`twisted.internet.defer.TimeoutError`. I am closed
+    as well when I am garbage collected
+
+    :param produce: the function that reads the batches in the pool, it
+        is called with the callable that hands every batch over to me
+    :type produce: callable
+    :param pool: the pool where the batches are read
+    :type pool: :class:`twisted.python.threadpool.ThreadPool`
+    :param idle_timeout: the seconds that the thread waits for the next
+        batch to be asked for (forever if None)
+    :type idle_timeout: int
+    :param kwargs: the keyword arguments for the transactor
+    :type kwargs: dict
+    """
+
+    def __init__(self, produce, pool, idle_timeout=60, **kwargs):
+        # the database thread only references the channel so I can be
+        # garbage collected (and close it) while the thread waits
+        self._channel = _BatchChannel(produce, pool, idle_timeout, kwargs)
+
+    def next(self):
+        """
+        Return a Deferred that fires with the next batch of objects, an
+        empty list if there are no more rows
+        """
+
+        return self._channel.next()
+
+    @defer.inlineCallbacks
+    def each(self, function):
+        """
+        Call the given function with every batch (waiting for it if it
+        returns a Deferred), returns a Deferred that fires with the number
+        of objects read. I am closed if the function fails
+        """
+
+        count = 0
+        try:
+            while True:
+                batch = yield self.next()
+                if not batch:
+                    break
+                yield function(batch)
+                count += len(batch)
+        except Exception:
+            self.close()
+            raise
+
+        defer.returnValue(count)
+
+    def close(self):
+        """
+        Stop reading rows, the cursor is closed and the database thread
+        released as soon as it is done with the batch that it is reading
+        """
+
+        self._channel.close()
+
+    def __del__(self):
+        channel = self.__dict__.get('_channel')
+        if channel is not None and not channel.finished:
+            from twisted.internet import reactor
+            # we may be collected in any thread
+            reactor.callFromThread(channel.close)
+
+    def __repr__(self):
+        return 'BatchIterator({})'.format(
+            'done' if self._channel.finished else 'running')
+
+
+class _BatchChannel(object):
+    """
+    I hand the batches over from the database thread to the reactor on
+    behalf of :class:`BatchIterator`
+    """
+
+    def __init__(self, produce, pool, idle_timeout, kwargs):
+        self._produce = produce
+        self._pool = pool
+        self._idle_timeout = idle_timeout
+        self._kwargs = kwargs
+        self._batches = deque()
+        self._waiting = None
+        self._resume = None
+        self._started = False
+        self._stopped = False
+        self._done = False
+        self._failure = None
+
+    @property
+    def finished(self):
+        """True if the database thread is not (going to be) used any more
+        """
+
+        return self._done or self._stopped or self._failure is not None
+
+    def next(self):
+        if self._batches:
+            batch = self._batches.popleft()
+            self._wake()
+            return defer.succeed(batch)
+
+        if self._failure is not None:
+            return defer.fail(self._failure)
+
+        if self._done or self._stopped:
+            return defer.succeed([])
+
+        if self._waiting is not None:
+            raise ModelError('the previous batch has not been delivered yet')
+
+        # a synchronous pool delivers the batches before we return
+        waiting = self._waiting = defer.Deferred()
+        if not self._started:
+            self._start()
+
+        return waiting
+
+    def close(self):
+        self._stopped = True
+        self._batches.clear()
+        self._wake()
+
+    def _wake(self):
+        """Let the database thread read the next batch
+        """
+
+        resume, self._resume = self._resume, None
+        if resume is not None and not resume.called:
+            resume.callback(None)
+
+    def _start(self):
+        """Start reading the batches in the database pool
+        """
+
+        self._started = True
+        result = defer.maybeDeferred(
+            Transactor(self._pool).run,
+            self._produce, self._hand_over, **self._kwargs
+        )
+        result.addCallbacks(self._finished, self._failed)
+
+    def _hand_over(self, batch):
+        """
+        Deliver a batch from the database thread and wait until it is
+        asked for, returns False if the iterator has been closed
+        """
+
+        if self._stopped:
+            return False
+
+        if isInIOThread():
+            # synchronous pool, there is nothing to wait for
+            self._deliver(batch)
+        else:
+            from twisted.internet import reactor
+            # raises TimeoutError so the transaction is rolled back
+            threads.blockingCallFromThread(
+                reactor, self._deliver, batch, self._idle_timeout)
+
+        return not self._stopped
+
+    def _deliver(self, batch, timeout=None):
+        if self._stopped:
+            return
+
+        waiting, self._waiting = self._waiting, None
+        if waiting is not None:
+            waiting.callback(batch)
+            return
+
+        self._batches.append(batch)
+        self._resume = defer.Deferred()
+        if timeout is not None:
+            from twisted.internet import reactor
+            self._resume.addTimeout(timeout, reactor)
+        return self._resume
+
+    def _finished(self, result):
+        self._done = True
+        waiting, self._waiting = self._waiting, None
+        if waiting is not None:
+            waiting.callback([])
+
+    def _failed(self, failure):
+        if failure.check(defer.TimeoutError):
+            log.msg('iteration idle for more than {} seconds, rolled '
+                    'back'.format(self._idle_timeout))
+            # the pending batch belongs to the rolled back transaction
+            self._batches.clear()
+
+        self._failure = failure
+        waiting, self._waiting = self._waiting, None
+        if waiting is not None:
+            waiting.errback(failure)
+
+
+class Row(object):
+    """
+    I am the base class of the lightweight rows returned by
+    :meth:`Model.select`, every projection of a model gets its own
+    subclass with a slot per selected column. I behave like a tuple of
+    the selected values and they are also available as attributes, I
+    don't carry any Storm state so I can be used in any thread::
+
+        row = rows[0]
+        row.name == row[1]
+        uid, name = row
+
+    Routes can return me directly, I am serialized with :meth:`dict`
+    """
+
+    __slots__ = ()
+
+    _names = ()
+    _columns = ()
+    _converters = ()
+
+    def __init__(self, *values):
+        for attribute, value in zip(self.__slots__, values):
+            setattr(self, attribute, value)
+
+    def dict(self, traverse=False, json=False, fields=None, exclude=None):
+        """
+        Return the row as a dictionary keyed by column name, it is the
+        same dict that :meth:`Model.dict` returns for the selected fields
+
+        :param traverse: ignored, rows have no references
+        :type traverse: bool
+        :param json: if True we convert datetime to string and Decimal to
+            float
+        :type json: bool
+        :param fields: If set we filter only the fields specified
+        :type fields: list
+        :param exclude: If set we exclude the fields specified, not
+            working if you also set fields
+        :type exclude: list
+        """
+
+        values = {}
+        for name, attribute, converter in zip(
+                self._names, self.__slots__, self._converters):
+            if fields and name not in fields:
+                continue
+            if exclude and name in exclude and not fields:
+                continue
+
+            value = getattr(self, attribute)
+            if json is True and converter is not None:
+                value = converter(value)
+            values[name] = value
+
+        return values
+
+    def __iter__(self):
+        return (getattr(self, attribute) for attribute in self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __getitem__(self, index):
+        return tuple(self)[index]
+
+    def __eq__(self, other):
+        if not isinstance(other, (Row, tuple)):
+            return NotImplemented
+
+        return tuple(self) == tuple(other)
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(attribute, getattr(self, attribute))
+            for attribute in self.__slots__
+        ))
+
+
+class ModelInfo(object):
+    """
+    I hold the class level metadata of a model that is computed only once
+    per class (the first time that the model is instantiated) instead of
+    on every instantiation: the columns in the order that they were
+    declared, their attribute names, variable classes, if they accept None
+    values and the primary key.
+
+    :param cls: the model class
+    :type cls: :class:`~mamba.application.model.Model`
+    """
+
+    __slots__ = (
+        'columns', 'attributes', 'names', 'variable_classes', 'not_none',
+        'primary_key', 'cls', 'serializers', 'cache', 'rows'
+    )
+
+    max_serializers = 256
+
+    def __init__(self, cls):
+        # getmembers fills the (lazy) Storm _storm_columns for every column
+        members = inspect.getmembers(
+            cls, lambda o: isinstance(o, PropertyColumn)
+        )
+        creation_order = sorted(members, key=lambda i: i[1]._creation_order)
+        # models without columns (Model itself) have no _storm_columns
+        properties = dict(
+            (id(column), property_) for property_, column in getattr(
+                cls, '_storm_columns', {}).iteritems()
+        )
+
+        self.columns = OrderedDict()
+        for _, column in creation_order:
+            property_ = properties.get(id(column))
+            if property_ is not None:
+                self.columns[property_] = column
+
+        self.cls = cls
+        self.serializers = {}
+        self.rows = {}
+        self.attributes = []
+        self.names = []
+        self.variable_classes = []
+        self.not_none = []
+        for property_, column in self.columns.iteritems():
+            attribute = property_._detect_attr_name(cls)
+            variable = column.variable_factory()
+            self.attributes.append(attribute)
+            self.names.append(column.name)
+            self.variable_classes.append(type(variable))
+            if not variable._allow_none and variable._value is Undef:
+                self.not_none.append((attribute, column))
+
+        options = getattr(cls, '__mamba_cache__', None)
+        self.cache = ModelCache(**options) if options else None
+
+        self.primary_key = getattr(cls, '__storm_primary__', None)
+        if self.primary_key is None:
+            for column in self.columns.itervalues():
+                if column.primary == 1:
+                    self.primary_key = column.name
+                    break
+
+    def serializer(self, fields=None, exclude=None, json=False,
+                   traverse=True):
+        """
+        Return the :class:`~mamba.application.model.ModelSerializer` for
+        the given options, it is compiled the first time that the options
+        are used and reused for every later object of the class
+
+        :param fields: the fields to include
+        :type fields: list
+        :param exclude: the fields to exclude
+        :type exclude: list
+        :param json: if True the values are converted for JSON
+        :type json: bool
+        :param traverse: if True the references are serialized too
+        :type traverse: bool
+        """
+
+        key = (tuple(fields or ()), tuple(exclude or ()), json, traverse)
+        serializer = self.serializers.get(key)
+        if serializer is None:
+            if len(self.serializers) >= self.max_serializers:
+                # fields and exclude can come from user input
+                self.serializers.clear()
+            serializer = ModelSerializer(self, *key)
+            self.serializers[key] = serializer
+
+        return serializer
+
+    def row_type(self, fields=None, exclude=None):
+        """
+        Return the :class:`~mamba.application.model.Row` subclass for the
+        projection of the given fields (or all of them but the excluded
+        ones), they are selected as :meth:`Model.dict` selects them so
+        the same lists can be used. The class is built the first time that
+        the options are used and reused for every later projection
+
+        :param fields: the fields to select
+        :type fields: list
+        :param exclude: the fields to exclude, ignored if fields are given
+        :type exclude: list
+        """
+
+        key = (tuple(fields or ()), tuple(exclude or ()))
+        row_type = self.rows.get(key)
+        if row_type is not None:
+            return row_type
+
+        attributes, names, columns, converters = [], [], [], []
+        for (_, column), attribute, name, variable_class in zip(
+                self.columns.iteritems(), self.attributes, self.names,
+                self.variable_classes):
+            if fields and name not in fields:
+                continue
+            if exclude and name in exclude and not fields:
+                continue
+
+            converter = None
+            for classes, function in ModelSerializer.converters:
+                if issubclass(variable_class, classes):
+                    converter = function
+                    break
+
+            attributes.append(attribute)
+            names.append(name)
+            columns.append(column)
+            converters.append(converter)
+
+        if not columns:
+            raise ModelError('{} has none of the fields {!r}'.format(
+                self.cls.__name__, list(fields or ())))
+
+        row_type = type('{}Row'.format(self.cls.__name__), (Row,), {
+            '__module__': self.cls.__module__,
+            '__slots__': tuple(attributes),
+            '_names': tuple(names),
+            '_columns': tuple(columns),
+            '_converters': tuple(converters)
+        })
+        if len(self.rows) >= self.max_serializers:
+            # fields and exclude can come from user input
+            self.rows.clear()
+        self.rows[key] = row_type
+
+        return row_type
+
+    def __repr__(self):
+        return 'ModelInfo({!r})'.format(self.names)
+
+
+def _to_string(value):
+    return str(value) if value is not None else None
+
+
+def _to_float(value):
+    return float(value) if value else value
+
+
+class ModelSerializer(object):
+    """
+    I convert objects of a model class into dicts for a given combination
+    of fields, exclude, json and traverse options. The work that does not
+    depend on the object (filtering the fields, choosing the conversion of
+    every column and finding the references) is done only once when I am
+    compiled.
+
+    :param info: the model class metadata
+    :type info: :class:`~mamba.application.model.ModelInfo`
+    :param fields: the fields to include
+    :type fields: tuple
+    :param exclude: the fields to exclude
+    :type exclude: tuple
+    :param json: if True the values are converted for JSON
+    :type json: bool
+    :param traverse: if True the references are serialized too
+    :type traverse: bool
+    """
+
+    __slots__ = ('columns', 'references', 'json')
+
+    converters = (
+        ((TimeVariable, DateVariable, DateTimeVariable, TimeDeltaVariable),
+         _to_string),
+        ((DecimalVariable,), _to_float)
+    )
+
+    def __init__(self, info, fields, exclude, json, traverse):
+        fields, fk_fields, exclude, fk_exclude = Model._generate_format_lists(
+            list(fields), list(exclude))
+
+        self.json = json
+        self.columns = []
+        for attribute, name, variable_class in zip(
+                info.attributes, info.names, info.variable_classes):
+            if fields and name not in fields:
+                continue
+            # exclude is ignored when fields are given unless we are json
+            if exclude and name in exclude and (json or not fields):
+                continue
+
+            converter = None
+            if json is True:
+                for classes, function in self.converters:
+                    if issubclass(variable_class, classes):
+                        converter = function
+                        break
+
+            self.columns.append((name, attribute, converter))
+
+        self.references = []
+        if traverse is True:
+            for attr in inspect.classify_class_attrs(info.cls):
+                if fields and attr.name not in fields:
+                    continue
+                if exclude and attr.name in exclude:
+                    continue
+
+                if type(attr.object) in (Reference, ReferenceSet):
+                    self.references.append((
+                        attr.name, type(attr.object) is ReferenceSet,
+                        fk_fields.get(attr.name, []),
+                        fk_exclude.get(attr.name, [])
+                    ))
+
+    def __call__(self, obj, parent=()):
+        """Return the given object as a dictionary
+        """
+
+        values = {}
+        for name, attribute, converter in self.columns:
+            value = getattr(obj, attribute)
+            if converter is not None:
+                value = converter(value)
+            values[name] = value
+
+        if self.references:
+            forbidden = set(id(p) for p in parent)
+            forbidden.add(id(obj))
+            prefetched = obj.__dict__.get('_mamba_prefetched', {})
+            for name, many, fields, exclude in self.references:
+                if name in prefetched:
+                    foreign_ref = prefetched[name]
+                else:
+                    foreign_ref = getattr(obj, name)
+                if many:
+                    values[name] = [
+                        item.dict(
+                            False, self.json, fields=fields, exclude=exclude)
+                        for item in foreign_ref if id(item) != id(obj)
+                    ]
+                elif id(foreign_ref) not in forbidden:
+                    values[name] = None if foreign_ref is None else (
+                        foreign_ref.dict(
+                            False, self.json, fields=fields, exclude=exclude)
+                    )
+
+        return values
+
+
+def _match_keys(columns, keys):
+    """Return the condition that matches any of the given key tuples
+    """
+
+    if len(columns) == 1:
+        return In(columns[0], [key[0] for key in keys])
+
+    return Or(*[compare_columns(columns, key) for key in keys])
+
+
+def _find_by_keys(store, find_spec, columns, keys, where, order_by):
+    """
+    Find the rows whose given columns match any of the given keys with
+    one IN query per chunk of keys (SQLite binds 999 parameters at most)
+    """
+
+    keys = list(keys)
+    size = max(500 // len(columns), 1)
+    for start in xrange(0, len(keys), size):
+        result = store.find(
+            find_spec, _match_keys(columns, keys[start:start + size]),
+            *where
+        )
+        if order_by is not None:
+            result.order_by(*order_by)
+        for row in result:
+            yield row
+
+
+def _prefetch(store, cls, objects, relations):
+    """
+    Load the given relations (names of Reference and ReferenceSet
+    attributes of the class) of all the given objects with a single IN
+    query per relation and attach them to the objects, so
+    :meth:`Model.dict` serializes them without any further query
+    """
+
+    for name in relations:
+        descriptor = getattr(cls, name, None)
+        if isinstance(descriptor, Reference):
+            relation = descriptor._relation
+            local_columns, remote_columns = (
+                relation._get_local_columns(cls), relation.remote_key)
+            order_by, many, join = None, False, None
+        elif isinstance(descriptor, ReferenceSet):
+            relation = descriptor._relation1
+            local_columns, remote_columns = (
+                relation._get_local_columns(cls), relation.remote_key)
+            order_by, many = descriptor._order_by, True
+            join = descriptor._relation2
+        else:
+            raise ModelError(
+                '{} is not a reference of {}'.format(name, cls.__name__))
+
+        owners = []
+        for obj in objects:
+            variables = get_obj_info(obj).variables
+            owners.append((obj, tuple(
+                variables[column].get() for column in local_columns)))
+
+        remotes = dict((key, []) for _, key in owners if None not in key)
+        if join is None:
+            find_spec, where = relation.remote_cls, ()
+        else:
+            # many to many, the keys come from the link table
+            find_spec = tuple(remote_columns) + (join.local_cls,)
+            where = (join.get_where_for_join(),)
+
+        for row in _find_by_keys(
+                store, find_spec, remote_columns, remotes, where, order_by):
+            if join is None:
+                variables = get_obj_info(row).variables
+                key = tuple(
+                    variables[column].get() for column in remote_columns)
+            else:
+                key, row = tuple(row[:-1]), row[-1]
+            remotes[key].append(row)
+
+        for obj, key in owners:
+            value = remotes.get(key, [])
+            if not many:
+                value = value[0] if value else None
+            obj.__dict__.setdefault('_mamba_prefetched', {})[name] = value
+            event = get_obj_info(obj).event
+            event.hook('changed', _forget_prefetched)
+            event.hook('flushed', _forget_prefetched)
+
+
+def _forget_prefetched(obj_info, *args):
+    """
+    Drop the prefetched references of an object once it is changed (or
+    reloaded after being invalidated) or flushed as they may be stale
+    """
+
+    obj = obj_info.get_obj()
+    if obj is not None:
+        obj.__dict__.pop('_mamba_prefetched', None)
+
+    return False
+
+
+def _encode_cursor(variables):
+    """Return the opaque cursor token for the given key variables
+    """
+
+    values = []
+    for variable in variables:
+        value = variable.get(to_db=True)
+        if isinstance(value, str):
+            # raw bytes (maybe not UTF-8) must come back as bytes
+            value = {'b': base64.b64encode(value)}
+        elif not isinstance(value, (unicode, int, long, float, bool)):
+            # datetimes, decimals... their string is parsed back from db
+            value = None if value is None else unicode(value)
+        values.append(value)
+
+    return base64.urlsafe_b64encode(json.dumps(values))
+
+
+def _decode_cursor(cursor, columns):
+    """Return the key variables for the given columns encoded in a cursor
+    """
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+        if type(values) is not list or len(values) != len(columns):
+            raise ValueError('cursor does not match the pagination key')
+
+        return [
+            column.variable_factory(value=_cursor_value(value), from_db=True)
+            for column, value in zip(columns, values)
+        ]
+    except (TypeError, ValueError) as error:
+        raise InvalidCursor('Invalid cursor {!r}: {}'.format(cursor, error))
+
+
+def _cursor_value(value):
+    """Return the database value of a decoded cursor value
+    """
+
+    if type(value) is dict:
+        if value.keys() != ['b']:
+            raise ValueError('unknown cursor value {!r}'.format(value))
+        return base64.b64decode(value['b'])
+
+    return value
+
+
+def _seek(columns, variables, desc):
+    """
+    Return the seek condition for the rows that follow the given key in
+    the given order, it is the expanded form of ``(k1, k2) > (v1, v2)``
+    (row values are not supported by old SQLite versions) led by
+    ``k1 >= v1`` so the index range scan starts on the cursor
+    """
+
+    after, since = (Lt, Le) if desc else (Gt, Ge)
+    alternatives = []
+    for index, (column, variable) in enumerate(zip(columns, variables)):
+        equals = [
+            Eq(previous, value)
+            for previous, value in zip(columns[:index], variables[:index])
+        ]
+        alternatives.append(And(*(equals + [after(column, variable)])))
+
+    if len(columns) == 1:
+        return alternatives[0]
+
+    return And(since(columns[0], variables[0]), Or(*alternatives))
+
+
+def _bulk_insert(store, backend, cls, columns, defined, rows, generated):
+    """
+    Insert the given rows (lists with the variables of every column) with
+    a single multi row INSERT statement, only the `defined` columns are
+    inserted. If `generated` is the index of a primary key column that is
+    generated by the database, the generated keys are set in the rows
+    (MySQL inserts the rows one by one then).
+    """
+
+    selected = [index for index, is_defined in enumerate(defined)
+                if is_defined]
+    if not selected:
+        raise ModelError(
+            'There is nothing to insert for {} objects, none of their '
+            'columns have a value'.format(cls.__name__)
+        )
+
+    statement = store._connection.compile(Insert(
+        OrderedDict((columns[index], rows[0][index]) for index in selected),
+        table=cls), State()
+    )
+    prefix = statement.rpartition(' VALUES ')[0]
+    group = '({})'.format(', '.join('?' * len(selected)))
+    statement = '{} VALUES {}'.format(prefix, ', '.join([group] * len(rows)))
+    params = [row[index] for row in rows for index in selected]
+
+    if generated is None:
+        store.execute(statement, params, noresult=True)
+        return
+
+    if backend == 'postgres':
+        result = store.execute('{} RETURNING "{}"'.format(
+            statement, columns[generated].name), params)
+        keys = [key for key, in result]
+    elif backend == 'sqlite':
+        # SQLite returns the last id of the statement, the ids of a single
+        # multi row INSERT are consecutive as the database is locked by
+        # the writing transaction and new ids are the greatest one plus one
+        lastrowid = store.execute(statement, params)._raw_cursor.lastrowid
+        keys = range(lastrowid - len(rows) + 1, lastrowid + 1)
+    else:
+        # the ids of a MySQL multi row INSERT are not consecutive when
+        # auto_increment_increment is not 1 (multi master replication) or
+        # with interleaved auto increment locks, so the rows are inserted
+        # one by one to read the id of every row
+        statement = '{} VALUES {}'.format(prefix, group)
+        keys = [
+            store.execute(
+                statement, [row[index] for index in selected]
+            )._raw_cursor.lastrowid
+            for row in rows
+        ]
+
+    for row, key in zip(rows, keys):
+        row[generated].set(key, from_db=True)
+
+
+def _server_side_batches(store, result, batch_size):
+    """
+    Yield the objects of the given result set in lists of up to
+    `batch_size` objects read from a server side cursor, so the result set
+    is never held in memory by the driver: PostgreSQL uses a ``DECLARE
+    CURSOR`` (closed at the end of the transaction), MySQL an unbuffered
+    ``SSCursor`` and SQLite steps its regular cursor
+    """
+
+    connection = store._connection
+    select = result._get_select()
+    backend = get_backend(store)
+    if backend == 'postgres':
+        state = State()
+        statement = connection.compile(select, state)
+        name = 'mamba_iterate_{}'.format(id(result))
+        store.execute(
+            'DECLARE {} NO SCROLL CURSOR FOR {}'.format(name, statement),
+            state.parameters, noresult=True
+        )
+        while True:
+            rows = store.execute(
+                'FETCH FORWARD {} FROM {}'.format(batch_size, name))
+            batch = [result._load_objects(rows, values) for values in rows]
+            if not batch:
+                break
+            yield batch
+        return
+
+    if backend == 'mysql':
+        from MySQLdb.cursors import SSCursor
+        connection.build_raw_cursor = (
+            lambda: connection._raw_connection.cursor(SSCursor))
+    try:
+        rows = store.execute(select)
+    finally:
+        connection.__dict__.pop('build_raw_cursor', None)
+
+    rows._raw_cursor.arraysize = batch_size
+    values = iter(rows)
+    try:
+        while True:
+            batch = [
+                result._load_objects(rows, row)
+                for row in itertools.islice(values, batch_size)
+            ]
+            if not batch:
+                break
+            yield batch
+    finally:
+        # unbuffered cursors must be closed before the next statement
+        rows.close()
+
+
+def _invalidate_where(store, cls, where):
+    """
+    Invalidate the objects of the given class in the store cache that
+    match the given condition (all of them if the condition can not be
+    evaluated in Python) so they are reloaded on their next access
+    """
+
+    try:
+        cached = store.find(cls, where).cached()
+    except CompileError:
+        cached = [
+            obj_info.get_obj() for obj_info in store._iter_alive()
+            if obj_info.cls_info.cls is cls
+        ]
+
+    for obj in cached:
+        if obj is not None:
+            store.invalidate(obj)
+
+
+class ModelCache(object):
+    """
+    I am the opt-in read-through cache of a model, I hold detached
+    snapshots (copies that are not bound to any store) of the objects
+    read with :meth:`Model.read` and :meth:`Model.read_many` keyed by
+    their primary key. Models enable me with the `__mamba_cache__` class
+    attribute::
+
+        class Country(Model):
+            __mamba_cache__ = {'ttl': 60, 'max_entries': 10000}
+
+    Snapshots are never returned directly, every hit returns a new copy.
+    :meth:`Model.create`, :meth:`Model.update` and :meth:`Model.delete`
+    invalidate the snapshot of the object that they change and the set
+    based methods clear the whole cache. Changes done by other processes
+    are only seen once the snapshots expire.
+
+    .. note::
+
+        I am not thread safe, I am meant to be used from the reactor
+        thread like :class:`~mamba.utils.lru.LRUCache`
+
+    :param ttl: seconds that the snapshots live
+    :type ttl: float
+    :param max_entries: maximum number of snapshots
+    :type max_entries: int
+    """
+
+    def __init__(self, ttl=60, max_entries=10000, clock=time.time):
+        self.snapshots = LRUCache(max_entries, ttl, clock)
+        # bumped on every invalidation, reads that started before an
+        # invalidation don't store what they read (it can be stale)
+        self.generation = 0
+
+    def get(self, key):
+        """Return the snapshot for the given primary key tuple or None
+        """
+
+        return self.snapshots.get(key)
+
+    def set(self, key, snapshot, generation):
+        """
+        Store the given snapshot if nothing was invalidated since the given
+        generation (the one that was current when the read started)
+        """
+
+        if generation == self.generation:
+            self.snapshots.set(key, snapshot)
+
+    def invalidate(self, obj):
+        """Forget the snapshot of the given object
+        """
+
+        self.generation += 1
+        obj_info = get_obj_info(obj)
+        for variables in (obj_info.primary_vars, obj_info.get('primary_vars')):
+            if variables is not None:
+                self.snapshots.invalidate(
+                    tuple(variable.get() for variable in variables))
+
+    def clear(self):
+        """Forget all the snapshots
+        """
+
+        self.generation += 1
+        self.snapshots.clear()
+
+    def stats(self):
+        """Return back the snapshots cache stats
+        """
+
+        return self.snapshots.stats()
+
+    def __repr__(self):
+        return 'ModelCache({!r})'.format(self.snapshots)
+
+
+def invalidates_cache(method):
+    """
+    Decorator for model methods that write to the database, it invalidates
+    the :class:`~mamba.application.model.ModelCache` of the model (if any)
+    before the method runs and once it is done: the snapshot of the object
+    for instance methods or the whole cache for class methods
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cls = self if isinstance(self, type) else self.__class__
+        cache = get_model_info(cls).cache
+        if cache is None:
+            return method(self, *args, **kwargs)
+
+        if cls is self:
+            invalidate = cache.clear
+        else:
+            invalidate = functools.partial(cache.invalidate, self)
+
+        invalidate()
+        result = method(self, *args, **kwargs)
+        if isinstance(result, defer.Deferred):
+            def invalidated(result):
+                invalidate()
+                return result
+
+            return result.addBoth(invalidated)
+
+        invalidate()
+        return result
+
+    return wrapper
+
+
+def get_model_info(cls):
+    """
+    Return the :class:`~mamba.application.model.ModelInfo` of the given
+    model class building it the first time
+    """
+
+    info = cls.__dict__.get('_mamba_model_info')
+    if info is None:
+        info = ModelInfo(cls)
+        cls._mamba_model_info = info
+        # maintain full interface compatibility with Storm
+        cls._storm_columns = info.columns
+
+    return info
+
+
 class ModelProvider:
     """Mount point for plugins which refer to Models for our applications
     """
@@ -121,25 +1182,17 @@ class Model(ModelProvider):
         """
         This method is remembering the fields in the order that
         they were declared in the model. This is used to maintain
-        declared order in the generated SQL schema. It uses some
-        inspection to determine what fields should put on the ordered
-        list. It, then, replaces cls._storm_columns with the ordered
-        one, in order to maintain full interface compatibility.
-        """
+        declared order in the generated SQL schema. It, then, replaces
+        cls._storm_columns with the ordered one, in order to maintain
+        full interface compatibility.
 
-        columns = inspect.getmembers(
-            cls, lambda o: isinstance(o, PropertyColumn)
-        )
-        creation_order = sorted(columns, key=lambda i: i[1]._creation_order)
-        ordered_columns = OrderedDict()
+        The inspection is done only the first time that a given model
+        class is instantiated, see :class:`ModelInfo`
+        """
 
-        for _, ordered_property in creation_order:
-            for column, property_ in cls._storm_columns.iteritems():
-                if ordered_property is property_:
-                    ordered_columns[column] = property_
-                    break
+        if '_mamba_model_info' not in cls.__dict__:
+            get_model_info(cls)
 
-        cls._storm_columns = ordered_columns
         return ModelProvider.__new__(cls, *args, **kwargs)
 
     def __storm_pre_flush__(self):
@@ -195,6 +1248,14 @@ class Model(ModelProvider):
     def dict(self, traverse=True, json=False, *parent, **kwargs):
         """Returns the object as a dictionary
 
+        The conversion is compiled the first time that a given combination
+        of options is used for a model class and reused for every later
+        object (see :class:`~mamba.application.model.ModelSerializer`).
+
+        The object is already loaded so `fields` and `exclude` filter its
+        loaded columns, they are not pushed down to the database. Use
+        :meth:`select` with the same fields to read only those columns
+
         :param traverse: if True traverse over references
         :type traverse: bool
         :param json: if True we convert datetime to string and Decimal to float
@@ -206,75 +1267,12 @@ class Model(ModelProvider):
         mutually exclusive with fields, not working if you also set fields.
         :type exclude: list
         """
-        parent = list(parent)
-        parent.append(self)
-        values = self._storm_columns.values()
 
-        fields, fk_fields, exclude, fk_exclude = self._generate_format_lists(
-            kwargs.get('fields', []),
-            kwargs.get('exclude', []),
+        serializer = get_model_info(self.__class__).serializer(
+            kwargs.get('fields'), kwargs.get('exclude'), json is True,
+            traverse is True
         )
-
-        if json is True:
-            obj = {}
-            ins = (
-                TimeVariable, DateVariable, DateTimeVariable, TimeDeltaVariable
-            )
-            for p in values:
-                if fields and p.name not in fields:
-                    continue
-                elif exclude and p.name in exclude:
-                    continue
-                val = getattr(self, p.name)
-                if isinstance(p.variable_factory(), ins) and val is not None:
-                    obj[p.name] = str(val)
-                elif isinstance(p.variable_factory(), DecimalVariable) and val:
-                    obj[p.name] = float(val)
-                else:
-                    obj[p.name] = getattr(self, p.name)
-        else:
-            if not fields and not exclude:
-                obj = dict([(p.name, getattr(self, p.name)) for p in values])
-            elif fields:
-                obj = dict([(p.name, getattr(self, p.name))
-                            for p in values if p.name in fields])
-            elif exclude:
-                obj = dict([(p.name, getattr(self, p.name))
-                            for p in values if p.name not in exclude])
-
-        if traverse is True:
-
-            forbidden = [id(p) for p in parent]
-            for attr in inspect.classify_class_attrs(self.__class__):
-                if fields and attr.name not in fields:
-                    continue
-                if exclude and attr.name in exclude:
-                    continue
-
-                ref_fk_fields = fk_fields.get(attr.name, [])
-                ref_fk_exclude = fk_exclude.get(attr.name, [])
-
-                if type(attr.object) is Reference:
-                    foreign_ref = getattr(self, attr.name)
-                    if id(foreign_ref) not in forbidden:
-                        obj[attr.name] = foreign_ref.dict(
-                            json=json,
-                            *parent,
-                            fields=ref_fk_fields,
-                            exclude=ref_fk_exclude
-                        )
-                elif type(attr.object) is ReferenceSet:
-                    foreign_ref = getattr(self, attr.name)
-                    if id(foreign_ref) not in forbidden:
-                        obj[attr.name] = [
-                            item.dict(
-                                json=json,
-                                *parent,
-                                fields=ref_fk_fields,
-                                exclude=ref_fk_exclude)
-                            for item in foreign_ref if id(self) != id(item)
-                        ]
-        return obj
+        return serializer(self, parent)
 
     def store(self, database=None):
         """Return a valid Storm store for this model
@@ -289,12 +1287,14 @@ class Model(ModelProvider):
         """Copy this object properties and return it
         """
 
-        for column in self._storm_columns.keys():
-            name = column._detect_attr_name(self.__class__)
+        for name in get_model_info(self.__class__).attributes:
             setattr(self, name, getattr(orig, name))
 
+        # the copied values are the loaded ones, changes are tracked from here
+        get_obj_info(self).checkpoint()
         return self
 
+    @invalidates_cache
     @transact
     def create(self):
         """Create a new register in the database
@@ -305,12 +1305,108 @@ class Model(ModelProvider):
         store.commit()
 
     @classmethod
+    @invalidates_cache
     @transact
-    def read(klass, id, copy=False):
+    def create_many(klass, objects, batch_size=500, return_keys=False):
+        """
+        Create many registers in the database in a single transaction and
+        commit, the objects are inserted in batches of `batch_size` rows
+        with a multi row ``INSERT ... VALUES`` statement per batch (SQLite
+        batches are smaller if needed to respect its limit of 999 bound
+        parameters per statement)::
+
+            Customer.create_many(
+                (Customer(name=name) for name in names), batch_size=1000)
+
+        The objects are not added to the store, they are just inserted, so
+        Storm does not know about them after the insert. If `return_keys`
+        is True I return back the list of primary keys of the objects (in
+        the same order) and set the ones generated by the database in the
+        objects, they are fetched with ``RETURNING`` in PostgreSQL and
+        derived from the last insert id in SQLite, MySQL inserts the rows
+        one by one in that case as the ids of a multi row INSERT are not
+        consecutive with ``auto_increment_increment`` greater than one or
+        interleaved auto increment locks. Otherwise I return back the
+        number of inserted rows.
+
+        :param objects: the objects to create
+        :type objects: iterable
+        :param batch_size: the maximum number of rows per INSERT statement
+        :type batch_size: int
+        :param return_keys: if True return back the primary keys
+        :type return_keys: bool
+
+        .. versionadded:: 0.3.6
+        """
+
+        store = klass.database.store(klass.mamba_database())
+        backend = get_backend(store)
+        columns = get_model_info(klass).columns.values()
+        # columns overload ==, so they are looked up by identity
+        positions = dict(
+            (id(column), index) for index, column in enumerate(columns))
+        primary = [
+            positions[id(column)]
+            for column in get_cls_info(klass).primary_key
+        ]
+        if backend == 'sqlite':
+            batch_size = min(batch_size, max(999 // len(columns), 1))
+
+        count, created = 0, []
+        rows, defined, generated = [], None, None
+        for obj in objects:
+            obj.__storm_pre_flush__()
+            variables = get_obj_info(obj).variables
+            row = [variables[column] for column in columns]
+            signature = tuple(variable.is_defined() for variable in row)
+            if rows and (signature != defined or len(rows) >= batch_size):
+                _bulk_insert(
+                    store, backend, klass, columns, defined, rows, generated)
+                rows = []
+
+            if signature != defined:
+                defined, generated = signature, None
+                missing = [index for index in primary if not defined[index]]
+                if return_keys and missing:
+                    if len(primary) > 1:
+                        raise InvalidModelSchema(
+                            'Generated keys are supported for single column '
+                            'primary keys only, {} has a compound primary '
+                            'key'.format(klass.__name__)
+                        )
+                    generated = missing[0]
+
+            rows.append(row)
+            count += 1
+            if return_keys:
+                created.append(row)
+
+        if rows:
+            _bulk_insert(
+                store, backend, klass, columns, defined, rows, generated)
+
+        store.commit()
+        if not return_keys:
+            return count
+
+        if len(primary) == 1:
+            return [row[primary[0]].get() for row in created]
+
+        return [
+            tuple(row[index].get() for index in primary) for row in created
+        ]
+
+    @classmethod
+    def read(klass, id, copy=False, **kwargs):
         """
         Read a register from the database. The give key (usually ID) should
         be a primary key.
 
+        If the model defines `__mamba_cache__` the object is looked up in
+        its :class:`~mamba.application.model.ModelCache` first, hits are
+        returned without going to the database pool and cached models
+        always return detached copies (as if `copy` was True).
+
         .. warning:
 
         :param id: the ID to get from the database
@@ -318,15 +1414,140 @@ class Model(ModelProvider):
         """
 
         try:
-            obj = klass()
+            klass._instance()
+        except TypeError:
+            if kwargs.get('async', getattr(klass, '__mamba_async__', True)):
+                return defer.fail()
+            raise
+
+        cache = get_model_info(klass).cache
+        if cache is None:
+            return klass._read(id, copy, **kwargs)
+
+        key = id if type(id) is tuple else (id,)
+        snapshot = cache.get(key)
+        if snapshot is not None:
+            return klass._cached(klass().copy(snapshot), kwargs)
+
+        generation = cache.generation
+
+        def remember(data):
+            if data is None:
+                return None
+
+            cache.set(key, data, generation)
+            return klass().copy(data)
+
+        return klass._then(klass._read(id, True, **kwargs), remember)
+
+    @classmethod
+    def read_many(klass, ids, **kwargs):
+        """
+        Read many registers from the database with a single query, returns
+        back a list with the detached objects (or None for the ones that
+        do not exist) in the same order than the given IDs. The objects in
+        the model :class:`~mamba.application.model.ModelCache` (if any)
+        are not read from the database at all
+
+        :param ids: the primary keys (tuples for compound keys) to read
+        :type ids: iterable
+
+        .. versionadded:: 0.3.6
+        """
+
+        cache = get_model_info(klass).cache
+        keys = [id if type(id) is tuple else (id,) for id in ids]
+        found = {}
+        if cache is not None:
+            for key in keys:
+                snapshot = cache.get(key)
+                if snapshot is not None:
+                    found[key] = snapshot
+
+        missing = [key for key in set(keys) if key not in found]
+        generation = cache.generation if cache is not None else None
+
+        def collect(loaded):
+            for key, data in loaded:
+                found[key] = data
+                if cache is not None:
+                    cache.set(key, data, generation)
+
+            if cache is None:
+                return [found.get(key) for key in keys]
+
+            return [
+                klass().copy(found[key]) if key in found else None
+                for key in keys
+            ]
+
+        if not missing:
+            return klass._cached(collect([]), kwargs)
+
+        return klass._then(klass._read_many(missing, **kwargs), collect)
+
+    @classmethod
+    def _cached(klass, result, kwargs):
+        """Return the given result as the transactor would do
+        """
+
+        if kwargs.get('async', getattr(klass, '__mamba_async__', True)):
+            return defer.succeed(result)
+
+        return result
+
+    @staticmethod
+    def _then(result, callback):
+        """Call the given callback with the (maybe deferred) result
+        """
+
+        if isinstance(result, defer.Deferred):
+            return result.addCallback(callback)
+
+        return callback(result)
+
+    @classmethod
+    @transact
+    def _read_many(klass, keys):
+        """Read the given primary keys and return detached copies
+        """
+
+        store = klass.database.store(klass.mamba_database())
+        primary_key = get_cls_info(klass).primary_key
+        loaded = []
+        for data in _find_by_keys(store, klass, primary_key, keys, (), None):
+            variables = get_obj_info(data).variables
+            loaded.append((
+                tuple(variables[column].get() for column in primary_key),
+                klass().copy(data)
+            ))
+
+        return loaded
+
+    @classmethod
+    def _instance(klass):
+        """
+        Return a new instance of the model, raises TypeError (and logs it)
+        if the constructor can not be called without arguments
+        """
+
+        try:
+            return klass()
         except TypeError:
             log.err(
                 'Mamba cannot instantiate an object for class {}, please '
                 'define default parameters on it\'s constructor'.format(
-                    klass.__name__, klass.__name__)
+                    klass.__name__)
             )
             raise
 
+    @classmethod
+    @transact
+    def _read(klass, id, copy=False):
+        """Read a register from the database, see :meth:`read`
+        """
+
+        obj = klass._instance()
         store = obj.database.store(klass.mamba_database())
         data = store.get(klass, id)
 
@@ -337,9 +1558,14 @@ class Model(ModelProvider):
 
         return data
 
+    @invalidates_cache
     @transact
     def update(self):
-        """Update a register in the database
+        """
+        Update a register in the database, only the columns that changed
+        since the object was loaded (or copied by :meth:`read`) are written
+        with a single ``UPDATE`` keyed by the primary key, nothing is done
+        if none of them changed
         """
 
         store = self.database.store(self.mamba_database())
@@ -351,30 +1577,117 @@ class Model(ModelProvider):
                 )
             )
 
-        if type(primary_key) is tuple:
-            args = []
-            for key in primary_key:
-                args.append(getattr(self.__class__, key) == getattr(self, key))
-            copy = store.find(self.__class__, *args).one()
-        else:
-            value = getattr(self, primary_key)
-            copy = store.find(
-                self.__class__,
-                getattr(self.__class__, primary_key) == value
-            ).one()
-
-        for column in self._storm_columns.values():
-            setattr(copy, column.name, getattr(self, column.name))
-
+        obj_info = get_obj_info(self)
+        if obj_info.get('store') is store:
+            # Storm tracks this object already, it writes the dirty columns
+            store.flush()
+            store.commit()
+            return
+
+        changes = dict(
+            (column, variable)
+            for column, variable in obj_info.variables.iteritems()
+            if variable.has_changed()
+        )
+        primary_columns = obj_info.cls_info.primary_key
+        # objects loaded in other threads remember their original key
+        primary_vars = obj_info.get('primary_vars')
+        if primary_vars is None:
+            primary_vars = obj_info.primary_vars
+            for column in primary_columns:
+                changes.pop(column, None)
+
+        if not changes:
+            return
+
+        where = compare_columns(primary_columns, primary_vars)
+        store.execute(Update(changes, where, self.__class__), noresult=True)
+        obj_info.checkpoint()
+        _invalidate_where(store, self.__class__, where)
         store.commit()
 
+    @invalidates_cache
     @transact
     def delete(self):
         """Delete a register from the database
         """
 
         store = self.database.store(self.mamba_database())
-        store.remove(self)
+        if Store.of(self) is store:
+            store.remove(self)
+            return
+
+        # detached copies (like the cached ones) are deleted by primary key
+        obj_info = get_obj_info(self)
+        where = compare_columns(
+            obj_info.cls_info.primary_key,
+            obj_info.get('primary_vars', obj_info.primary_vars)
+        )
+        store.execute(Delete(where, self.__class__), noresult=True)
+        _invalidate_where(store, self.__class__, where)
+
+    @classmethod
+    @invalidates_cache
+    @transact
+    def update_where(klass, condition, **values):
+        """
+        Update the registers that match the given condition with the given
+        values using a single ``UPDATE ... WHERE`` statement, the objects
+        are not loaded from the database::
+
+            Order.update_where(Order.status == u'pending', status=u'expired')
+
+        The matching objects in the store cache are invalidated so they
+        are reloaded on their next access. Returns back the number of
+        updated rows
+
+        :param condition: the Storm expression that rows must match
+        :type condition: :class:`storm.expr.Expr`
+        :param values: the new values (or expressions) keyed by attribute
+
+        .. versionadded:: 0.3.6
+        """
+
+        changes = {}
+        for name, value in values.iteritems():
+            column = getattr(klass, name)
+            if value is not None and not isinstance(value, Expr):
+                value = column.variable_factory(value=value)
+            changes[column] = value
+
+        if not changes:
+            return 0
+
+        store = klass.database.store(klass.mamba_database())
+        result = store.execute(Update(changes, condition, klass))
+        _invalidate_where(store, klass, condition)
+        return result.rowcount
+
+    @classmethod
+    @invalidates_cache
+    @transact
+    def delete_where(klass, condition):
+        """
+        Delete the registers that match the given condition using a single
+        ``DELETE ... WHERE`` statement, the objects are not loaded from the
+        database::
+
+            Session.delete_where(Session.expires < datetime.now())
+
+        The matching objects in the store cache are invalidated (so using
+        them raises :class:`storm.exceptions.LostObjectError`). Returns
+        back the number of deleted rows
+
+        :param condition: the Storm expression that rows must match
+        :type condition: :class:`storm.expr.Expr`
+
+        .. versionadded:: 0.3.6
+        """
+
+        store = klass.database.store(klass.mamba_database())
+        result = store.execute(Delete(condition, klass))
+        _invalidate_where(store, klass, condition)
+        return result.rowcount
 
     @classmethod
     def find(klass, *args, **kwargs):
@@ -386,6 +1699,15 @@ class Model(ModelProvider):
             model.find(name=u"John")
             model.find((Customer, City), Customer.city_id == City.id)
 
+        The references given in the `prefetch` keyword argument are loaded
+        for the whole result with one query per reference, a list of
+        objects is returned back in that case instead of a result set::
+
+            model.find(Order.status == u'paid', prefetch=('customer',))
+
+        The `deadline` keyword argument binds the query to the given
+        request deadline (``deadline=request.deadline``)
+
         .. versionadded:: 0.3.6
         """
 
@@ -393,9 +1715,25 @@ class Model(ModelProvider):
         if len(args) > 0 and (type(args[0]) == tuple or type(args[0]) == list):
             obj = args[0]
 
-        return Transactor(klass.database.pool).run(
-            klass.database.store(
-                klass.mamba_database()).find, obj, *args, **kwargs
+        prefetch = kwargs.pop('prefetch', None)
+        if prefetch and obj is not klass:
+            raise ModelError(
+                'prefetch is supported finding {} objects only'.format(
+                    klass.__name__)
+            )
+
+        def inner_transaction(*args, **kwargs):
+            store = klass.database.store(klass.mamba_database())
+            data = store.find(obj, *args, **kwargs)
+            if prefetch:
+                data = list(data)
+                _prefetch(store, klass, data, prefetch)
+
+            return data
+
+        return Transactor(klass.database.pool).run(bind_deadline(
+            inner_transaction, klass, kwargs.pop('deadline', None)),
+            *args, **kwargs
         )
 
     @classmethod
@@ -406,20 +1744,204 @@ class Model(ModelProvider):
         :type order_by: model property
         :param desc: if True, order the resultset by descending order
         :type desc: bool
+        :param prefetch: names of the references to load for all the rows,
+            a list of objects is returned back instead of a result set
+        :type prefetch: tuple
 
         .. versionadded:: 0.3.6
         """
 
+        prefetch = kwargs.pop('prefetch', None)
+
         def inner_transaction():
             store = klass.database.store(klass.mamba_database())
             data = store.find(klass)
             if order_by is not None:
                 data.order_by(Desc(order_by) if desc else order_by)
+            if prefetch:
+                data = list(data)
+                _prefetch(store, klass, data, prefetch)
 
             return data
 
-        return Transactor(
-            klass.database.pool).run(inner_transaction, *args, **kwargs)
+        return Transactor(klass.database.pool).run(bind_deadline(
+            inner_transaction, klass, kwargs.pop('deadline', None)),
+            *args, **kwargs)
+
+    @classmethod
+    def paginate(klass, order_by=None, after=None, limit=20, desc=False,
+                 where=None, **kwargs):
+        """
+        Return back a :class:`~mamba.application.model.Page` with up to
+        `limit` objects ordered by the given key that come after the given
+        cursor, using keyset pagination: the rows are sought with an
+        indexable condition on the key instead of skipping them with an
+        OFFSET, so every page costs the same no matter how deep it is::
+
+            page = yield Article.paginate(Article.published, limit=50)
+            next_page = yield Article.paginate(
+                Article.published, after=page.cursor, limit=50)
+
+        The primary key is appended to the order key (if it is not there
+        already) so it is unique, the key columns should not be NULL. The
+        objects are detached copies (they are not bound to any store)
+
+        :param order_by: the column (or tuple of columns) to order by, the
+            primary key if None
+        :param after: the cursor returned by the previous page
+        :type after: str
+        :param limit: the maximum number of objects in the page
+        :type limit: int
+        :param desc: if True, order by descending order
+        :type desc: bool
+        :param where: an additional condition for the objects
+        :type where: :class:`storm.expr.Expr`
+
+        .. versionadded:: 0.3.6
+        """
+
+        if order_by is None:
+            columns = []
+        elif type(order_by) in (tuple, list):
+            columns = list(order_by)
+        else:
+            columns = [order_by]
+
+        for column in get_cls_info(klass).primary_key:
+            if not any(column is key for key in columns):
+                columns.append(column)
+
+        cursor = None if after is None else _decode_cursor(after, columns)
+        limit = max(int(limit), 1)
+
+        def inner_transaction():
+            store = klass.database.store(klass.mamba_database())
+            conditions = [] if where is None else [where]
+            if cursor is not None:
+                conditions.append(_seek(columns, cursor, desc))
+
+            result = store.find(klass, *conditions)
+            result.order_by(
+                *[Desc(column) if desc else column for column in columns])
+            rows = list(result[:limit + 1])
+
+            next_cursor = None
+            if len(rows) > limit:
+                del rows[limit:]
+                variables = get_obj_info(rows[-1]).variables
+                next_cursor = _encode_cursor(
+                    [variables[column] for column in columns])
+
+            return Page([klass().copy(row) for row in rows], next_cursor)
+
+        return Transactor(klass.database.pool).run(bind_deadline(
+            inner_transaction, klass, kwargs.pop('deadline', None)), **kwargs)
+
+    @classmethod
+    def iterate(klass, condition=None, batch_size=1000, order_by=None,
+                idle_timeout=60, **kwargs):
+        """
+        Return back a :class:`~mamba.application.model.BatchIterator` that
+        reads the objects that match the given condition in batches of
+        `batch_size` objects from a server side cursor, so reporting jobs
+        can go through tables of any size with bounded memory::
+
+            @defer.inlineCallbacks
+            def report(self):
+                batches = Order.iterate(Order.paid == True, batch_size=500)
+                total = yield batches.each(self.write_orders)
+
+        A thread of the database pool is used until the last batch is
+        read (or the iterator is closed). If the next batch is not asked
+        for in `idle_timeout` seconds the transaction is rolled back and
+        the thread released. The objects are detached copies (they are
+        not bound to any store)
+
+        :param condition: the condition of the objects (all if None)
+        :type condition: :class:`storm.expr.Expr`
+        :param batch_size: the number of objects per batch
+        :type batch_size: int
+        :param order_by: the column (or tuple of columns) to order by
+        :param idle_timeout: the seconds to wait for the next batch to be
+            asked for before the iteration is aborted (forever if None)
+        :type idle_timeout: int
+        """
+
+        batch_size = max(int(batch_size), 1)
+
+        def inner_transaction(hand_over):
+            store = klass.database.store(klass.mamba_database())
+            result = store.find(
+                klass, *([] if condition is None else [condition]))
+            if order_by is not None:
+                result.order_by(*(
+                    order_by if type(order_by) in (tuple, list)
+                    else [order_by]
+                ))
+
+            batches = _server_side_batches(store, result, batch_size)
+            try:
+                for batch in batches:
+                    if not hand_over([klass().copy(obj) for obj in batch]):
+                        break
+            finally:
+                batches.close()
+
+        return BatchIterator(bind_deadline(
+            inner_transaction, klass, kwargs.pop('deadline', None)),
+            klass.database.pool, idle_timeout, **kwargs)
+
+    @classmethod
+    def select(klass, fields=None, where=None, order_by=None, desc=False,
+               limit=None, exclude=None, **kwargs):
+        """
+        Return back a list of lightweight
+        :class:`~mamba.application.model.Row` objects with the values of
+        the given fields only, they are read with a projected ``SELECT``
+        and no Storm object is built at all. The fields are chosen as
+        :meth:`dict` chooses them so the list of fields that an endpoint
+        returns can be pushed down to the database::
+
+            @defer.inlineCallbacks
+            def customers(self):
+                rows = yield Customer.select(
+                    fields=('id', 'name'), where=Customer.active == True)
+                defer.returnValue([row.dict() for row in rows])
+
+        :param fields: the fields to select (all if None)
+        :type fields: list
+        :param where: the condition of the rows
+        :type where: :class:`storm.expr.Expr`
+        :param order_by: the column (or tuple of columns) to order by
+        :param desc: if True, order by descending order
+        :type desc: bool
+        :param limit: the maximum number of rows
+        :type limit: int
+        :param exclude: the fields to exclude, ignored if fields are given
+        :type exclude: list
+        """
+
+        row_type = get_model_info(klass).row_type(fields, exclude)
+
+        def inner_transaction():
+            store = klass.database.store(klass.mamba_database())
+            result = store.find(
+                row_type._columns, *([] if where is None else [where]))
+            if order_by is not None:
+                columns = (
+                    order_by if type(order_by) in (tuple, list)
+                    else [order_by]
+                )
+                result.order_by(*[
+                    Desc(column) if desc else column for column in columns
+                ])
+            if limit is not None:
+                result = result[:limit]
+
+            return [row_type(*values) for values in result]
+
+        return Transactor(klass.database.pool).run(bind_deadline(
+            inner_transaction, klass, kwargs.pop('deadline', None)), **kwargs)
 
     @transact
     def create_table(self):
@@ -521,14 +2043,13 @@ class Model(ModelProvider):
         """Return back the model primary key (or keys if it's compound)
         """
 
-        if not hasattr(self, '__storm_primary__'):
-            for column in self._storm_columns.values():
-                if column.primary == 1:
-                    return column.name
-        else:
+        if hasattr(self, '__storm_primary__'):
             return self.__storm_primary__
 
-    def _generate_format_lists(self, fields, exclude):
+        return get_model_info(self.__class__).primary_key
+
+    @staticmethod
+    def _generate_format_lists(fields, exclude):
         if not fields and not exclude:
             return [], {}, [], {}
 
@@ -561,12 +2082,10 @@ class Model(ModelProvider):
         If a property does not allow none and there is no default value for
         it, Storm itself will raise a NoneError when we set it to None.
         """
-        for column, property_ in self._storm_columns.items():
-            variable = property_.variable_factory()
-            has_default = not variable._value is Undef
-            value = getattr(self, column._detect_attr_name(self.__class__))
-            if not variable._allow_none and not has_default and value is None:
-                variable.set(None)
+        for attribute, column in get_model_info(self.__class__).not_none:
+            if getattr(self, attribute) is None:
+                # raises NoneError
+                column.variable_factory().set(None)
 
 
 class ModelManager(module.ModuleManager):
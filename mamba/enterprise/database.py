@@ -44,12 +44,14 @@ if '__pypy__' in sys.modules:
 from storm.database import URI
 from storm.zope.interfaces import IZStorm
 from storm.zope.zstorm import global_zstorm
+from twisted.internet import defer
 from twisted.python.threadpool import ThreadPool
 from zope.component import provideUtility, getUtility
 from storm.twisted.transact import Transactor, DisconnectionError
 
 from mamba import version
-from mamba.utils import config
+from mamba.utils import config, deadline
+from mamba.utils.deadline import DeadlineExceeded
 from mamba.enterprise.mysql import MySQL
 from mamba.enterprise.sqlite import SQLite
 from mamba.enterprise.common import CommonSQL
@@ -410,8 +412,129 @@ class AdapterFactory(object):
         return self.adapter_mapping.get(self.scheme, CommonSQL)(self.model)
 
 
+def get_backend(store):
+    """
+    Return the name of the backend of the given store: 'sqlite', 'mysql'
+    or 'postgres'
+
+    :param store: the Storm store
+    :type store: :class:`storm.store.Store`
+    """
+
+    return type(store.get_database()).__module__.rsplit('.', 1)[-1]
+
+
+def statement_timeout(store, request_deadline):
+    """
+    Limit the time that the statements executed in the given store can
+    run to the remaining time of the given deadline, returns a callable
+    that removes the limit.
+
+    PostgreSQL uses `statement_timeout` (for the current transaction only),
+    MySQL uses `max_execution_time` (5.7.8 or higher, SELECT statements
+    only) and SQLite interrupts the statements with a progress handler
+
+    :param store: the Storm store
+    :type store: :class:`storm.store.Store`
+    :param request_deadline: the deadline
+    :type request_deadline: :class:`~mamba.utils.deadline.Deadline`
+    """
+
+    backend = get_backend(store)
+    milliseconds = max(int(request_deadline.remaining() * 1000), 1)
+    if backend == 'postgres':
+        store.execute('SET LOCAL statement_timeout = {}'.format(milliseconds))
+    elif backend == 'mysql':
+        store.execute(
+            'SET SESSION max_execution_time = {}'.format(milliseconds))
+        return lambda: store.execute('SET SESSION max_execution_time = 0')
+    elif backend == 'sqlite':
+        connection = store._connection._raw_connection
+        if connection is not None:
+            connection.set_progress_handler(
+                lambda: request_deadline.expired, 1000)
+            return lambda: connection.set_progress_handler(None, 0)
+
+    return lambda: None
+
+
+def is_statement_timeout(error):
+    """
+    Return True if the given database error is a statement interrupted by
+    the limits that :func:`statement_timeout` sets, any other error must
+    go through as it is even if the deadline expired in the meantime
+
+    :param error: the exception raised by the database driver
+    :type error: Exception
+    """
+
+    if getattr(error, 'pgcode', None) == '57014':
+        # query_canceled
+        return True
+
+    if error.args and error.args[0] in (1317, 3024):
+        # MySQL query interrupted and max_execution_time exceeded
+        return True
+
+    message = str(error).lower()
+    return 'interrupted' in message or 'statement timeout' in message
+
+
+def bind_deadline(function, owner, request_deadline=None):
+    """
+    Bind the given function (that is going to run in the database pool) to
+    the given deadline or to the current one (if any). The bound function
+    is dropped if the deadline expires while it waits in the pool queue and
+    its statements are limited to the remaining time of the deadline.
+
+    :param function: the function to bind
+    :type function: callable
+    :param owner: the model (or object with a `database`) that runs it
+    :param request_deadline: the deadline (the current one if None)
+    :type request_deadline: :class:`~mamba.utils.deadline.Deadline`
+    """
+
+    if request_deadline is None:
+        request_deadline = deadline.current()
+        if request_deadline is None:
+            return function
+
+    @functools.wraps(function)
+    def bound(*args, **kwargs):
+        request_deadline.check(queued=True)
+        reset = lambda: None
+        database = getattr(owner, 'database', None)
+        if database is not None:
+            if hasattr(owner, 'mamba_database'):
+                store = database.store(owner.mamba_database())
+            else:
+                store = database.store()
+            reset = statement_timeout(store, request_deadline)
+
+        try:
+            return function(*args, **kwargs)
+        except DeadlineExceeded:
+            raise
+        except Exception as error:
+            if request_deadline.expired and is_statement_timeout(error):
+                # the backend interrupted the statement
+                raise DeadlineExceeded(
+                    'Deadline of {}s exceeded'.format(
+                        request_deadline.timeout)
+                )
+            raise
+        finally:
+            reset()
+
+    bound.deadline = request_deadline
+    return bound
+
+
 def transact(method):
-    """Decorator that run the given method into the Transactor pool
+    """
+    Decorator that run the given method into the Transactor pool, the
+    method is bound to the current request deadline (or to the one given
+    in the `deadline` keyword argument) if any
     """
 
     @functools.wraps(method)
@@ -419,12 +542,28 @@ def transact(method):
         kwargs['async'] = kwargs.pop(
             'async', getattr(self, '__mamba_async__', True))
         kwargs['auto_commit'] = kwargs.pop('auto_commit', True)
+        function = bind_deadline(method, self, kwargs.pop('deadline', None))
+        if getattr(function, 'deadline', None) is not None:
+            if function.deadline.expired:
+                # fail fast, don't even queue it
+                error = DeadlineExceeded(
+                    'Deadline of {}s exceeded'.format(
+                        function.deadline.timeout), queued=True
+                )
+                if kwargs['async'] is False:
+                    raise error
+                return defer.fail(error)
+
         if "transactor" in dir(self):
-            return self.transactor.run(method, self, *args, **kwargs)
+            return self.transactor.run(function, self, *args, **kwargs)
         else:
-            return self.database.transactor.run(method, self, *args, **kwargs)
-     
+            return self.database.transactor.run(
+                function, self, *args, **kwargs)
+
     return wrapper
 
 
-__all__ = ['Database', 'AdapterFactory', 'transact']
+__all__ = [
+    'Database', 'AdapterFactory', 'transact', 'bind_deadline',
+    'statement_timeout', 'is_statement_timeout', 'get_backend'
+]
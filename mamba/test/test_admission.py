@@ -0,0 +1,111 @@
+# Copyright (c) 2012 - Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+Tests for :class: `~mamba.web.admission`
+"""
+
+from twisted.internet import defer
+from twisted.trial import unittest
+
+from mamba.web.admission import (
+    AdmissionRejected, ConcurrencyLimiter, AdmissionControl
+)
+
+
+class Controller(object):
+
+    __admission__ = {'limit': 1}
+
+
+class ConcurrencyLimiterTest(unittest.TestCase):
+
+    def test_admits_requests_up_to_the_limit(self):
+        limiter = ConcurrencyLimiter(limit=2)
+        self.assertTrue(limiter.acquire().called)
+        self.assertTrue(limiter.acquire().called)
+        self.assertRaises(AdmissionRejected, limiter.acquire)
+        self.assertEqual(limiter.stats()['rejected'], 1)
+
+        limiter.release()
+        self.assertTrue(limiter.acquire().called)
+
+    def test_queued_requests_are_admitted_on_release(self):
+        limiter = ConcurrencyLimiter(limit=1, queue_size=1)
+        limiter.acquire()
+        queued = limiter.acquire()
+        self.assertFalse(queued.called)
+        self.assertEqual(limiter.queued, 1)
+        self.assertRaises(AdmissionRejected, limiter.acquire)
+
+        limiter.release()
+        self.assertTrue(queued.called)
+        self.assertEqual(limiter.in_flight, 1)
+
+    def test_cancelled_requests_leave_the_queue(self):
+        limiter = ConcurrencyLimiter(limit=1, queue_size=1)
+        limiter.acquire()
+        queued = limiter.acquire()
+        queued.cancel()
+        self.assertEqual(limiter.queued, 0)
+        return self.assertFailure(queued, defer.CancelledError)
+
+    def test_rejections_carry_retry_after(self):
+        limiter = ConcurrencyLimiter(limit=1, retry_after=5)
+        limiter.acquire()
+        error = self.assertRaises(AdmissionRejected, limiter.acquire)
+        self.assertEqual(error.retry_after, 5)
+
+    def test_adaptive_limit_grows_while_latency_is_fine(self):
+        limiter = ConcurrencyLimiter(limit=2, adaptive=True)
+        for _ in range(10):
+            limiter.acquire()
+            limiter.acquire()
+            limiter.release(0.01)
+            limiter.release(0.01)
+
+        self.assertTrue(limiter.limit > 2)
+
+    def test_adaptive_limit_backs_off_on_high_latency(self):
+        limiter = ConcurrencyLimiter(limit=10, adaptive=True, min_limit=2)
+        limiter.acquire()
+        limiter.release(0.01)
+        limiter.acquire()
+        limiter.release(1.0)
+        self.assertEqual(limiter.limit, 9)
+
+        for _ in range(50):
+            limiter.acquire()
+            limiter.release(overloaded=True)
+        self.assertEqual(limiter.current_limit, 2)
+
+
+class AdmissionControlTest(unittest.TestCase):
+
+    def test_no_limits_admits_everything(self):
+        self.assertIsNone(AdmissionControl().acquire(object()))
+
+    def test_global_and_controller_limits(self):
+        admission = AdmissionControl({'limit': 2})
+        released = []
+        admission.acquire(Controller()).addCallback(released.append)
+        self.assertEqual(len(released), 1)
+
+        self.assertFailure(
+            admission.acquire(Controller()), AdmissionRejected)
+        self.assertEqual(admission.stats()['global']['in_flight'], 1)
+        self.assertEqual(admission.stats()['Controller']['rejected'], 1)
+
+        released[0](0.01)
+        self.assertEqual(admission.stats()['global']['in_flight'], 0)
+        self.assertEqual(admission.stats()['Controller']['in_flight'], 0)
+
+    def test_collect_renders_prometheus_lines(self):
+        admission = AdmissionControl({'limit': 2})
+        admission.acquire(Controller())
+        lines = admission.collect()
+        self.assertIn('mamba_admission_limit{limiter="global"} 2', lines)
+        self.assertIn(
+            'mamba_admission_in_flight{limiter="Controller"} 1', lines)
+        self.assertIn(
+            'mamba_admission_rejected_total{limiter="global"} 0', lines)
@@ -0,0 +1,100 @@
+# Copyright (c) 2012 - Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+Tests for mamba.web.body
+"""
+
+from cStringIO import StringIO
+
+from twisted.trial import unittest
+from twisted.web.http_headers import Headers
+from twisted.web.test.test_web import DummyRequest
+
+from mamba.web import body
+
+
+def request_generator(data, content_type='application/json', method='POST'):
+    request = DummyRequest([''])
+    request.method = method
+    request.content = StringIO(data)
+    request.requestHeaders = Headers()
+    request.requestHeaders.setRawHeaders('content-type', [content_type])
+    return request
+
+
+class RequestBodyTest(unittest.TestCase):
+
+    def test_json_is_parsed_once(self):
+        request = request_generator('{"name": "mamba"}')
+        request_body = body.RequestBody(request)
+        self.assertEqual(request_body.json, {'name': 'mamba'})
+        request.content = None
+        self.assertEqual(request_body.json, {'name': 'mamba'})
+
+    def test_json_returns_empty_dict_on_invalid_json(self):
+        request_body = body.RequestBody(request_generator('{"name"'))
+        self.assertEqual(request_body.json, {})
+
+    def test_json_returns_empty_dict_on_other_content_types(self):
+        request_body = body.RequestBody(
+            request_generator('{"name": "mamba"}', 'text/plain'))
+        self.assertEqual(request_body.json, {})
+
+    def test_form_parses_put_form_encoded_bodies(self):
+        request = request_generator(
+            'name=mamba', 'application/x-www-form-urlencoded', 'PUT')
+        self.assertEqual(body.RequestBody(request).form, {'name': ['mamba']})
+
+    def test_size_uses_content_length_header(self):
+        request = request_generator('{}')
+        request.requestHeaders.setRawHeaders('content-length', ['1024'])
+        self.assertEqual(body.RequestBody(request).size, 1024)
+        self.assertEqual(request.content.tell(), 0)
+
+    def test_check_size_raises_on_large_bodies(self):
+        request_body = body.RequestBody(request_generator('[1, 2, 3]'), 4)
+        self.assertRaises(body.RequestBodyTooLarge, request_body.check_size)
+        self.assertRaises(body.RequestBodyTooLarge, request_body.read)
+
+    def test_iter_json_decodes_arrays_incrementally(self):
+        data = '[{"id": 1}, {"id": 22}, 12345, "text", [1, 2]]'
+        request_body = body.RequestBody(request_generator(data))
+        request_body.chunk_size = 3
+
+        self.assertEqual(
+            list(request_body.iter_json()),
+            [{'id': 1}, {'id': 22}, 12345, 'text', [1, 2]]
+        )
+
+    def test_iter_json_yields_non_array_values(self):
+        request_body = body.RequestBody(request_generator('{"id": 1}'))
+        self.assertEqual(list(request_body.iter_json()), [{'id': 1}])
+
+    def test_iter_json_raises_on_unterminated_arrays(self):
+        request_body = body.RequestBody(request_generator('[1, 2'))
+        self.assertRaises(ValueError, list, request_body.iter_json())
+
+
+class LazyBodyAttributeTest(unittest.TestCase):
+
+    def setUp(self):
+
+        class Request(DummyRequest):
+            pass
+
+        body.patch_request(Request)
+        self.request = Request([''])
+        self.request.method = 'POST'
+        self.request.content = StringIO('{"name": "mamba"}')
+        self.request.requestHeaders.setRawHeaders(
+            'content-type', ['application/json'])
+
+    def test_request_json_is_lazy_and_cached(self):
+        self.assertFalse('json' in self.request.__dict__)
+        self.assertEqual(self.request.json, {'name': 'mamba'})
+        self.assertTrue('json' in self.request.__dict__)
+
+    def test_explicit_values_take_precedence(self):
+        self.request.json = {'other': True}
+        self.assertEqual(self.request.json, {'other': True})
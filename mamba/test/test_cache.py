@@ -0,0 +1,103 @@
+# Copyright (c) 2012 - Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+Tests for :class: `~mamba.web.cache`
+"""
+
+from twisted.trial import unittest
+from twisted.internet.task import Clock
+from twisted.web.test.test_web import DummyRequest
+
+from mamba.web.cache import ResponseCache
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = ResponseCache(maxbytes=100, clock=self.clock.seconds)
+
+    def test_lookup_fresh_entries(self):
+        self.cache.store('key', 200, 'data', {}, 10)
+        entry, state = self.cache.lookup('key')
+        self.assertEqual(entry.subject, 'data')
+        self.assertEqual(state, ResponseCache.FRESH)
+
+    def test_lookup_stale_entries_inside_stale_window(self):
+        self.cache.store('key', 200, 'data', {}, 10, 5)
+        self.clock.advance(12)
+        entry, state = self.cache.lookup('key')
+        self.assertEqual(state, ResponseCache.STALE)
+        self.assertEqual(entry.age(self.clock.seconds()), 12)
+
+        self.clock.advance(3)
+        self.assertEqual(self.cache.lookup('key'), (None, None))
+        self.assertEqual(self.cache.bytes, 0)
+
+    def test_store_evicts_least_recently_used_by_bytes(self):
+        for key in ('one', 'two', 'three'):
+            self.cache.store(key, 200, 'x' * 40, {}, 10)
+
+        self.assertFalse('one' in self.cache)
+        self.assertEqual(self.cache.bytes, 80)
+
+        self.cache.lookup('two')
+        self.cache.store('four', 200, 'x' * 40, {}, 10)
+        self.assertTrue('two' in self.cache)
+        self.assertFalse('three' in self.cache)
+
+    def test_store_ignores_responses_larger_than_the_cache(self):
+        self.assertIsNone(self.cache.store('key', 200, 'x' * 101, {}, 10))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_stats_hit_ratio(self):
+        self.cache.store('key', 200, 'data', {'etag': '"1"'}, 10)
+        self.cache.lookup('key')
+        self.cache.lookup('key')
+        self.cache.lookup('other')
+        self.clock.advance(10)
+        self.cache.lookup('key')
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['hit_ratio'], 0.5)
+        self.assertEqual(stats['bytes'], 0)
+
+    def test_make_key_varies_on_headers_and_args(self):
+        request = DummyRequest([''])
+        request.args = {'page': ['1'], 'other': ['x']}
+        request.requestHeaders.setRawHeaders('accept', ['text/plain'])
+
+        self.assertEqual(
+            ResponseCache.make_key(
+                'Controller', '/test', request, ('accept',), ('page',)),
+            ('Controller', '/test', ('text/plain',), (('1',),))
+        )
+
+    def test_make_key_varies_on_accept_and_the_whole_query_by_default(self):
+        request = DummyRequest([''])
+        request.args = {'page': ['2'], 'limit': ['10']}
+        request.requestHeaders.setRawHeaders('accept', ['application/json'])
+
+        self.assertEqual(
+            ResponseCache.make_key('Controller', '/test', request),
+            ('Controller', '/test', ('application/json',),
+             (('limit', ('10',)), ('page', ('2',))))
+        )
+        self.assertEqual(
+            ResponseCache.make_key(
+                'Controller', '/test', request, vary_args=())[3], ()
+        )
+
+    def test_evictions_are_counted_and_collected(self):
+        for key in ('one', 'two', 'three'):
+            self.cache.store(key, 200, 'x' * 40, {}, 10)
+        self.cache.lookup('three')
+
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        lines = self.cache.collect()
+        self.assertIn('mamba_response_cache_evictions_total 1', lines)
+        self.assertIn('mamba_response_cache_hits_total 1', lines)
+        self.assertIn('mamba_response_cache_bytes 80', lines)
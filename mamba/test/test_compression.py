@@ -0,0 +1,170 @@
+# Copyright (c) 2012 - Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+Tests for :class: `~mamba.web.compression`
+"""
+
+import zlib
+
+from twisted.internet import defer
+from twisted.trial import unittest
+from twisted.web.server import NOT_DONE_YET
+from twisted.web.test.test_web import DummyRequest
+
+from mamba.web import compression
+from mamba.web.compression import CompressionPolicy
+
+
+def request_generator(accept_encoding=None):
+    request = DummyRequest([''])
+    if accept_encoding is not None:
+        request.requestHeaders.setRawHeaders(
+            'accept-encoding', [accept_encoding])
+
+    return request
+
+
+class CompressionPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = CompressionPolicy(
+            enabled=True, encodings=('gzip', 'deflate'))
+
+    def test_disabled_by_default(self):
+        self.assertFalse(CompressionPolicy().enabled)
+        self.assertFalse(CompressionPolicy.from_options().enabled)
+        self.assertTrue(CompressionPolicy.from_options(None, True).enabled)
+
+    def test_negotiate_uses_quality_and_server_preference(self):
+        self.assertEqual(self.policy.negotiate('deflate, gzip'), 'gzip')
+        self.assertEqual(
+            self.policy.negotiate('gzip;q=0.5, deflate'), 'deflate')
+        self.assertEqual(self.policy.negotiate('*'), 'gzip')
+        self.assertIsNone(self.policy.negotiate('gzip;q=0, identity'))
+        self.assertIsNone(self.policy.negotiate(None))
+
+    def test_negotiate_returns_none_when_disabled(self):
+        self.policy.enabled = False
+        self.assertIsNone(self.policy.negotiate('gzip'))
+
+    def test_accepts_skips_small_and_compressed_content(self):
+        self.assertTrue(self.policy.accepts('application/json', 1024))
+        self.assertFalse(self.policy.accepts('application/json', 1023))
+        self.assertFalse(self.policy.accepts('image/png', 4096))
+        self.assertTrue(self.policy.accepts('image/svg+xml', 4096))
+        self.assertFalse(self.policy.accepts('application/zip', 4096))
+
+    def test_from_options_applies_overrides(self):
+        policy = CompressionPolicy.from_options(
+            {'min_size': 10, 'level': 9}, {'level': 1})
+        self.assertEqual((policy.min_size, policy.level), (10, 1))
+        self.assertFalse(CompressionPolicy.from_options({}, False).enabled)
+
+    def test_from_options_ignores_unknown_options(self):
+        policy = CompressionPolicy.from_options(
+            {'enabled': True, 'level': 9, 'mime_types': ['text/html']})
+        self.assertTrue(policy.enabled)
+        self.assertEqual(policy.level, 9)
+
+    def test_unavailable_encodings_are_ignored(self):
+        policy = CompressionPolicy(encodings=('unknown', 'gzip'))
+        self.assertEqual(policy.encodings, ('gzip',))
+
+    def test_compress_gzip_and_deflate(self):
+        data = 'mamba ' * 1000
+        gzipped = self.policy.compress(data, 'gzip')
+        self.assertEqual(zlib.decompress(gzipped, 16 + zlib.MAX_WBITS), data)
+        self.assertEqual(
+            zlib.decompress(self.policy.compress(data, 'deflate')), data)
+
+    @defer.inlineCallbacks
+    def test_compress_large_bodies_outside_the_reactor_thread(self):
+        self.policy.offload_size = 10
+        result = self.policy.compress('mamba ' * 1000, 'gzip')
+        self.assertIsInstance(result, defer.Deferred)
+
+        data = yield result
+        self.assertEqual(
+            zlib.decompress(data, 16 + zlib.MAX_WBITS), 'mamba ' * 1000)
+
+
+class CompressionHelpersTest(unittest.TestCase):
+
+    def test_add_vary(self):
+        headers = {}
+        compression.add_vary(headers)
+        self.assertEqual(headers, {'vary': 'Accept-Encoding'})
+
+        headers = {'Vary': 'accept, accept-encoding'}
+        compression.add_vary(headers)
+        self.assertEqual(headers, {'Vary': 'accept, accept-encoding'})
+
+        headers = {'vary': 'accept'}
+        compression.add_vary(headers)
+        self.assertEqual(headers, {'vary': 'accept, Accept-Encoding'})
+
+    def test_render_compressed(self):
+        policy = CompressionPolicy(enabled=True, encodings=('gzip',))
+        request = request_generator('gzip')
+        data = compression.render_compressed(
+            request, '<p>mamba</p>' * 100, 'text/html', policy)
+
+        self.assertEqual(
+            zlib.decompress(data, 16 + zlib.MAX_WBITS), '<p>mamba</p>' * 100)
+        self.assertEqual(
+            request.responseHeaders.getRawHeaders('content-encoding'),
+            ['gzip']
+        )
+
+    def test_render_compressed_keeps_the_vary_header(self):
+        policy = CompressionPolicy(enabled=True, encodings=('gzip',))
+        request = request_generator('gzip')
+        request.setHeader('vary', 'Origin')
+        compression.render_compressed(
+            request, '<p>mamba</p>' * 100, 'text/html', policy)
+
+        self.assertEqual(
+            request.responseHeaders.getRawHeaders('vary'),
+            ['Origin, Accept-Encoding']
+        )
+
+    def test_render_compressed_without_accept_encoding(self):
+        request = request_generator()
+        data = compression.render_compressed(
+            request, 'x' * 2048, 'text/html', CompressionPolicy(enabled=True)
+        )
+
+        self.assertEqual(data, 'x' * 2048)
+        self.assertFalse(request.responseHeaders.hasHeader('content-encoding'))
+
+    def test_render_compressed_offloads_large_bodies(self):
+        policy = CompressionPolicy(
+            enabled=True, encodings=('gzip',), offload_size=2048)
+        request = request_generator('gzip')
+        result = compression.render_compressed(
+            request, 'x' * 4096, 'text/html', policy)
+        self.assertEqual(result, NOT_DONE_YET)
+        self.assertFalse(request.responseHeaders.hasHeader('content-encoding'))
+
+        d = request.notifyFinish()
+        d.addCallback(lambda _: self.assertEqual(
+            zlib.decompress(''.join(request.written), 16 + zlib.MAX_WBITS),
+            'x' * 4096
+        ))
+        return d
+
+    def test_render_compressed_failures_are_processed_as_errors(self):
+        policy = CompressionPolicy(
+            enabled=True, encodings=('gzip',), offload_size=2048)
+        policy.compress = lambda data, encoding: defer.fail(MemoryError())
+        request = request_generator('gzip')
+        failures = []
+        request.processingFailed = failures.append
+
+        result = compression.render_compressed(
+            request, 'x' * 4096, 'text/html', policy)
+        self.assertEqual(result, NOT_DONE_YET)
+        self.assertEqual(len(failures), 1)
+        self.assertTrue(failures[0].check(MemoryError))
+        self.assertFalse(request.responseHeaders.hasHeader('content-encoding'))
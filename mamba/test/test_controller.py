@@ -23,7 +23,8 @@ from mamba.core import GNU_LINUX
 from mamba.web.routing import Router
 from mamba.test.dummy_app.application.controller.dummy import DummyController
 
-from mamba.web.response import Ok
+from mamba.web.response import Ok, Streamed
+from mamba.test.test_stream import StreamRequest
 from mamba.application import controller
 from mamba.core.interfaces import INotifier
 
@@ -99,6 +100,61 @@ class ControllerTest(unittest.TestCase):
         self.assertEqual(result, None)
         self.assertEqual(request.written[0], '{"test": "me"}')
 
+    def test_send_back_writes_no_body_on_head_requests(self):
+
+        request = DummyRequest(['/test'], '')
+        request.method = 'HEAD'
+        response = Ok('', {'content-type': 'application/json'})
+
+        result = self.c.sendback(response, request)
+
+        self.assertEqual(result, None)
+        self.assertEqual(request.written, [])
+        self.assertEqual(request.finished, 1)
+
+    @defer.inlineCallbacks
+    def test_send_back_streams_generators(self):
+
+        request = StreamRequest(['/test'])
+
+        def generator():
+            for i in range(3):
+                yield '{},'.format(i)
+
+        yield self.c.sendback(Streamed(generator(), 'text/csv'), request)
+
+        self.assertEqual(request.written, ['0,', '1,', '2,'])
+        self.assertEqual(request.finished, 1)
+        self.assertEqual(
+            request.responseHeaders.getRawHeaders('content-type'),
+            ['text/csv']
+        )
+
+    @defer.inlineCallbacks
+    def test_send_back_aborts_failed_streams(self):
+
+        request = StreamRequest(['/test'])
+
+        def generator():
+            yield 'partial'
+            raise ValueError('database is gone')
+
+        yield self.c.sendback(Streamed(generator()), request)
+
+        self.assertEqual(request.written, ['partial'])
+        self.assertTrue(request.disconnected)
+        self.assertEqual(request.finished, 0)
+        self.assertEqual(len(self.flushLoggedErrors(ValueError)), 1)
+
+    def test_send_back_does_not_stream_on_head_requests(self):
+
+        request = StreamRequest(['/test'])
+        request.method = 'HEAD'
+
+        self.c.sendback(Streamed(iter(['data'])), request)
+        self.assertEqual(request.written, [])
+        self.assertEqual(request.finished, 1)
+
     def test_register_path_returns_empty(self):
         self.assertEqual(self.c.get_register_path(), '')
 
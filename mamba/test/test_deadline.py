@@ -0,0 +1,160 @@
+# Copyright (c) 2012 - Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+Tests for :class: `~mamba.utils.deadline`
+"""
+
+import sqlite3
+
+from twisted.internet import defer
+from twisted.internet.task import Clock
+from twisted.trial import unittest
+from storm.databases.sqlite import SQLite
+
+from mamba.utils import deadline
+from mamba.utils.deadline import Deadline, DeadlineExceeded
+from mamba.enterprise.database import (
+    transact, bind_deadline, statement_timeout, is_statement_timeout
+)
+
+
+class DummyConnection(object):
+
+    def __init__(self, raw_connection):
+        self._raw_connection = raw_connection
+
+
+class DummyStore(object):
+
+    def __init__(self):
+        self._connection = DummyConnection(sqlite3.connect(':memory:'))
+
+    def get_database(self):
+        return SQLite.__new__(SQLite)
+
+    def execute(self, statement):
+        return self._connection._raw_connection.execute(statement)
+
+
+class DummyDatabase(object):
+
+    def __init__(self):
+        self.dummy_store = DummyStore()
+
+    def store(self, database='mamba'):
+        return self.dummy_store
+
+
+class DummyTransactor(object):
+
+    def run(self, function, *args, **kwargs):
+        kwargs.pop('async')
+        kwargs.pop('auto_commit')
+        return defer.maybeDeferred(function, *args, **kwargs)
+
+
+class Worker(object):
+
+    database = DummyDatabase()
+    transactor = DummyTransactor()
+
+    @transact
+    def work(self):
+        return 'done'
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+
+    def test_deadline_expires(self):
+        request_deadline = Deadline(2, self.clock.seconds)
+        self.assertFalse(request_deadline.expired)
+        self.assertEqual(request_deadline.remaining(), 2)
+
+        self.clock.advance(2)
+        self.assertTrue(request_deadline.expired)
+        self.assertEqual(request_deadline.remaining(), 0)
+        self.assertRaises(DeadlineExceeded, request_deadline.check)
+
+    def test_call_sets_the_current_deadline(self):
+        request_deadline = Deadline(2, self.clock.seconds)
+        self.assertIsNone(deadline.current())
+        self.assertIs(
+            deadline.call(request_deadline, deadline.current),
+            request_deadline
+        )
+        self.assertIsNone(deadline.current())
+
+    def test_bind_deadline_without_deadline_returns_the_function(self):
+        function = lambda: None
+        self.assertIs(bind_deadline(function, Worker), function)
+
+    def test_bound_functions_are_dropped_once_expired(self):
+        request_deadline = Deadline(2, self.clock.seconds)
+        bound = bind_deadline(lambda: 'done', Worker, request_deadline)
+        self.assertEqual(bound(), 'done')
+
+        self.clock.advance(2)
+        error = self.assertRaises(DeadlineExceeded, bound)
+        self.assertTrue(error.queued)
+
+    def test_sqlite_statements_are_interrupted(self):
+        clock = Clock()
+        request_deadline = Deadline(2, clock.seconds)
+        store = DummyStore()
+        reset = statement_timeout(store, request_deadline)
+
+        clock.advance(2)
+        self.assertRaises(
+            sqlite3.OperationalError, store.execute,
+            'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c '
+            'WHERE x < 1000000) SELECT count(*) FROM c'
+        )
+
+        reset()
+        self.assertEqual(store.execute('SELECT 1').fetchone(), (1,))
+
+    def test_interrupted_statements_raise_deadline_exceeded(self):
+        request_deadline = Deadline(2, self.clock.seconds)
+
+        def work():
+            self.clock.advance(2)
+            raise sqlite3.OperationalError('interrupted')
+
+        bound = bind_deadline(work, Worker, request_deadline)
+        error = self.assertRaises(DeadlineExceeded, bound)
+        self.assertFalse(error.queued)
+
+    def test_other_errors_go_through_once_expired(self):
+        request_deadline = Deadline(2, self.clock.seconds)
+
+        def work():
+            self.clock.advance(2)
+            raise KeyError('application error')
+
+        bound = bind_deadline(work, Worker, request_deadline)
+        self.assertRaises(KeyError, bound)
+
+    def test_is_statement_timeout(self):
+        self.assertTrue(is_statement_timeout(
+            sqlite3.OperationalError('interrupted')))
+        self.assertTrue(is_statement_timeout(Exception(
+            3024, 'Query execution was interrupted, maximum statement '
+            'execution time exceeded')))
+        self.assertFalse(is_statement_timeout(
+            sqlite3.IntegrityError('UNIQUE constraint failed')))
+
+    @defer.inlineCallbacks
+    def test_transact_uses_the_current_deadline(self):
+        request_deadline = Deadline(2, self.clock.seconds)
+        result = yield deadline.call(request_deadline, Worker().work)
+        self.assertEqual(result, 'done')
+
+        self.clock.advance(2)
+        yield self.assertFailure(
+            deadline.call(request_deadline, Worker().work), DeadlineExceeded)
+        yield self.assertFailure(
+            Worker().work(deadline=request_deadline), DeadlineExceeded)
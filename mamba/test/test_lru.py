@@ -0,0 +1,67 @@
+# Copyright (c) 2012 - Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+Tests for :class: `~mamba.utils.lru`
+"""
+
+from twisted.trial import unittest
+from twisted.internet.task import Clock
+
+from mamba.utils.lru import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LRUCache(maxsize=2)
+
+    def test_get_returns_stored_values(self):
+        self.cache.set('one', 1)
+        self.assertEqual(self.cache.get('one'), 1)
+
+    def test_get_returns_default_on_miss(self):
+        self.assertIsNone(self.cache.get('one'))
+        self.assertEqual(self.cache.get('one', 'default'), 'default')
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('one', 1)
+        self.cache.set('two', 2)
+        self.cache.get('one')
+        self.cache.set('three', 3)
+
+        self.assertTrue('one' in self.cache)
+        self.assertFalse('two' in self.cache)
+        self.assertTrue('three' in self.cache)
+        self.assertEqual(len(self.cache), 2)
+
+    def test_counts_hits_and_misses(self):
+        self.cache.set('one', 1)
+        self.cache.get('one')
+        self.cache.get('one')
+        self.cache.get('two')
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['hits'], 2)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['size'], 1)
+
+    def test_invalidate_and_clear(self):
+        self.cache.set('one', 1)
+        self.cache.set('two', 2)
+        self.cache.invalidate('one')
+        self.assertFalse('one' in self.cache)
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_entries_expire_after_ttl(self):
+        clock = Clock()
+        cache = LRUCache(maxsize=2, ttl=10, clock=clock.seconds)
+        cache.set('one', 1)
+        clock.advance(5)
+        self.assertEqual(cache.get('one'), 1)
+
+        clock.advance(5)
+        self.assertIsNone(cache.get('one'))
+        self.assertFalse('one' in cache)
+        self.assertEqual(cache.stats()['misses'], 1)
@@ -0,0 +1,120 @@
+# Copyright (c) 2012 - Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+Tests for :class: `~mamba.web.metrics`
+"""
+
+from twisted.trial import unittest
+from twisted.internet.address import IPv4Address, IPv6Address
+from twisted.web.test.test_web import DummyRequest
+
+from mamba.web.metrics import (
+    LatencyHistogram, MetricsRegistry, MetricsResource
+)
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def test_percentiles_have_bounded_relative_error(self):
+        histogram = LatencyHistogram()
+        for i in range(1, 10001):
+            histogram.record(i / 1e4)  # from 100us to 1s
+
+        self.assertEqual(histogram.count, 10000)
+        self.assertEqual(histogram.max, 1.0)
+        for percentile, expected in ((50, 0.5), (90, 0.9), (99, 0.99)):
+            value = histogram.percentile(percentile)
+            self.assertTrue(expected <= value <= expected * 1.07, value)
+
+        self.assertEqual(histogram.percentile(100), 1.0)
+
+    def test_memory_does_not_depend_on_samples(self):
+        histogram = LatencyHistogram()
+        for i in range(100000):
+            histogram.record(0.001 + (i % 1000) / 1e6)
+
+        self.assertTrue(len(histogram.buckets) < 40)
+
+    def test_empty_histogram(self):
+        self.assertEqual(LatencyHistogram().percentile(99), 0.0)
+
+    def test_small_values_are_exact(self):
+        histogram = LatencyHistogram()
+        histogram.record(0.000005)
+        self.assertEqual(histogram.percentile(50), 0.000005)
+
+
+class MetricsRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_record_per_route(self):
+        self.registry.record('Ctrl', '/a', 'GET', 0.01, 10)
+        self.registry.record('Ctrl', '/a', 'GET', 0.02, 20, True)
+        self.registry.record('Ctrl', '/a', 'POST', 0.02, 20)
+
+        metrics = self.registry.get('Ctrl', '/a', 'GET')
+        self.assertEqual(metrics.count, 2)
+        self.assertEqual(metrics.errors, 1)
+        self.assertEqual(metrics.bytes, 30)
+        self.assertEqual(self.registry.get('Ctrl', '/a', 'POST').count, 1)
+
+    def test_render_prometheus_format(self):
+        self.registry.record('Ctrl', '/user/<int:id>', 'GET', 0.5, 10, True)
+        output = self.registry.render()
+
+        labels = 'controller="Ctrl",route="/user/<int:id>",method="GET"'
+        for line in (
+                '# TYPE mamba_request_duration_seconds summary',
+                'mamba_request_duration_seconds{%s,quantile="0.99"} 0.500000'
+                % labels,
+                'mamba_request_duration_seconds_count{%s} 1' % labels,
+                'mamba_request_errors_total{%s} 1' % labels,
+                'mamba_response_size_bytes_sum{%s} 10' % labels):
+            self.assertIn(line, output.splitlines())
+
+    def test_render_escapes_labels(self):
+        self.registry.record('Ctrl', '/a"b\\', 'GET', 0.5)
+        self.assertIn('route="/a\\"b\\\\"', self.registry.render())
+
+    def test_render_registered_collectors(self):
+        self.registry.register_collector('extra', lambda: ['extra_total 1'])
+        self.assertTrue(self.registry.render().endswith('extra_total 1\n'))
+
+    def test_resource_renders_registry(self):
+        self.registry.record('Ctrl', '/a', 'GET', 0.5)
+        request = DummyRequest([''])
+        output = MetricsResource(self.registry).render_GET(request)
+
+        self.assertEqual(output, self.registry.render())
+        self.assertEqual(
+            request.responseHeaders.getRawHeaders('content-type'),
+            ['text/plain; version=0.0.4']
+        )
+
+    def test_resource_allows_the_configured_clients_only(self):
+        resource = MetricsResource(self.registry, allow=['127.0.0.1'])
+        request = DummyRequest([''])
+        request.client = IPv4Address('TCP', '127.0.0.1', 8080)
+        self.assertEqual(resource.render_GET(request), self.registry.render())
+
+        request = DummyRequest([''])
+        request.client = IPv4Address('TCP', '10.0.0.1', 8080)
+        self.assertEqual(resource.render_GET(request), '')
+        self.assertEqual(request.responseCode, 403)
+
+    def test_resource_ignores_forwarded_for(self):
+        resource = MetricsResource(self.registry, allow=['127.0.0.1', '::1'])
+        request = DummyRequest([''])
+        request.client = IPv4Address('TCP', '10.0.0.1', 8080)
+        request.requestHeaders.setRawHeaders('x-forwarded-for', ['127.0.0.1'])
+        # mamba patches getClientIP to return the X-Forwarded-For value
+        request.getClientIP = lambda: '127.0.0.1'
+        self.assertEqual(resource.render_GET(request), '')
+        self.assertEqual(request.responseCode, 403)
+
+        request = DummyRequest([''])
+        request.client = IPv6Address('TCP', '::1', 8080)
+        self.assertEqual(resource.render_GET(request), self.registry.render())
@@ -6,8 +6,11 @@
 Tests for mamba.application.model
 """
 
+import gc
 import os
+import base64
 import sys
+import decimal
 import datetime
 import tempfile
 import functools
@@ -16,15 +19,18 @@ from collections import OrderedDict
 
 from storm.uri import URI
 from storm.store import Store
+from storm.info import get_obj_info
 from twisted.trial import unittest
 from twisted.python import filepath
+from twisted.internet import defer, reactor
+from twisted.python.threadpool import ThreadPool
 from storm.zope.interfaces import ZStormError
-from storm.exceptions import DatabaseModuleError, NoneError
+from storm.exceptions import DatabaseModuleError, NoneError, LostObjectError
 from storm.twisted.testing import FakeThreadPool
 from twisted.internet.defer import inlineCallbacks, Deferred
 from storm.locals import (
     Int, Unicode, Reference, ReferenceSet, Enum, List, Bool, DateTime, Decimal,
-    Storm
+    RawStr, Storm
 )
 
 from mamba import Database
@@ -33,7 +39,11 @@ from mamba import Model, ModelManager
 from mamba.core import interfaces, GNU_LINUX
 from mamba.enterprise.common import NativeEnum
 from mamba.enterprise.mysql import MySQLMissingPrimaryKey, MySQL
-from mamba.application.model import InvalidModelSchema, MambaStorm
+from mamba.application import model
+from mamba.application.model import (
+    InvalidModelSchema, MambaStorm, ModelError, InvalidCursor, BatchIterator,
+    get_model_info, _encode_cursor, _decode_cursor
+)
 from mamba.enterprise.sqlite import SQLiteMissingPrimaryKey, SQLite
 from mamba.enterprise.postgres import PostgreSQLMissingPrimaryKey, PostgreSQL
 
@@ -169,6 +179,42 @@ class ModelTest(unittest.TestCase):
         self.assertEqual(d['name'], u'Dummy')
         self.assertEqual(d['id'], None)
 
+    def test_model_info_is_computed_once_per_class(self):
+        DummyModel('Dummy')
+        info = DummyModel.__dict__['_mamba_model_info']
+        DummyModel('Dummy')
+        self.assertIs(DummyModel.__dict__['_mamba_model_info'], info)
+        self.assertEqual(info.attributes, ['id', 'name'])
+        self.assertEqual(info.primary_key, 'id')
+        self.assertIs(DummyModel._storm_columns, info.columns)
+
+    def test_model_info_not_none_columns(self):
+        dummy = DummyModel()
+        self.assertEqual(
+            [name for name, _ in DummyModel._mamba_model_info.not_none],
+            ['name']
+        )
+        self.assertRaises(NoneError, dummy._set_empty_properties_to_none)
+
+    def test_dict_compiles_one_serializer_per_options(self):
+        dummy = DummyModel('Dummy')
+        dummy.dict(json=True, fields=['name'])
+        info = DummyModel._mamba_model_info
+        serializer = info.serializer(['name'], None, True, True)
+        self.assertEqual(dummy.dict(json=True, fields=['name']), {
+            'name': u'Dummy'})
+        self.assertIs(info.serializer(('name',), (), True, True), serializer)
+
+    def test_dict_json_converts_datetime_and_decimal(self):
+        dummy = DummyModelDecimal()
+        dummy.money = decimal.Decimal('1.5')
+        self.assertEqual(dummy.dict(json=True)['money'], 1.5)
+
+        dummy = DummyModelDatetime()
+        dummy.time = datetime.datetime(2013, 1, 1)
+        self.assertEqual(
+            dummy.dict(json=True)['time'], '2013-01-01 00:00:00')
+
     def test_json(self):
         dummy = DummyModel('Dummy')
         j = dummy.json
@@ -202,6 +248,81 @@ class ModelTest(unittest.TestCase):
         self.assertEqual(d['dummy']['id'], d['dummy_id'])
         store.rollback()
 
+    @inlineCallbacks
+    def test_find_prefetch_references(self):
+        store = self.database.store()
+        for name in ('Dummy1', 'Dummy2'):
+            dummy = DummyModelRelated()
+            dummy.name = unicode(name)
+            store.add(dummy)
+            dummy.dummies.add(DummyRelationModel(name + 'Related'))
+        store.commit()
+
+        related = yield DummyRelationModel.find(prefetch=('dummy',))
+        self.assertIsInstance(related, list)
+        for dummy2 in related:
+            prefetched = dummy2.__dict__['_mamba_prefetched']
+            self.assertIs(prefetched['dummy'], dummy2.dummy)
+            self.assertEqual(dummy2.dict()['dummy']['id'], dummy2.dummy_id)
+
+        # changed objects drop their (maybe stale) prefetched references
+        related[0].name = u'Changed'
+        self.assertFalse('_mamba_prefetched' in related[0].__dict__)
+        self.assertTrue('_mamba_prefetched' in related[1].__dict__)
+        store.rollback()
+
+        dummies = yield DummyModelRelated.all(prefetch=('dummies',))
+        self.assertEqual(
+            [d.dict()['dummies'][0]['name'] for d in dummies],
+            [u'Dummy1Related', u'Dummy2Related']
+        )
+        store.execute('DELETE FROM dummy_two')
+        self.truncate_dummy()
+
+    @inlineCallbacks
+    def test_find_prefetch_many_to_many_references(self):
+        store = self.database.store()
+        store.execute(
+            'CREATE TABLE IF NOT EXISTS `dummy_link` ('
+            '   dummy_id INTEGER, dummy_two_id INTEGER,'
+            '   PRIMARY KEY(dummy_id, dummy_two_id)'
+            ')'
+        )
+        for name in ('Dummy1', 'Dummy2'):
+            store.add(DummyModelTagged(name))
+        for id, name in ((1, u'Tag1'), (2, u'Tag2')):
+            tag = DummyRelationModel(name)
+            tag.id, tag.dummy_id = id, 0
+            store.add(tag)
+        for dummy_id, dummy_two_id in ((1, 1), (1, 2), (2, 2)):
+            link = DummyModelLink()
+            link.dummy_id, link.dummy_two_id = dummy_id, dummy_two_id
+            store.add(link)
+        store.commit()
+
+        tagged = yield DummyModelTagged.all(prefetch=('tags',))
+        self.assertEqual(
+            [sorted(tag['name'] for tag in d.dict()['tags']) for d in tagged],
+            [[u'Tag1', u'Tag2'], [u'Tag2']]
+        )
+        self.assertEqual(
+            [len(d.__dict__['_mamba_prefetched']['tags']) for d in tagged],
+            [2, 1]
+        )
+        store.execute('DROP TABLE dummy_link')
+        store.execute('DELETE FROM dummy_two')
+        self.truncate_dummy()
+
+    def test_find_prefetch_invalid_reference(self):
+        return self.assertFailure(
+            DummyRelationModel.find(prefetch=('name',)), ModelError)
+
+    def test_find_prefetch_needs_model_objects(self):
+        self.assertRaises(
+            ModelError, DummyRelationModel.find,
+            (DummyRelationModel, DummyModelRelated), prefetch=('dummy',)
+        )
+
     @inlineCallbacks
     def test_model_create(self):
         dummy = DummyModel('Dummy')
@@ -215,6 +336,86 @@ class ModelTest(unittest.TestCase):
 
         self.assertEqual(dummy.id, 1)
 
+    @inlineCallbacks
+    def test_model_create_many(self):
+        names = [u'Dummy{}'.format(i) for i in range(5)]
+        count = yield DummyModel.create_many(
+            (DummyModel(name) for name in names), batch_size=2)
+
+        self.assertEqual(count, 5)
+        store = self.database.store()
+        result = store.find(DummyModel).order_by(DummyModel.id)
+        self.assertEqual([dummy.name for dummy in result], names)
+        self.truncate_dummy()
+
+    @inlineCallbacks
+    def test_model_create_many_return_keys(self):
+        self.insert_dummy()
+        dummies = [DummyModel('Dummy{}'.format(i)) for i in range(3)]
+        keys = yield DummyModel.create_many(
+            dummies, batch_size=2, return_keys=True)
+
+        self.assertEqual(keys, [2, 3, 4])
+        self.assertEqual([dummy.id for dummy in dummies], keys)
+        self.truncate_dummy()
+
+    @inlineCallbacks
+    def test_model_create_many_return_keys_one_by_one_in_mysql(self):
+        self.patch(model, 'get_backend', lambda store: 'mysql')
+        self.insert_dummy()
+        dummies = [DummyModel('Dummy{}'.format(i)) for i in range(3)]
+        keys = yield DummyModel.create_many(dummies, return_keys=True)
+
+        self.assertEqual(keys, [2, 3, 4])
+        self.assertEqual([dummy.id for dummy in dummies], keys)
+        self.truncate_dummy()
+
+    @inlineCallbacks
+    def test_model_create_many_return_compound_keys(self):
+        dummies = [DummyModelCompound(i, 1, u'Dummy') for i in range(3)]
+        keys = yield DummyModelCompound.create_many(dummies, return_keys=True)
+
+        self.assertEqual(keys, [(0, 1), (1, 1), (2, 1)])
+        store = self.database.store()
+        self.assertEqual(store.find(DummyModelCompound).count(), 3)
+        store.execute('DELETE FROM dummy_two')
+        store.commit()
+
+    def test_model_create_many_respects_not_none_columns(self):
+        self.assertRaises(
+            NoneError, DummyModel.create_many, [DummyModel()], async=False)
+
+    @inlineCallbacks
+    def test_model_update_where(self):
+        for name in ('Dummy1', 'Dummy2', 'Dummy3'):
+            self.insert_dummy(name)
+
+        store = self.database.store()
+        dummy = store.get(DummyModel, 1)
+        self.assertEqual(dummy.name, u'Dummy1')
+        updated = yield DummyModel.update_where(
+            DummyModel.id < 3, name=u'Updated')
+
+        self.assertEqual(updated, 2)
+        self.assertEqual(dummy.name, u'Updated')
+        self.assertEqual(
+            store.find(DummyModel, DummyModel.name == u'Updated').count(), 2)
+        self.truncate_dummy()
+
+    @inlineCallbacks
+    def test_model_delete_where(self):
+        for name in ('Dummy1', 'Dummy2', 'Dummy3'):
+            self.insert_dummy(name)
+
+        store = self.database.store()
+        dummy = store.get(DummyModel, 3)
+        deleted = yield DummyModel.delete_where(DummyModel.id > 1)
+
+        self.assertEqual(deleted, 2)
+        self.assertRaises(LostObjectError, getattr, dummy, 'name')
+        self.assertEqual(store.find(DummyModel).count(), 1)
+        self.truncate_dummy()
+
     @inlineCallbacks
     def test_model_read(self):
         self.insert_dummy()
@@ -231,6 +432,15 @@ class ModelTest(unittest.TestCase):
         self.assertEqual(dummy.name, u'Dummy')
         self.truncate_dummy()
 
+    def test_model_without_columns_can_be_instantiated(self):
+
+        class WithoutColumns(Model):
+            pass
+
+        self.assertIsInstance(WithoutColumns(), WithoutColumns)
+        self.assertEqual(get_model_info(WithoutColumns).names, [])
+        self.assertIsNone(get_model_info(WithoutColumns).primary_key)
+
     def test_model_read_raises_type_error_on_wrong_instantiation(self):
 
         class NonInstantiableByRead(Model):
@@ -403,6 +613,39 @@ class ModelTest(unittest.TestCase):
         self.assertEqual(dummy.name, u'Fellas')
         self.truncate_dummy()
 
+    @inlineCallbacks
+    def test_model_update_without_changes_is_a_noop(self):
+        self.insert_dummy()
+        dummy = yield DummyModel.read(1, True)
+        store = self.database.store()
+        store.execute('UPDATE dummy SET name = \'Changed\' WHERE id = 1')
+        store.commit()
+        yield dummy.update()
+
+        dummy2 = yield DummyModel.read(1, True)
+        self.assertEqual(dummy2.name, u'Changed')
+        self.truncate_dummy()
+
+    @inlineCallbacks
+    def test_model_update_compound_key_checkpoints_the_object(self):
+        dummy = DummyModelCompound(1, 1, u'Dummy')
+        yield dummy.create()
+        del(dummy)
+
+        dummy = yield DummyModelCompound.read((1, 1), True)
+        dummy.name = u'Fellas'
+        store = self.database.store()
+        store.execute('UPDATE dummy_two SET name = \'Changed\'')
+        store.commit()
+        yield dummy.update()
+        self.assertFalse(get_obj_info(dummy).variables[
+            DummyModelCompound.name].has_changed())
+
+        dummy = yield DummyModelCompound.read((1, 1), True)
+        self.assertEqual(dummy.name, u'Fellas')
+        store.execute('DELETE FROM dummy_two')
+        store.commit()
+
     @inlineCallbacks
     def test_model_update_raise_exeption_on_invalid_schema(self):
         dummy = DummyInvalidModel()
@@ -449,6 +692,194 @@ class ModelTest(unittest.TestCase):
         store = self.database.store()
         self.assertTrue(store.find(DummyModel).count() == 0)
 
+    def test_model_delete_detached_copy(self):
+        self.insert_dummy()
+        dummy = DummyModel.read(1, True, async=False)
+        dummy.delete(async=False)
+
+        store = self.database.store()
+        self.assertEqual(store.find(DummyModel).count(), 0)
+
+    def test_model_cached_read_returns_detached_copies(self):
+        self.insert_dummy()
+        get_model_info(DummyModelCached).cache.clear()
+        dummy = DummyModelCached.read(1, async=False)
+        store = self.database.store()
+        store.execute('UPDATE dummy SET name = \'Changed\' WHERE id = 1')
+        store.commit()
+
+        cached = DummyModelCached.read(1)
+        self.assertTrue(cached.called)
+        cached = self.successResultOf(cached)
+        self.assertIsNot(cached, dummy)
+        self.assertIsNone(Store.of(cached))
+        self.assertEqual(cached.name, u'Dummy')
+        self.truncate_dummy()
+
+    def test_model_cache_is_invalidated_by_update(self):
+        self.insert_dummy()
+        get_model_info(DummyModelCached).cache.clear()
+        dummy = DummyModelCached.read(1, async=False)
+        dummy.name = u'Updated'
+        dummy.update(async=False)
+
+        self.assertEqual(
+            DummyModelCached.read(1, async=False).name, u'Updated')
+        dummy.delete(async=False)
+        self.assertIsNone(DummyModelCached.read(1, async=False))
+        self.truncate_dummy()
+
+    def test_model_read_many(self):
+        for name in ('Dummy1', 'Dummy2'):
+            self.insert_dummy(name)
+        get_model_info(DummyModelCached).cache.clear()
+        DummyModelCached.read(2, async=False)
+        cache = get_model_info(DummyModelCached).cache
+        hits = cache.stats()['hits']
+
+        dummies = DummyModelCached.read_many([2, 3, 1], async=False)
+        self.assertEqual(
+            [dummy and dummy.name for dummy in dummies],
+            [u'Dummy2', None, u'Dummy1']
+        )
+        self.assertEqual(cache.stats()['hits'], hits + 1)
+        self.assertEqual(cache.stats()['size'], 2)
+        self.truncate_dummy()
+
+    def test_model_paginate(self):
+        for name in ('Dummy1', 'Dummy2', 'Dummy1', 'Dummy2', 'Dummy3'):
+            self.insert_dummy(name)
+
+        pages, cursor = [], None
+        while True:
+            page = DummyModel.paginate(
+                DummyModel.name, after=cursor, limit=2, async=False)
+            pages.append([(dummy.name, dummy.id) for dummy in page])
+            cursor = page.cursor
+            if cursor is None:
+                break
+
+        self.assertEqual(pages, [
+            [(u'Dummy1', 1), (u'Dummy1', 3)],
+            [(u'Dummy2', 2), (u'Dummy2', 4)],
+            [(u'Dummy3', 5)]
+        ])
+        self.truncate_dummy()
+
+    def test_model_paginate_desc_with_condition(self):
+        for name in ('Dummy1', 'Dummy2', 'Dummy3'):
+            self.insert_dummy(name)
+
+        page = DummyModel.paginate(
+            limit=1, desc=True, where=DummyModel.id < 3, async=False)
+        self.assertEqual([dummy.id for dummy in page], [2])
+        page = DummyModel.paginate(
+            after=page.cursor, limit=1, desc=True, where=DummyModel.id < 3,
+            async=False
+        )
+        self.assertEqual([dummy.id for dummy in page], [1])
+        self.assertIsNone(page.cursor)
+        self.truncate_dummy()
+
+    def test_model_paginate_raw_str_keys(self):
+        store = self.database.store()
+        store.execute(
+            'CREATE TABLE IF NOT EXISTS `dummy_raw` ('
+            '    id BLOB PRIMARY KEY, name TEXT'
+            ')'
+        )
+        for key in ('\xff\x00', 'key', '\xfe'):
+            dummy = DummyModelRaw()
+            dummy.id, dummy.name = key, u'Dummy'
+            store.add(dummy)
+        store.commit()
+
+        pages, cursor = [], None
+        while True:
+            page = DummyModelRaw.paginate(after=cursor, limit=2, async=False)
+            pages.append([dummy.id for dummy in page])
+            cursor = page.cursor
+            if cursor is None:
+                break
+
+        self.assertEqual(pages, [['key', '\xfe'], ['\xff\x00']])
+        store.execute('DROP TABLE dummy_raw')
+        store.commit()
+
+    def test_model_paginate_invalid_cursor(self):
+        self.insert_dummy('Dummy1')
+        self.insert_dummy('Dummy2')
+        self.assertRaises(
+            InvalidCursor, DummyModel.paginate, after='invalid', async=False)
+        cursor = DummyModel.paginate(limit=1, async=False).cursor
+        self.assertRaises(
+            InvalidCursor, DummyModel.paginate, DummyModel.name,
+            after=cursor, async=False
+        )
+        self.truncate_dummy()
+
+    @inlineCallbacks
+    def test_model_iterate(self):
+        for name in ('Dummy1', 'Dummy2', 'Dummy1', 'Dummy2', 'Dummy3'):
+            self.insert_dummy(name)
+
+        batches = DummyModel.iterate(
+            DummyModel.name != u'Dummy3', batch_size=3,
+            order_by=DummyModel.id, async=False
+        )
+        first = yield batches.next()
+        self.assertEqual([dummy.id for dummy in first], [1, 2, 3])
+        self.assertIsNone(Store.of(first[0]))
+        second = yield batches.next()
+        self.assertEqual([dummy.id for dummy in second], [4])
+        last = yield batches.next()
+        self.assertEqual(last, [])
+        self.truncate_dummy()
+
+    @inlineCallbacks
+    def test_model_iterate_each(self):
+        for name in ('Dummy1', 'Dummy2', 'Dummy3'):
+            self.insert_dummy(name)
+
+        names = []
+        count = yield DummyModel.iterate(batch_size=2, async=False).each(
+            lambda batch: names.append([dummy.name for dummy in batch]))
+        self.assertEqual(count, 3)
+        self.assertEqual(names, [[u'Dummy1', u'Dummy2'], [u'Dummy3']])
+
+        batches = DummyModel.iterate(batch_size=1, async=False)
+        batches.close()
+        last = yield batches.next()
+        self.assertEqual(last, [])
+        self.truncate_dummy()
+
+    def test_model_select(self):
+        for name in ('Dummy1', 'Dummy2', 'Dummy3'):
+            self.insert_dummy(name)
+
+        rows = DummyModel.select(
+            fields=('name',), where=DummyModel.id > 1, order_by=DummyModel.id,
+            desc=True, limit=1, async=False
+        )
+        self.assertEqual(rows, [(u'Dummy3',)])
+        self.assertEqual(rows[0].name, u'Dummy3')
+        self.assertEqual(rows[0].dict(), {'name': u'Dummy3'})
+        self.assertFalse(hasattr(rows[0], '__dict__'))
+
+        rows = DummyModel.select(
+            exclude=('name',), order_by=DummyModel.id, async=False)
+        self.assertEqual([row.dict() for row in rows], [
+            {'id': 1}, {'id': 2}, {'id': 3}
+        ])
+        self.truncate_dummy()
+
+    def test_model_select_rows_are_reused_per_projection(self):
+        info = get_model_info(DummyModel)
+        row_type = info.row_type(['id', 'name'])
+        self.assertIs(info.row_type(['id', 'name']), row_type)
+        self.assertEqual(row_type._names, ('id', 'name'))
+        self.assertRaises(ModelError, DummyModel.select, fields=['nope'])
+
     @inlineCallbacks
     def test_model_find(self):
         self.insert_dummy()
@@ -1303,6 +1734,128 @@ class ModelTest(unittest.TestCase):
         del DummyModelThree.__on_update__
 
 
+class BatchIteratorTest(unittest.TestCase):
+    """Tests for mamba.application.model.BatchIterator in a real pool
+    """
+
+    def setUp(self):
+        self.pool = ThreadPool(1, 1)
+        self.pool.start()
+        self.manager = RecordingDataManager()
+
+    def tearDown(self):
+        self.pool.stop()
+
+    @inlineCallbacks
+    def _released(self):
+        """Wait until the pool thread is not working anymore
+        """
+
+        for _ in range(100):
+            if not self.pool.working:
+                return
+            d = Deferred()
+            reactor.callLater(0.01, d.callback, None)
+            yield d
+
+        self.fail('the pool thread was not released')
+
+    def _batches(self, **kwargs):
+        def produce(hand_over):
+            transaction.get().join(self.manager)
+            for number in range(100):
+                if not hand_over([number]):
+                    break
+
+        return BatchIterator(produce, self.pool, **kwargs)
+
+    @inlineCallbacks
+    def test_abandoned_iterations_release_the_thread(self):
+        batches = self._batches(idle_timeout=None)
+        first = yield batches.next()
+        self.assertEqual(first, [0])
+        self.assertEqual(len(self.pool.working), 1)
+
+        del batches
+        gc.collect()
+        yield self._released()
+        self.assertEqual(self.manager.events, ['commit'])
+
+    @inlineCallbacks
+    def test_idle_iterations_are_rolled_back(self):
+        batches = self._batches(idle_timeout=0.1)
+        first = yield batches.next()
+        self.assertEqual(first, [0])
+
+        yield self._released()
+        self.assertEqual(self.manager.events, ['abort'])
+        yield self.assertFailure(batches.next(), defer.TimeoutError)
+
+
+class RecordingDataManager(object):
+    """Transaction data manager that records how the transaction ends
+    """
+
+    transaction_manager = transaction.manager
+
+    def __init__(self):
+        self.events = []
+
+    def abort(self, txn):
+        self.events.append('abort')
+
+    def tpc_begin(self, txn):
+        pass
+
+    def commit(self, txn):
+        self.events.append('commit')
+
+    def tpc_vote(self, txn):
+        pass
+
+    def tpc_finish(self, txn):
+        pass
+
+    def tpc_abort(self, txn):
+        self.events.append('abort')
+
+    def sortKey(self):
+        return 'recording'
+
+
+class CursorTest(unittest.TestCase):
+    """Tests for the pagination cursors of mamba.application.model
+    """
+
+    def test_raw_str_values_round_trip(self):
+        for key in ('\xff\x00', 'key', ''):
+            variable = DummyModelRaw.id.variable_factory(
+                value=key, from_db=True)
+            cursor = _encode_cursor([variable])
+            decoded = _decode_cursor(cursor, [DummyModelRaw.id])
+            self.assertEqual(decoded[0].get(), key)
+            self.assertIsInstance(decoded[0].get(), str)
+
+    def test_unicode_and_int_values_round_trip(self):
+        variables = [
+            DummyModelRaw.name.variable_factory(
+                value=u'\xf1and\xfa', from_db=True),
+            DummyRelationModel.dummy_id.variable_factory(
+                value=42, from_db=True)
+        ]
+        decoded = _decode_cursor(
+            _encode_cursor(variables),
+            [DummyModelRaw.name, DummyRelationModel.dummy_id]
+        )
+        self.assertEqual(
+            [variable.get() for variable in decoded], [u'\xf1and\xfa', 42])
+
+    def test_unknown_tagged_values_are_invalid(self):
+        cursor = base64.urlsafe_b64encode('[{"x": "AA=="}]')
+        self.assertRaises(
+            InvalidCursor, _decode_cursor, cursor, [DummyModelRaw.id])
+
+
 class ModelManagerTest(unittest.TestCase):
     """Tests for mamba.application.model.ModelManager
     """
@@ -1458,6 +2011,45 @@ class DummyRelationModel(Model, Storm):
             self.name = unicode(name)
 
 
+class DummyModelLink(Model, Storm):
+    """DummyModelLink, many to many link of dummy and dummy_two"""
+
+    __metaclass__ = MambaStorm
+    __storm_table__ = 'dummy_link'
+    __storm_primary__ = 'dummy_id', 'dummy_two_id'
+    dummy_id = Int()
+    dummy_two_id = Int()
+
+
+class DummyModelTagged(Model, Storm):
+    """DummyModelTagged"""
+
+    __metaclass__ = MambaStorm
+    __storm_table__ = 'dummy'
+    id = Int(primary=True, auto_increment=True, unsigned=True)
+    name = Unicode()
+
+    # references
+    tags = ReferenceSet(
+        'DummyModelTagged.id', 'DummyModelLink.dummy_id',
+        'DummyModelLink.dummy_two_id', 'DummyRelationModel.id'
+    )
+
+    def __init__(self, name=None):
+        super(DummyModelTagged, self).__init__()
+
+        if name is not None:
+            self.name = unicode(name)
+
+
+class DummyModelRaw(Model):
+    """Dummy Model with a raw bytes primary key"""
+
+    __storm_table__ = 'dummy_raw'
+    id = RawStr(primary=True)
+    name = Unicode()
+
+
 class DummyModelTwo(Model):
     """Dummy Model for testing purposes"""
 
@@ -1640,6 +2232,15 @@ class DummyModelMambaOther(Model):
     name = Unicode()
 
 
+class DummyModelCached(Model):
+    """Dummy Model with read-through cache for testing purposes"""
+
+    __storm_table__ = 'dummy'
+    __mamba_cache__ = {'ttl': 60, 'max_entries': 100}
+    id = Int(primary=True, auto_increment=True, unsigned=True)
+    name = Unicode(size=64)
+
+
 class DummyThreadPool(FakeThreadPool):
 
     def start(self):
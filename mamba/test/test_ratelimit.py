@@ -0,0 +1,132 @@
+# Copyright (c) 2012 - Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+Tests for :class: `~mamba.web.ratelimit`
+"""
+
+from twisted.internet.task import Clock
+from twisted.internet.address import IPv4Address, IPv6Address
+from twisted.trial import unittest
+from twisted.web.server import Site
+from twisted.web.test.test_web import DummyRequest
+
+from mamba.web.ratelimit import (
+    RateLimiter, RateLimited, TokenBucket, ip_key, session_key
+)
+
+
+def client(ip, forwarded_for=None):
+    request = DummyRequest([''])
+    if ':' in ip:
+        request.client = IPv6Address('TCP', ip, 8080)
+    else:
+        request.client = IPv4Address('TCP', ip, 8080)
+    if forwarded_for is not None:
+        request.requestHeaders.setRawHeaders(
+            'x-forwarded-for', [forwarded_for])
+    return request
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_take_refills_lazily(self):
+        bucket = TokenBucket(1, 0)
+        self.assertEqual(bucket.take(0, 2, 1), 0)
+        self.assertEqual(bucket.take(0, 2, 1), 0.5)
+        self.assertEqual(bucket.take(0.5, 2, 1), 0)
+
+    def test_tokens_never_exceed_the_burst(self):
+        bucket = TokenBucket(0, 0)
+        bucket.take(100, 1, 3)
+        self.assertEqual(bucket.tokens, 2)
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+
+    def test_allows_bursts_and_then_limits(self):
+        limiter = RateLimiter(1, burst=3, clock=self.clock.seconds)
+        for _ in range(3):
+            limiter.check(client('1.1.1.1'))
+
+        error = self.assertRaises(
+            RateLimited, limiter.check, client('1.1.1.1'))
+        self.assertEqual(error.retry_after, 1)
+        self.assertEqual(limiter.limited, 1)
+
+        self.clock.advance(1)
+        limiter.check(client('1.1.1.1'))
+
+    def test_clients_have_their_own_buckets(self):
+        limiter = RateLimiter(1, clock=self.clock.seconds)
+        limiter.check(client('1.1.1.1'))
+        limiter.check(client('2.2.2.2'))
+        self.assertRaises(RateLimited, limiter.check, client('1.1.1.1'))
+
+    def test_custom_key_functions(self):
+        limiter = RateLimiter(
+            1, key=lambda request: 'everybody', clock=self.clock.seconds)
+        limiter.check(client('1.1.1.1'))
+        self.assertRaises(RateLimited, limiter.check, client('2.2.2.2'))
+
+    def test_remembered_clients_are_bounded(self):
+        limiter = RateLimiter(1, maxsize=2, clock=self.clock.seconds)
+        for ip in ('1.1.1.1', '2.2.2.2', '3.3.3.3'):
+            limiter.check(client(ip))
+
+        self.assertEqual(len(limiter.buckets), 2)
+        # the first client was forgotten so it gets a full bucket again
+        limiter.check(client('1.1.1.1'))
+
+    def test_from_options(self):
+        self.assertIsNone(RateLimiter.from_options(None))
+        self.assertEqual(RateLimiter.from_options(5).burst, 5)
+        limiter = RateLimiter.from_options({'rate': 2, 'burst': 10})
+        self.assertEqual((limiter.rate, limiter.burst), (2, 10))
+
+    def test_ip_key_uses_the_transport_address(self):
+        self.assertEqual(ip_key(client('::1')), '::1')
+        self.assertNotEqual(ip_key(client('::1')), ip_key(client('::2')))
+        self.assertEqual(
+            ip_key(client('1.1.1.1', forwarded_for='127.0.0.1')), '1.1.1.1')
+
+    def test_ip_key_honors_forwarded_for_from_trusted_proxies(self):
+        proxies = frozenset(['10.0.0.1'])
+        request = client('10.0.0.1', forwarded_for='6.6.6.6, 2.2.2.2')
+        self.assertEqual(ip_key(request, proxies), '2.2.2.2')
+        request = client('10.0.0.1', forwarded_for='2.2.2.2, 10.0.0.1')
+        self.assertEqual(ip_key(request, proxies), '2.2.2.2')
+        self.assertEqual(ip_key(client('10.0.0.1'), proxies), '10.0.0.1')
+
+    def test_spoofed_forwarded_for_does_not_escape_the_limit(self):
+        limiter = RateLimiter(1, clock=self.clock.seconds)
+        limiter.check(client('1.1.1.1', forwarded_for='3.3.3.3'))
+        self.assertRaises(
+            RateLimited, limiter.check,
+            client('1.1.1.1', forwarded_for='4.4.4.4')
+        )
+
+        limiter = RateLimiter(
+            1, clock=self.clock.seconds, trusted_proxies=['1.1.1.1'])
+        limiter.check(client('1.1.1.1', forwarded_for='3.3.3.3'))
+        limiter.check(client('1.1.1.1', forwarded_for='4.4.4.4'))
+
+    def test_session_key_never_creates_sessions(self):
+        site = Site(None)
+        cookies = {}
+        request = client('1.1.1.1')
+        request.site = site
+        request.getCookie = cookies.get
+        self.assertEqual(session_key(request), '1.1.1.1')
+        self.assertEqual(site.sessions, {})
+
+        session = site.makeSession()
+        self.addCleanup(session.expire)
+        cookies['TWISTED_SESSION'] = session.uid
+        self.assertEqual(session_key(request), session.uid)
+
+        cookies['TWISTED_SESSION'] = 'forged'
+        self.assertEqual(session_key(request), '1.1.1.1')
@@ -22,6 +22,11 @@ class ResponseTest(unittest.TestCase):
         result = response.Created()
         self.assertEqual(result.code, http.CREATED)
 
+    def test_response_streamed_is_200(self):
+        result = response.Streamed(iter([]), 'text/csv')
+        self.assertEqual(result.code, http.OK)
+        self.assertEqual(result.headers, {'content-type': 'text/csv'})
+
     def test_response_unknown_is_209(self):
         result = response.Unknown()
         self.assertEqual(result.code, 209)
@@ -38,6 +43,15 @@ class ResponseTest(unittest.TestCase):
         result = response.SeeOther('none')
         self.assertEqual(result.code, http.SEE_OTHER)
 
+    def test_response_not_modified_is_304(self):
+        result = response.NotModified()
+        self.assertEqual(result.code, http.NOT_MODIFIED)
+        self.assertEqual(result.subject, '')
+
+    def test_response_request_entity_too_large_is_413(self):
+        result = response.RequestEntityTooLarge()
+        self.assertEqual(result.code, http.REQUEST_ENTITY_TOO_LARGE)
+
     def test_response_bad_request_code_is_400(self):
         result = response.BadRequest()
         self.assertEqual(result.code, http.BAD_REQUEST)
@@ -68,3 +82,16 @@ class ResponseTest(unittest.TestCase):
     def test_not_implemented_code_is_501(self):
         result = response.NotImplemented('/test')
         self.assertEqual(result.code, http.NOT_IMPLEMENTED)
+
+    def test_service_unavailable_code_is_503(self):
+        result = response.ServiceUnavailable()
+        self.assertEqual(result.code, http.SERVICE_UNAVAILABLE)
+
+    def test_gateway_timeout_code_is_504(self):
+        result = response.GatewayTimeout()
+        self.assertEqual(result.code, http.GATEWAY_TIMEOUT)
+
+    def test_too_many_requests_code_is_429(self):
+        result = response.TooManyRequests(retry_after=2)
+        self.assertEqual(result.code, 429)
+        self.assertEqual(result.headers['retry-after'], '2')
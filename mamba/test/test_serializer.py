@@ -0,0 +1,131 @@
+# Copyright (c) 2012 - Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+Tests for mamba.web.serializer
+"""
+
+import json
+import decimal
+import datetime
+
+from twisted.trial import unittest
+
+from mamba.web import serializer
+
+
+class Point(object):
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+        self._hidden = True
+
+
+class SerializerTest(unittest.TestCase):
+
+    def test_parse_accept_sorts_by_quality(self):
+        self.assertEqual(
+            serializer.parse_accept(
+                'text/plain;q=0.5, application/json, */*;q=0, text/*;q=0.8'
+            ),
+            ['application/json', 'text/*', 'text/plain']
+        )
+
+    def test_json_serializer_adapts_objects_in_one_pass(self):
+        encoder = serializer.JSONSerializer()
+        data = {
+            'point': Point(1, [Point(2, 3)]),
+            'price': decimal.Decimal('10.50'),
+            'date': datetime.date(2013, 1, 1)
+        }
+
+        self.assertEqual(json.loads(encoder.serialize(data)), {
+            'point': {'x': 1, 'y': [{'x': 2, 'y': 3}]},
+            'price': '10.50',
+            'date': '2013-01-01'
+        })
+
+    def test_register_adapter(self):
+        serializer.register_adapter(Point, lambda p: [p.x, p.y])
+        self.addCleanup(serializer.unregister_adapter, Point)
+
+        encoder = serializer.JSONSerializer()
+        self.assertEqual(encoder.serialize(Point(1, 2)), '[1, 2]')
+
+    def test_adapters_are_looked_up_once_per_type(self):
+        encoder = serializer.JSONSerializer()
+        self.assertEqual(
+            json.loads(encoder.serialize([Point(1, 2), Point(3, 4)])),
+            [{'x': 1, 'y': 2}, {'x': 3, 'y': 4}]
+        )
+        self.assertIs(serializer._lookups[Point], None)
+
+        serializer.register_adapter(Point, lambda p: [p.x, p.y])
+        self.addCleanup(serializer.unregister_adapter, Point)
+        self.assertEqual(
+            encoder.serialize([Point(1, 2), Point(3, 4)]), '[[1, 2], [3, 4]]')
+
+        serializer.unregister_adapter(Point)
+        self.assertEqual(
+            json.loads(encoder.serialize([Point(1, 2)])), [{'x': 1, 'y': 2}])
+
+    def test_json_serializer_adapts_mixed_lists(self):
+        serializer.register_adapter(Point, lambda p: [p.x, p.y])
+        self.addCleanup(serializer.unregister_adapter, Point)
+
+        encoder = serializer.JSONSerializer()
+        self.assertEqual(
+            encoder.serialize([Point(1, 2), 3, decimal.Decimal('4.5')]),
+            '[[1, 2], 3, "4.5"]'
+        )
+
+    def test_plain_text_serializer_encodes_unicode_as_utf8(self):
+        encoder = serializer.PlainTextSerializer()
+        self.assertEqual(encoder.serialize(u'\xf1'), '\xc3\xb1')
+        self.assertEqual(encoder.header, 'text/plain; charset=utf-8')
+
+    def test_msgpack_serializer(self):
+        if serializer.msgpack is None:
+            raise unittest.SkipTest('msgpack is not installed')
+
+        encoder = serializer.MsgpackSerializer()
+        self.assertEqual(
+            serializer.msgpack.unpackb(encoder.serialize(Point(1, 2))),
+            {'x': 1, 'y': 2}
+        )
+
+
+class SerializerRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.json = serializer.JSONSerializer()
+        self.text = serializer.PlainTextSerializer()
+        self.registry = serializer.SerializerRegistry([self.json, self.text])
+
+    def test_negotiate_defaults_to_first_serializer(self):
+        self.assertIs(self.registry.negotiate('text'), self.json)
+        self.assertIs(self.registry.negotiate(10, '*/*'), self.json)
+
+    def test_negotiate_uses_accept_header(self):
+        self.assertIs(self.registry.negotiate(10, 'text/*'), self.text)
+        self.assertIs(
+            self.registry.negotiate(10, 'text/plain;q=0.2, */*;q=0.1'),
+            self.text
+        )
+
+    def test_negotiate_ignores_serializers_that_dont_handle_the_type(self):
+        self.assertIs(self.registry.negotiate({}, 'text/plain'), self.json)
+
+    def test_negotiate_raises_when_no_serializer_handles_the_type(self):
+        registry = serializer.SerializerRegistry([self.text])
+        self.assertRaises(TypeError, registry.negotiate, {})
+
+    def test_register_replaces_serializers_and_clears_the_cache(self):
+        self.assertIs(self.registry.negotiate(10, 'text/plain'), self.text)
+        text = serializer.PlainTextSerializer()
+        self.registry.register(text, first=True)
+
+        self.assertEqual(len(self.registry), 2)
+        self.assertIs(self.registry.negotiate(10), text)
+        self.assertIs(self.registry.get('text/plain; charset=utf-8'), text)
@@ -0,0 +1,302 @@
+# Copyright (c) 2012 - Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+Tests for :class: `~mamba.web.stream`
+"""
+
+import json
+
+import transaction
+from twisted.internet import defer, task, reactor
+from twisted.trial import unittest
+from twisted.python.threadpool import ThreadPool
+from twisted.web.test.test_web import DummyRequest
+
+from mamba.web import stream, response
+
+
+class StreamRequest(DummyRequest):
+    """DummyRequest that records its streaming producers
+    """
+
+    def __init__(self, *args, **kwargs):
+        DummyRequest.__init__(self, *args, **kwargs)
+        self.producer = None
+        self.unregistered = False
+        self.disconnected = False
+
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+
+    def unregisterProducer(self):
+        self.unregistered = True
+
+    def loseConnection(self):
+        self.disconnected = True
+
+
+class BodyProducer(object):
+
+    length = 4
+
+    def __init__(self):
+        self.consumer = None
+
+    def startProducing(self, consumer):
+        self.consumer = consumer
+        consumer.write('data')
+        return defer.succeed(None)
+
+    def pauseProducing(self):
+        pass
+
+    def resumeProducing(self):
+        pass
+
+    def stopProducing(self):
+        pass
+
+
+class Row(object):
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    def dict(self, traverse=True, json=False, fields=None, exclude=None):
+        values = {'id': self.id, 'name': self.name}
+        if fields is not None:
+            values = dict((k, v) for k, v in values.items() if k in fields)
+        return values
+
+
+class StreamTest(unittest.TestCase):
+
+    def test_is_streamable(self):
+        self.assertTrue(stream.is_streamable(x for x in range(3)))
+        self.assertTrue(stream.is_streamable(iter([1, 2])))
+        self.assertTrue(stream.is_streamable(BodyProducer()))
+        self.assertFalse(stream.is_streamable([1, 2]))
+        self.assertFalse(stream.is_streamable({'a': 1}))
+        self.assertFalse(stream.is_streamable('data'))
+        self.assertFalse(stream.is_streamable(None))
+
+    @defer.inlineCallbacks
+    def test_stream_generators(self):
+        request = StreamRequest([''])
+
+        def generator():
+            yield 'one,'
+            yield u'\xf1,'
+            yield defer.succeed('three')
+
+        yield stream.stream(generator(), request)
+        self.assertEqual(request.written, ['one,', '\xc3\xb1,', 'three'])
+        self.assertIsInstance(request.producer, stream.IteratorProducer)
+        self.assertTrue(request.unregistered)
+        self.assertFalse(request.finished)
+
+    @defer.inlineCallbacks
+    def test_stream_body_producers(self):
+        request = StreamRequest([''])
+        producer = BodyProducer()
+
+        yield stream.stream(producer, request)
+        self.assertEqual(request.written, ['data'])
+        self.assertIs(request.producer, producer)
+        self.assertIs(producer.consumer, request)
+        self.assertEqual(
+            request.responseHeaders.getRawHeaders('content-length'), ['4'])
+
+    def test_stream_rejects_non_string_chunks(self):
+        request = StreamRequest([''])
+        return self.assertFailure(
+            stream.stream(iter([{'a': 1}]), request), TypeError)
+
+    def test_producer_honors_backpressure(self):
+        scheduled = []
+        cooperator = task.Cooperator(
+            terminationPredicateFactory=lambda: lambda: True,
+            scheduler=scheduled.append
+        )
+        request = StreamRequest([''])
+        producer = stream.IteratorProducer(
+            iter(['a', 'b', 'c']), request, cooperator)
+        done = producer.start()
+
+        def run():
+            while scheduled:
+                scheduled.pop(0)()
+
+        scheduled.pop(0)()
+        self.assertEqual(request.written, ['a'])
+
+        producer.pauseProducing()
+        run()
+        self.assertEqual(request.written, ['a'])
+
+        producer.resumeProducing()
+        run()
+        self.assertEqual(request.written, ['a', 'b', 'c'])
+        self.assertTrue(request.unregistered)
+        return done
+
+    def test_producer_stops_when_the_client_goes_away(self):
+        request = StreamRequest([''])
+        result = stream.stream(iter(['a'] * 1000), request)
+        request.processingFailed(Exception('connection lost'))
+
+        return self.assertFailure(result, task.TaskStopped)
+
+
+class AbortRecorder(object):
+    """Transaction data manager that counts the aborted transactions
+    """
+
+    transaction_manager = transaction.manager
+
+    def __init__(self):
+        self.aborted = 0
+
+    def abort(self, txn):
+        self.aborted += 1
+
+    def sortKey(self):
+        return 'abort-recorder'
+
+
+class JSONArrayProducerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ThreadPool(1, 1)
+        self.pool.start()
+
+    def tearDown(self):
+        self.pool.stop()
+
+    @defer.inlineCallbacks
+    def _released(self):
+        """Wait until the pool thread is not working anymore
+        """
+
+        for _ in range(100):
+            if not self.pool.working:
+                return
+            d = defer.Deferred()
+            reactor.callLater(0.01, d.callback, None)
+            yield d
+
+        self.fail('the pool thread was not released')
+
+    def _producer(self, source, **kwargs):
+        return stream.JSONArrayProducer(
+            source, threadpool=self.pool, **kwargs)
+
+    @defer.inlineCallbacks
+    def test_streams_rows_as_json_array_in_batches(self):
+        request = StreamRequest([''])
+        rows = [Row(i, 'row{}'.format(i)) for i in range(5)]
+        producer = self._producer(rows, fields=['id'], batch_size=2)
+
+        yield stream.stream(producer, request)
+        self.assertEqual(len(request.written), 4)
+        self.assertEqual(
+            json.loads(''.join(request.written)), [{'id': i} for i in range(5)]
+        )
+
+    @defer.inlineCallbacks
+    def test_empty_result_set(self):
+        request = StreamRequest([''])
+        yield stream.stream(self._producer([]), request)
+        self.assertEqual(''.join(request.written), '[]')
+
+    @defer.inlineCallbacks
+    def test_source_callables_are_called_in_the_pool(self):
+        threads = []
+
+        def query():
+            import threading
+            threads.append(threading.current_thread())
+            return iter([{'id': 1, 'secret': 'x'}])
+
+        request = StreamRequest([''])
+        yield stream.stream(self._producer(query, exclude=['secret']), request)
+        self.assertEqual(json.loads(''.join(request.written)), [{'id': 1}])
+        self.assertIn(threads[0], self.pool.threads)
+
+    @defer.inlineCallbacks
+    def test_the_source_transaction_is_ended(self):
+        manager = AbortRecorder()
+
+        def query():
+            transaction.get().join(manager)
+            return iter([{'id': 1}])
+
+        request = StreamRequest([''])
+        yield stream.stream(self._producer(query), request)
+        self.assertEqual(json.loads(''.join(request.written)), [{'id': 1}])
+        self.assertEqual(manager.aborted, 1)
+
+    @defer.inlineCallbacks
+    def test_waits_while_paused(self):
+        request = StreamRequest([''])
+        producer = self._producer(range(10), batch_size=2)
+        producer.pauseProducing()
+        done = stream.stream(producer, request)
+
+        d = defer.Deferred()
+        reactor.callLater(0.1, d.callback, None)
+        yield d
+        self.assertEqual(request.written, ['[0,1'])
+
+        producer.resumeProducing()
+        yield done
+        self.assertEqual(json.loads(''.join(request.written)), range(10))
+
+    def test_stops_when_the_client_goes_away(self):
+        request = StreamRequest([''])
+        producer = self._producer(range(10), batch_size=2)
+        producer.pauseProducing()
+        result = stream.stream(producer, request)
+        request.processingFailed(Exception('connection lost'))
+
+        return self.assertFailure(result, task.TaskStopped)
+
+    @defer.inlineCallbacks
+    def test_stop_producing_wakes_the_waiting_thread(self):
+        request = StreamRequest([''])
+        producer = self._producer(range(10), batch_size=2)
+        producer.pauseProducing()
+        result = stream.stream(producer, request)
+
+        d = defer.Deferred()
+        reactor.callLater(0.1, d.callback, None)
+        yield d
+        self.assertEqual(len(self.pool.working), 1)
+
+        producer.stopProducing()
+        yield self.assertFailure(result, task.TaskStopped)
+        yield self._released()
+        self.assertEqual(request.written, ['[0,1'])
+
+    @defer.inlineCallbacks
+    def test_stalled_clients_are_aborted(self):
+        request = StreamRequest([''])
+        producer = self._producer(range(10), batch_size=2, pause_timeout=0.1)
+        producer.pauseProducing()
+
+        yield self.assertFailure(
+            stream.stream(producer, request), defer.TimeoutError)
+        yield self._released()
+        self.assertEqual(request.written, ['[0,1'])
+
+        # resuming a timed out producer does nothing
+        producer.resumeProducing()
+
+    def test_streamed_json_response(self):
+        result = response.StreamedJSON([{'id': 1}], fields=['id'])
+        self.assertEqual(result.code, 200)
+        self.assertEqual(result.headers['content-type'], 'application/json')
+        self.assertTrue(stream.is_streamable(result.subject))
+        self.assertEqual(result.subject.fields, ['id'])
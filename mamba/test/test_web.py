@@ -7,28 +7,39 @@ Tests for mamba.web
 """
 
 import sys
+import zlib
+import hashlib
 import tempfile
+import threading
+from datetime import datetime
 from cStringIO import StringIO
 from os import sep, getcwd, chdir
 
 from twisted.internet import defer
+from twisted.internet.task import Clock
 from twisted.trial import unittest
 from twisted.python import filepath
+from twisted.python.threadpool import ThreadPool
 from twisted.web.server import Request
 from twisted.web.http_headers import Headers
 from twisted.web.test.test_web import DummyRequest
 from twisted.internet.error import ProcessTerminated
 from doublex import Stub, ProxySpy, Spy, called, assert_that
 
-from mamba.utils import json
+from mamba.utils import json, config, deadline
 from mamba.core import packages, GNU_LINUX
 from mamba.application import route as decoroute
 from mamba.application import appstyles, controller, scripts
-from mamba.web import stylesheet, page, response, script
-from mamba.web.routing import Route, Router, RouteDispatcher, RouterError
+from mamba.web import stylesheet, page, response, script, serializer
+from mamba.web.routing import (
+    Route, RouteMatch, Router, RouteDispatcher, RouterError, RouteTrie
+)
 
+from mamba.web.metrics import MetricsRegistry, MetricsResource
 from mamba.test.test_less import less_file
 from mamba.test.test_model import DummyModel
+from mamba.test.test_deadline import Worker
+from mamba.application.model import Page, InvalidCursor, get_model_info
 from mamba.test.dummy_app.application.controller.dummy import DummyController
 
 
@@ -411,6 +422,21 @@ class PageTest(unittest.TestCase):
             self.root.children.get('_mamba_pong').render_GET(request), 'PONG'
         )
 
+    def test_page_metrics_url_is_disabled_by_default(self):
+
+        self.assertFalse('_mamba' in self.root.children)
+
+    def test_page_mount_metrics(self):
+
+        self.root.mount_metrics({'enabled': True, 'path': '/stats/prom'})
+        metrics = self.root.children['stats'].getStaticEntity('prom')
+        self.assertIsInstance(metrics, MetricsResource)
+        self.assertEqual(metrics.allow, frozenset(['127.0.0.1', '::1']))
+
+        self.root.mount_metrics({'enabled': True, 'allow': '*'})
+        metrics = self.root.children['_mamba'].getStaticEntity('metrics')
+        self.assertIsNone(metrics.allow)
+
     def test_page_add_script(self):
 
         style = stylesheet.Stylesheet(
@@ -533,22 +559,39 @@ class PageTest(unittest.TestCase):
 
 class RouteTest(unittest.TestCase):
 
-    def test_compile(self):
-        route = Route('GET', '/test', lambda ignore: 'Test Done')
+    def compile(self, url):
+        route = Route('GET', url, lambda ignore: 'Test Done')
         route.compile()
+        return route
+
+    def test_compile(self):
+        route = self.compile('/test')
         self.assertEqual(route.match.pattern, '^/test$')
-        route.url = '/test/<int:userId>'
-        route.compile()
+        route = self.compile('/test/<int:userId>')
         self.assertEqual(route.match.pattern, '^/test/(?P<userId>\\d+)$')
-        route.url = '/test/<float:userId>'
-        route.compile()
+        route = self.compile('/test/<float:userId>')
         self.assertEqual(
             route.match.pattern, '^/test/(?P<userId>\\d+.?\\d*)$'
         )
-        route.url = '/test/<userName>'
-        route.compile()
+        route = self.compile('/test/<userName>')
         self.assertEqual(route.match.pattern, '^/test/(?P<userName>([^/]+))$')
 
+    def test_route_is_immutable_once_compiled(self):
+        route = Route('GET', '/test', lambda ignore: 'Test Done')
+        route.url = '/test/<int:userId>'
+        route.compile()
+        self.assertRaises(RouterError, setattr, route, 'url', '/other')
+        self.assertEqual(route.url, '/test/<int:userId>')
+
+    def test_bind_returns_compiled_copy(self):
+        route = Route(
+            'GET', '/test', lambda ignore: 'Test Done', threaded=True)
+        bound = route.bind('/prefix/test')
+        self.assertIsNot(route, bound)
+        self.assertEqual(route.url, '/test')
+        self.assertEqual(bound.match.pattern, '^/prefix/test$')
+        self.assertTrue(bound.threaded)
+
     def test_validate(self):
         route = Route('GET', '/test/<int:uderId>', lambda ignore: 'Test Done')
         route.compile()
@@ -556,7 +599,13 @@ class RouteTest(unittest.TestCase):
         with Stub() as dispatcher:
             dispatcher.url = '/test/102'
 
-        self.assertEqual(route.validate(dispatcher), route)
+        match = route.validate(dispatcher)
+        self.assertIsInstance(match, RouteMatch)
+        self.assertIs(match.route, route)
+        self.assertEqual(match.callback_args, {'uderId': 102})
+
+        # every validation returns its own match
+        self.assertIsNot(route.validate(dispatcher), match)
 
         with Stub() as dispatcher:
             dispatcher.url = '/test'
@@ -576,6 +625,65 @@ class RouteTest(unittest.TestCase):
         self.assertEqual(r(controller, None), 'User 102 10.1 test')
 
 
+class RouteTrieTest(unittest.TestCase):
+
+    def setUp(self):
+        self.trie = RouteTrie()
+
+    def insert(self, url, method='GET'):
+        route = Route(method, url, lambda ignore: 'Test Done')
+        route.compile()
+        self.trie.insert(route, method)
+        return route
+
+    def test_match_static_route(self):
+        route = self.insert('/test/static')
+        node, arguments = self.trie.match('/test/static', 'GET')
+        self.assertIs(node.routes['GET'], route)
+        self.assertEqual(arguments, {})
+
+    def test_match_root_route(self):
+        route = self.insert('')
+        node, _ = self.trie.match('', 'GET')
+        self.assertIs(node.routes['GET'], route)
+
+    def test_match_typed_routes_converts_arguments(self):
+        self.insert('/test/<int:user_id>/<float:amount>/<name>')
+        _, arguments = self.trie.match('/test/102/10.5/mamba', 'GET')
+        self.assertEqual(
+            arguments, {'user_id': 102, 'amount': 10.5, 'name': 'mamba'})
+        self.assertIsInstance(arguments['user_id'], int)
+
+    def test_match_static_segments_before_typed_ones(self):
+        typed = self.insert('/test/<name>')
+        static = self.insert('/test/static')
+        self.assertIs(self.trie.match('/test/static')[0].routes['GET'], static)
+        self.assertIs(self.trie.match('/test/other')[0].routes['GET'], typed)
+
+    def test_match_backtracks_to_typed_segments(self):
+        self.insert('/test/static')
+        route = self.insert('/test/<name>/more')
+        node, arguments = self.trie.match('/test/static/more', 'GET')
+        self.assertIs(node.routes['GET'], route)
+        self.assertEqual(arguments, {'name': 'static'})
+
+    def test_match_int_edges_before_string_ones(self):
+        self.insert('/test/<name>')
+        route = self.insert('/test/<int:user_id>')
+        self.assertIs(self.trie.match('/test/10')[0].routes['GET'], route)
+
+    def test_match_filters_by_method(self):
+        self.insert('/test/<int:user_id>', 'POST')
+        self.assertEqual(self.trie.match('/test/1', 'GET'), (None, None))
+        self.assertIsNotNone(self.trie.match('/test/1')[0])
+
+    def test_match_returns_none_on_unknown_urls(self):
+        self.insert('/test/<int:user_id>')
+        self.assertEqual(self.trie.match('/test/one'), (None, None))
+        self.assertEqual(self.trie.match('/test'), (None, None))
+        self.assertEqual(self.trie.match('/test/1/2'), (None, None))
+
+
 class RouterTest(unittest.TestCase):
 
     def tearDown(self):
@@ -629,6 +737,105 @@ class RouterTest(unittest.TestCase):
         result = yield controller.render(request)
         self.assertIsInstance(result, response.NotImplemented)
 
+    @defer.inlineCallbacks
+    def test_dispatch_route_not_implemented_adds_allow_header(self):
+
+        controller = StubController()
+        request = request_generator(['/test/102'], 'POST')
+
+        result = yield controller.render(request)
+        self.assertEqual(result.headers['allow'], 'GET, HEAD, OPTIONS')
+
+    @defer.inlineCallbacks
+    def test_dispatch_head_is_answered_from_get_route_without_body(self):
+
+        StubController.test2 = routes_generator({'name': 'mamba'})
+        request = request_generator(['/test2'], 'HEAD')
+
+        result = yield StubController().render(request)
+        self.assertIsInstance(result, response.Ok)
+        self.assertEqual(result.subject, '')
+        self.assertEqual(result.headers, {'content-type': 'application/json'})
+
+    @defer.inlineCallbacks
+    def test_dispatch_options_is_answered_without_calling_the_handler(self):
+
+        StubController.test2 = routes_generator(
+            'Test', method=['GET', 'POST'])
+        request = request_generator(['/test2'], 'OPTIONS')
+
+        result = yield StubController().render(request)
+        self.assertIsInstance(result, response.Ok)
+        self.assertEqual(result.subject, '')
+        self.assertEqual(result.headers['allow'], 'GET, HEAD, OPTIONS, POST')
+        self.assertFalse('access-control-allow-origin' in result.headers)
+
+    @defer.inlineCallbacks
+    def test_dispatch_cors_preflight_is_answered_from_allowed_methods(self):
+
+        app = config.Application()
+        cors = getattr(app, 'cors', None)
+        self.addCleanup(setattr, app, 'cors', cors)
+        app.cors = {'allow_origin': ['http://mamba.org'], 'max_age': 600}
+
+        StubController.test2 = routes_generator('Test', method='PUT')
+        request = request_generator(['/test2'], 'OPTIONS')
+        request.requestHeaders.setRawHeaders('origin', ['http://mamba.org'])
+        request.requestHeaders.setRawHeaders(
+            'access-control-request-headers', ['content-type'])
+
+        result = yield StubController().render(request)
+        self.assertEqual(result.headers['allow'], 'OPTIONS, PUT')
+        self.assertEqual(result.headers['access-control-allow-origin'],
+                         'http://mamba.org')
+        self.assertEqual(result.headers['access-control-allow-methods'],
+                         'OPTIONS, PUT')
+        self.assertEqual(result.headers['access-control-allow-headers'],
+                         'content-type')
+        self.assertEqual(result.headers['access-control-max-age'], '600')
+
+    @defer.inlineCallbacks
+    def test_dispatch_cors_origins_are_compared_exactly(self):
+
+        app = config.Application()
+        cors = getattr(app, 'cors', None)
+        self.addCleanup(setattr, app, 'cors', cors)
+        app.cors = {'allow_origin': 'https://app.example.com'}
+
+        StubController.test2 = routes_generator('Test', method='PUT')
+        request = request_generator(['/test2'], 'OPTIONS')
+        request.requestHeaders.setRawHeaders(
+            'origin', ['https://app.example.co'])
+
+        result = yield StubController().render(request)
+        self.assertFalse('access-control-allow-origin' in result.headers)
+
+    @defer.inlineCallbacks
+    def test_dispatch_adds_cors_headers_to_routed_responses(self):
+
+        app = config.Application()
+        cors = getattr(app, 'cors', None)
+        self.addCleanup(setattr, app, 'cors', cors)
+        app.cors = {
+            'allow_origin': ['http://mamba.org'], 'allow_credentials': True}
+
+        StubController.test2 = routes_generator('Test')
+        request = request_generator(['/test2'])
+        request.requestHeaders.setRawHeaders('origin', ['http://mamba.org'])
+
+        result = yield StubController().render(request)
+        self.assertEqual(result.subject, 'Test')
+        self.assertEqual(result.headers['access-control-allow-origin'],
+                         'http://mamba.org')
+        self.assertEqual(
+            result.headers['access-control-allow-credentials'], 'true')
+        self.assertEqual(result.headers['vary'], 'Origin')
+
+        request = request_generator(['/test2'])
+        request.requestHeaders.setRawHeaders('origin', ['http://evil.org'])
+        result = yield StubController().render(request)
+        self.assertFalse('access-control-allow-origin' in result.headers)
+
     @defer.inlineCallbacks
     def test_dispatch_route_reurns_text_plain_on_txt_returning_route(self):
 
@@ -651,6 +858,325 @@ class RouterTest(unittest.TestCase):
         self.assertEqual(result.subject, '<h1>HTML Text</h1>')
         self.assertEqual(result.headers, {'content-type': 'text/html'})
 
+    @defer.inlineCallbacks
+    def test_dispatch_route_uses_declared_content_type_on_strings(self):
+
+        @decoroute('/test2', content_type='text/csv')
+        def test2(self, request, **kwargs):
+            return '<a>,<b>'
+
+        StubController.test2 = test2
+        request = request_generator(['/test2'])
+
+        result = yield StubController().render(request)
+        self.assertEqual(result.subject, '<a>,<b>')
+        self.assertEqual(result.headers, {'content-type': 'text/csv'})
+
+    @defer.inlineCallbacks
+    def test_dispatch_route_negotiates_serializer_with_accept_header(self):
+
+        StubController.test2 = routes_generator(10)
+        request = request_generator(['/test2'])
+        request.requestHeaders.setRawHeaders(
+            'accept', ['application/xml, text/plain;q=0.5'])
+
+        result = yield StubController().render(request)
+        self.assertEqual(result.subject, '10')
+        self.assertEqual(
+            result.headers, {'content-type': 'text/plain; charset=utf-8'})
+
+    @defer.inlineCallbacks
+    def test_dispatch_route_uses_per_route_serializers(self):
+
+        class ReprSerializer(serializer.Serializer):
+            content_type = 'text/x-repr'
+
+            def serialize(self, obj):
+                return repr(obj)
+
+        @decoroute('/test2', serializers=[ReprSerializer()])
+        def test2(self, request, **kwargs):
+            return {'name': 'mamba'}
+
+        StubController.test2 = test2
+        request = request_generator(['/test2'])
+
+        result = yield StubController().render(request)
+        self.assertEqual(result.subject, "{'name': 'mamba'}")
+        self.assertEqual(result.headers, {'content-type': 'text/x-repr'})
+
+    @defer.inlineCallbacks
+    def test_dispatch_route_encodes_response_objects_without_headers(self):
+
+        StubController.test2 = routes_generator(response.Ok([1, 2, 3]))
+        request = request_generator(['/test2'])
+
+        result = yield StubController().render(request)
+        self.assertEqual(result.subject, '[1, 2, 3]')
+        self.assertEqual(result.headers, {'content-type': 'application/json'})
+        self.assertEqual(response.Ok().headers, {})
+
+    @defer.inlineCallbacks
+    def test_dispatch_etag_route_adds_etag_header(self):
+
+        @decoroute('/test2', etag=True)
+        def test2(self, request, **kwargs):
+            return {'name': 'mamba'}
+
+        StubController.test2 = test2
+        request = request_generator(['/test2'])
+
+        result = yield StubController().render(request)
+        self.assertEqual(result.code, 200)
+        self.assertEqual(
+            result.headers['etag'],
+            '"{}"'.format(hashlib.sha1(result.subject).hexdigest())
+        )
+
+    @defer.inlineCallbacks
+    def test_dispatch_etag_route_returns_304_on_matching_if_none_match(self):
+
+        @decoroute('/test2', etag=True)
+        def test2(self, request, **kwargs):
+            return response.Ok('Test', {'etag': 'v1'})
+
+        StubController.test2 = test2
+        request = request_generator(['/test2'])
+        request.requestHeaders.setRawHeaders('if-none-match', ['"v0", "v1"'])
+
+        result = yield StubController().render(request)
+        self.assertIsInstance(result, response.NotModified)
+        self.assertEqual(result.subject, '')
+        self.assertEqual(result.headers, {'etag': '"v1"'})
+
+    @defer.inlineCallbacks
+    def test_dispatch_validator_answers_304_without_calling_handler(self):
+
+        calls = []
+
+        def validator(self, request, **kwargs):
+            return 'v{}'.format(kwargs['user_id']), datetime(2013, 1, 1)
+
+        @decoroute('/test2/<int:user_id>', validator=validator)
+        def test2(self, request, **kwargs):
+            calls.append(kwargs)
+            return 'Test'
+
+        StubController.test2 = test2
+        request = request_generator(['/test2', '10'])
+        request.requestHeaders.setRawHeaders(
+            'if-modified-since', ['Tue, 01 Jan 2013 00:00:00 GMT'])
+
+        result = yield StubController().render(request)
+        self.assertIsInstance(result, response.NotModified)
+        self.assertEqual(calls, [])
+        self.assertEqual(result.headers['etag'], '"v10"')
+        self.assertEqual(
+            result.headers['last-modified'], 'Tue, 01 Jan 2013 00:00:00 GMT')
+
+        request = request_generator(['/test2', '10'])
+        request.requestHeaders.setRawHeaders('if-none-match', ['"v9"'])
+
+        result = yield StubController().render(request)
+        self.assertIsInstance(result, response.Ok)
+        self.assertEqual(calls, [{'user_id': 10}])
+        self.assertEqual(result.headers['etag'], '"v10"')
+
+    @defer.inlineCallbacks
+    def test_dispatch_etag_route_head_request_has_etag_and_no_body(self):
+
+        @decoroute('/test2', etag=True)
+        def test2(self, request, **kwargs):
+            return 'Test'
+
+        StubController.test2 = test2
+        request = request_generator(['/test2'], 'HEAD')
+
+        result = yield StubController().render(request)
+        self.assertEqual(result.subject, '')
+        self.assertEqual(
+            result.headers['etag'],
+            '"{}"'.format(hashlib.sha1('Test').hexdigest())
+        )
+
+    def _cached_route(self, **options):
+
+        calls = []
+
+        @decoroute('/test2', cache_ttl=10, **options)
+        def test2(self, request, **kwargs):
+            calls.append(request.args.get('page'))
+            return {'call': len(calls)}
+
+        StubController.test2 = test2
+        controller = StubController()
+        clock = Clock()
+        controller._router.response_cache.clock = clock.seconds
+        return controller, calls, clock
+
+    @defer.inlineCallbacks
+    def test_dispatch_cached_route_does_not_call_the_handler_on_hits(self):
+
+        controller, calls, clock = self._cached_route()
+
+        result = yield controller.render(request_generator(['/test2']))
+        self.assertEqual(result.subject, '{"call": 1}')
+
+        clock.advance(5)
+        result = yield controller.render(request_generator(['/test2']))
+        self.assertEqual(result.subject, '{"call": 1}')
+        self.assertEqual(result.headers['age'], '5')
+        self.assertEqual(len(calls), 1)
+
+        result = yield controller.render(request_generator(['/test2'], 'HEAD'))
+        self.assertEqual(result.subject, '')
+        self.assertEqual(len(calls), 1)
+
+        clock.advance(5)
+        result = yield controller.render(request_generator(['/test2']))
+        self.assertEqual(result.subject, '{"call": 2}')
+
+    @defer.inlineCallbacks
+    def test_dispatch_cached_route_varies_on_args_and_headers(self):
+
+        controller, calls, clock = self._cached_route(
+            vary=('accept',), vary_args=('page',))
+
+        for page in ('1', '2', '1'):
+            request = request_generator(['/test2'])
+            request.args = {'page': [page]}
+            result = yield controller.render(request)
+
+        self.assertEqual(calls, [['1'], ['2']])
+        self.assertEqual(result.headers['vary'], 'accept')
+
+        request = request_generator(['/test2'])
+        request.args = {'page': ['1']}
+        request.requestHeaders.setRawHeaders('accept', ['text/plain'])
+        yield controller.render(request)
+        self.assertEqual(len(calls), 3)
+
+    @defer.inlineCallbacks
+    def test_dispatch_cached_route_varies_on_query_and_accept(self):
+
+        controller, calls, clock = self._cached_route()
+
+        for page in ('1', '2', '1'):
+            request = request_generator(['/test2'])
+            request.args = {'page': [page]}
+            result = yield controller.render(request)
+
+        self.assertEqual(calls, [['1'], ['2']])
+        self.assertEqual(result.headers['vary'], 'Accept')
+
+        request = request_generator(['/test2'])
+        request.args = {'page': ['1']}
+        request.requestHeaders.setRawHeaders(
+            'accept', ['application/msgpack'])
+        yield controller.render(request)
+        self.assertEqual(len(calls), 3)
+
+    @defer.inlineCallbacks
+    def test_dispatch_cached_route_serves_stale_while_refreshing(self):
+
+        controller, calls, clock = self._cached_route(
+            stale_while_revalidate=10)
+
+        yield controller.render(request_generator(['/test2']))
+        clock.advance(15)
+
+        result = yield controller.render(request_generator(['/test2']))
+        self.assertEqual(result.subject, '{"call": 1}')
+        self.assertEqual(len(calls), 2)
+
+        result = yield controller.render(request_generator(['/test2']))
+        self.assertEqual(result.subject, '{"call": 2}')
+        stats = controller._router.response_cache.stats()
+        self.assertEqual(stats['stale_hits'], 1)
+
+    @defer.inlineCallbacks
+    def test_dispatch_records_route_metrics(self):
+
+        controller = StubController()
+        controller._router.metrics = MetricsRegistry()
+
+        yield controller.render(request_generator(['/test', '102']))
+        yield controller.render(request_generator(['/internal-server-error']))
+
+        metrics = controller._router.metrics.get(
+            'StubController', '/test/<int:user_id>', 'GET')
+        self.assertEqual(metrics.count, 1)
+        self.assertEqual(metrics.errors, 0)
+        self.assertEqual(metrics.bytes, len('User ID : 102'))
+
+        metrics = controller._router.metrics.get(
+            'StubController', '/internal-server-error', 'GET')
+        self.assertEqual(metrics.errors, 1)
+
+    @defer.inlineCallbacks
+    def test_dispatch_compresses_large_responses(self):
+
+        @decoroute('/test2', etag=True, compress=True)
+        def test2(self, request, **kwargs):
+            return [{'name': 'mamba'}] * 1000
+
+        StubController.test2 = test2
+        request = request_generator(['/test2'])
+        request.requestHeaders.setRawHeaders(
+            'accept-encoding', ['gzip, deflate'])
+
+        result = yield StubController().render(request)
+        self.assertEqual(result.headers['content-encoding'], 'gzip')
+        self.assertEqual(result.headers['vary'], 'Accept-Encoding')
+        self.assertTrue(result.headers['etag'].startswith('W/"'))
+        self.assertEqual(
+            json.loads(zlib.decompress(result.subject, 16 + zlib.MAX_WBITS)),
+            [{'name': 'mamba'}] * 1000
+        )
+
+    @defer.inlineCallbacks
+    def test_dispatch_does_not_compress_unless_enabled(self):
+
+        @decoroute('/test2')
+        def test2(self, request, **kwargs):
+            return [{'name': 'mamba'}] * 1000
+
+        StubController.test2 = test2
+        request = request_generator(['/test2'])
+        request.requestHeaders.setRawHeaders('accept-encoding', ['gzip'])
+
+        result = yield StubController().render(request)
+        self.assertFalse('content-encoding' in result.headers)
+        self.assertEqual(len(json.loads(result.subject)), 1000)
+
+    @defer.inlineCallbacks
+    def test_dispatch_does_not_compress_when_route_disables_it(self):
+
+        @decoroute('/test2', compress=False)
+        def test2(self, request, **kwargs):
+            return [{'name': 'mamba'}] * 1000
+
+        StubController.test2 = test2
+        request = request_generator(['/test2'])
+        request.requestHeaders.setRawHeaders('accept-encoding', ['gzip'])
+
+        result = yield StubController().render(request)
+        self.assertFalse('content-encoding' in result.headers)
+        self.assertEqual(len(json.loads(result.subject)), 1000)
+
+    @defer.inlineCallbacks
+    def test_dispatch_returns_streamed_response_on_generators(self):
+
+        @decoroute('/test2', content_type='text/csv')
+        def test2(self, request, **kwargs):
+            return ('{}\n'.format(i) for i in range(3))
+
+        StubController.test2 = test2
+        result = yield StubController().render(request_generator(['/test2']))
+        self.assertIsInstance(result, response.Streamed)
+        self.assertEqual(result.headers, {'content-type': 'text/csv'})
+        self.assertEqual(list(result.subject), ['0\n', '1\n', '2\n'])
+
     @defer.inlineCallbacks
     def test_defer_routing_methods(self):
 
@@ -672,7 +1198,7 @@ class RouterTest(unittest.TestCase):
         result = yield StubController().render(request)
         self.assertIsInstance(result, response.Ok)
         self.assertEqual(result.headers, {'content-type': 'application/json'})
-        self.assertEqual(result.subject, {
+        self.assertEqual(json.loads(result.subject), {
             'name': 'Person', 'interests': 'Testing', 'age': 30
         })
 
@@ -686,7 +1212,7 @@ class RouterTest(unittest.TestCase):
         result = yield StubController().render(request)
         self.assertIsInstance(result, response.Ok)
         self.assertEqual(result.headers, {'content-type': 'application/json'})
-        self.assertEqual(result.subject, {
+        self.assertEqual(json.loads(result.subject), {
             'name': 'Person', 'interests': 'Testing', 'age': 30
         })
 
@@ -716,10 +1242,15 @@ class RouterTest(unittest.TestCase):
         )
 
         controller = StubController()
+        dispatcher = RouteDispatcher(controller._router, controller, request)
+        match, _ = dispatcher.lookup()
+        dispatcher.parse_request_args(match)
+        self.assertEqual(match.callback_args, {'name': 'test'})
+        request.content.seek(0, 0)
 
         result = yield controller.render(request)
         self.assertIsInstance(result, response.Ok)
-        self.assertTrue('name' in controller.test2.route.callback_args)
+        self.assertFalse(hasattr(controller.test2.route, 'callback_args'))
 
     @defer.inlineCallbacks
     def test_dispatch_route_adds_form_parameters_on_put_request(self):
@@ -732,10 +1263,240 @@ class RouterTest(unittest.TestCase):
         request.content.write('name=test')
         request.content.seek(0, 0)
         controller = StubController()
+        dispatcher = RouteDispatcher(controller._router, controller, request)
+        match, _ = dispatcher.lookup()
+        dispatcher.parse_request_args(match)
+        self.assertEqual(match.callback_args, {'name': 'test'})
+        request.content.seek(0, 0)
+
+        result = yield controller.render(request)
+        self.assertIsInstance(result, response.Ok)
+
+    @defer.inlineCallbacks
+    def test_dispatch_threaded_route_runs_outside_reactor_thread(self):
+
+        Router.handler_pool = ThreadPool(1, 1, 'TestHandlerPool')
+        self.addCleanup(setattr, Router, 'handler_pool', None)
+        self.addCleanup(Router.handler_pool.stop)
+
+        @decoroute('/test2', threaded=True)
+        def test2(self, request, **kwargs):
+            return threading.current_thread().name
+
+        StubController.test2 = test2
+        request = request_generator(['/test2'])
+
+        result = yield StubController().render(request)
+        self.assertIsInstance(result, response.Ok)
+        self.assertNotEqual(result.subject, threading.current_thread().name)
+
+    @defer.inlineCallbacks
+    def test_dispatch_rejects_large_bodies_with_413(self):
+
+        @decoroute('/test2', method='POST', max_body_size=8)
+        def test2(self, request, **kwargs):
+            return 'Test'
+
+        StubController.test2 = test2
+        request = request_generator(['/test2'], method='POST')
+        request.content.write('{"name": "too large"}')
+        request.content.seek(0, 0)
+
+        result = yield StubController().render(request)
+        self.assertIsInstance(result, response.RequestEntityTooLarge)
+        self.assertEqual(result.code, 413)
+
+    @defer.inlineCallbacks
+    def test_dispatch_fails_with_504_when_the_deadline_is_exceeded(self):
+
+        pending = []
+
+        @decoroute('/test2', timeout=2)
+        def test2(self, request, **kwargs):
+            pending.append(defer.Deferred())
+            return pending[0]
+
+        StubController.test2 = test2
+        controller = StubController()
+        controller._router.clock = Clock()
+        result = controller.render(request_generator(['/test2']))
+
+        controller._router.clock.advance(2)
+        result = yield result
+        self.assertIsInstance(result, response.GatewayTimeout)
+        self.assertEqual(result.code, 504)
+        self.assertTrue(pending[0].called)
+
+    @defer.inlineCallbacks
+    def test_dispatch_makes_the_request_deadline_the_current_one(self):
+
+        @decoroute('/test2', timeout=2)
+        def test2(self, request, **kwargs):
+            return str(deadline.current() is request.deadline)
+
+        StubController.test2 = test2
+        result = yield StubController().render(request_generator(['/test2']))
+        self.assertEqual(result.subject, 'True')
+        self.assertIsNone(deadline.current())
+
+    @defer.inlineCallbacks
+    def test_dispatch_handlers_pass_the_deadline_after_yielding(self):
+
+        pending, deadlines = defer.Deferred(), []
+
+        class Transactor(object):
+
+            def run(self, function, *args, **kwargs):
+                kwargs.pop('async')
+                kwargs.pop('auto_commit')
+                deadlines.append(getattr(function, 'deadline', None))
+                return defer.maybeDeferred(function, *args, **kwargs)
+
+        worker = Worker()
+        worker.transactor = Transactor()
+
+        @decoroute('/test2', timeout=2)
+        @defer.inlineCallbacks
+        def test2(self, request, **kwargs):
+            yield pending
+            self.current = deadline.current()
+            result = yield worker.work(deadline=request.deadline)
+            defer.returnValue(result)
+
+        StubController.test2 = test2
+        controller = StubController()
+        controller._router.clock = Clock()
+        request = request_generator(['/test2'])
+        result = controller.render(request)
+
+        controller._router.clock.advance(1)
+        pending.callback(None)
+        result = yield result
+        self.assertEqual(result.subject, 'done')
+        self.assertIsNone(controller.current)
+        self.assertEqual(deadlines, [request.deadline])
+
+        request = request_generator(['/test', '102'])
+        yield controller.render(request)
+        self.assertIsNone(request.deadline)
+
+    @defer.inlineCallbacks
+    def test_dispatch_fails_with_503_when_the_work_is_dropped(self):
+
+        @decoroute('/test2', timeout=2)
+        def test2(self, request, **kwargs):
+            raise deadline.DeadlineExceeded(queued=True)
+
+        StubController.test2 = test2
+        result = yield StubController().render(request_generator(['/test2']))
+        self.assertIsInstance(result, response.ServiceUnavailable)
+        self.assertEqual(result.code, 503)
+
+    @defer.inlineCallbacks
+    def test_dispatch_rejects_requests_over_the_admission_limit(self):
+
+        pending = []
+
+        @decoroute('/test2')
+        def test2(self, request, **kwargs):
+            pending.append(defer.Deferred())
+            return pending[-1]
+
+        StubController.test2 = test2
+        controller = StubController()
+        controller.__admission__ = {'limit': 1, 'retry_after': 3}
+        first = controller.render(request_generator(['/test2']))
+
+        result = yield controller.render(request_generator(['/test2']))
+        self.assertIsInstance(result, response.ServiceUnavailable)
+        self.assertEqual(result.headers['retry-after'], '3')
+        self.assertEqual(len(pending), 1)
+
+        pending[0].callback('Test')
+        result = yield first
+        self.assertEqual(result.subject, 'Test')
+
+        second = controller.render(request_generator(['/test2']))
+        pending[1].callback('Test')
+        result = yield second
+        self.assertEqual(result.subject, 'Test')
+        self.assertEqual(
+            controller._router.admission.stats()['StubController']['rejected'],
+            1
+        )
+
+    @defer.inlineCallbacks
+    def test_dispatch_rate_limits_clients_with_429(self):
+
+        @decoroute('/test2', rate_limit={'rate': 1, 'burst': 1})
+        def test2(self, request, **kwargs):
+            return 'Test'
+
+        StubController.test2 = test2
+        controller = StubController()
 
+        result = yield controller.render(request_generator(['/test2']))
+        self.assertEqual(result.subject, 'Test')
+
+        result = yield controller.render(request_generator(['/test2']))
+        self.assertIsInstance(result, response.TooManyRequests)
+        self.assertEqual(result.code, 429)
+        self.assertEqual(result.headers['retry-after'], '1')
+
+    @defer.inlineCallbacks
+    def test_dispatch_does_not_read_the_body_of_rejected_requests(self):
+
+        class Content(object):
+            def __getattr__(self, name):
+                raise AssertionError('body read on rejected request')
+
+        @decoroute('/test2', method='POST', rate_limit=1)
+        def test2(self, request, **kwargs):
+            return 'Test'
+
+        StubController.test2 = test2
+        controller = StubController()
+        result = yield controller.render(
+            request_generator(['/test2'], method='POST'))
+        self.assertEqual(result.subject, 'Test')
+
+        request = request_generator(['/test2'], method='POST')
+        request.requestHeaders.setRawHeaders(
+            'content-type', ['application/json'])
+        request.content = Content()
         result = yield controller.render(request)
+        self.assertIsInstance(result, response.TooManyRequests)
+        self.assertFalse('_mamba_body' in request.__dict__)
+
+    @defer.inlineCallbacks
+    def test_dispatch_does_not_read_the_body_on_get_requests(self):
+
+        class Content(object):
+            def read(self, *args):
+                raise AssertionError('body read on GET request')
+
+        request = request_generator(['/test/102'])
+        request.content = Content()
+
+        result = yield StubController().render(request)
         self.assertIsInstance(result, response.Ok)
-        self.assertTrue('name' in controller.test2.route.callback_args)
+
+    @defer.inlineCallbacks
+    def test_dispatch_lazy_body_routes_dont_receive_body_arguments(self):
+
+        @decoroute('/test2', method='PUT', lazy_body=True)
+        def test2(self, request, **kwargs):
+            return kwargs
+
+        StubController.test2 = test2
+        request = request_generator(['/test2'], method='PUT')
+        request.content.write('{"name": "test"}')
+        request.content.seek(0, 0)
+        request.requestHeaders.setRawHeaders(
+            'content-type', ['application/json'])
+
+        result = yield StubController().render(request)
+        self.assertEqual(result.subject, '{}')
 
     def test_dispatch_returns_unknown_209_on_no_return_from_method(self):
 
@@ -848,7 +1609,8 @@ class RouterTest(unittest.TestCase):
 
         resp = router._process(FakeResult(), request)
         self.assertIsInstance(resp, response.Ok)
-        self.assertEqual(resp.subject, {'name': 'Test', 'type': 'JSON'})
+        self.assertEqual(
+            json.loads(resp.subject), {'name': 'Test', 'type': 'JSON'})
 
     def test_process_serialize_object_inside_objects(self):
 
@@ -867,7 +1629,7 @@ class RouterTest(unittest.TestCase):
 
         resp = router._process(FakeResult(), request)
         self.assertIsInstance(resp, response.Ok)
-        self.assertEqual(resp.subject, {
+        self.assertEqual(json.loads(resp.subject), {
             'data': {'pepe': '10.0', 'data': 'hdsihas8h9277t27gsj'},
             'name': 'Test'
         })
@@ -881,6 +1643,30 @@ class RouterTest(unittest.TestCase):
         self.assertIsInstance(resp, response.InternalServerError)
         self.assertEqual(resp.code, 500)
 
+    def test_process_error_invalid_cursor_is_bad_request(self):
+
+        router = Router()
+        request = request_generator('/test')
+
+        resp = router._process_error(
+            InvalidCursor('Invalid cursor'), request=request)
+        self.assertIsInstance(resp, response.BadRequest)
+        self.assertEqual(resp.code, 400)
+
+    def test_pages_are_serialized_as_dicts(self):
+
+        page = Page([DummyModel('Dummy')], 'WzFd')
+        self.assertEqual(json.loads(serializer.registry.get(
+            'application/json').serialize(page)), {
+                'items': [{'id': None, 'name': 'Dummy'}], 'cursor': 'WzFd'}
+        )
+
+    def test_rows_are_serialized_as_dicts(self):
+
+        row = get_model_info(DummyModel).row_type(['name'])(u'Dummy')
+        self.assertEqual(json.loads(serializer.registry.get(
+            'application/json').serialize([row])), [{'name': 'Dummy'}])
+
 
 class TestRouteDispatcher(unittest.TestCase):
 
@@ -899,7 +1685,7 @@ class TestRouteDispatcher(unittest.TestCase):
         router.install_routes(controller)
         route_dispatcher = RouteDispatcher(router, controller, request)
 
-        self.assertIsInstance(route_dispatcher.lookup()[0], Route)
+        self.assertIsInstance(route_dispatcher.lookup()[0], RouteMatch)
 
     def test_lookup_returns_none_on_invalid_controller_or_router(self):
 
@@ -919,6 +1705,80 @@ class TestRouteDispatcher(unittest.TestCase):
 
         self.assertEqual(route_dispatcher.lookup()[0], 'NotImplemented')
 
+    def test_lookup_caches_positive_and_negative_outcomes(self):
+
+        controller = StubController()
+        router = Router()
+        router.install_routes(controller)
+
+        for url in (['test', '102'], ['test', '102'], ['unknown']):
+            RouteDispatcher(
+                router, controller, request_generator(url)).lookup()
+
+        RouteDispatcher(
+            router, controller, request_generator(['unknown'])).lookup()
+        RouteDispatcher(
+            router, controller, request_generator(['test', '102'], 'POST')
+        ).lookup()
+        route, _ = RouteDispatcher(
+            router, controller, request_generator(['test', '102'], 'POST')
+        ).lookup()
+
+        self.assertEqual(route, 'NotImplemented')
+        self.assertEqual(router.dispatch_cache.hits, 3)
+        self.assertEqual(router.dispatch_cache.misses, 3)
+
+    def test_lookup_cache_dont_share_arguments_between_requests(self):
+
+        controller = StubController()
+        router = Router()
+        router.install_routes(controller)
+        request = request_generator(['test', '102'])
+        request.args = {'name': ['mamba']}
+        dispatcher = RouteDispatcher(router, controller, request)
+        route, _ = dispatcher.lookup()
+        dispatcher.parse_request_args(route)
+        self.assertEqual(
+            route.callback_args, {'user_id': 102, 'name': 'mamba'})
+
+        request = request_generator(['test', '102'])
+        dispatcher = RouteDispatcher(router, controller, request)
+        route, _ = dispatcher.lookup()
+        dispatcher.parse_request_args(route)
+        self.assertEqual(route.callback_args, {'user_id': 102})
+
+    def test_register_route_invalidates_dispatch_cache(self):
+
+        controller = StubController()
+        router = Router()
+        router.install_routes(controller)
+        RouteDispatcher(
+            router, controller, request_generator(['another'])).lookup()
+        self.assertEqual(len(router.dispatch_cache), 1)
+
+        route = Route('GET', '/another', controller.test)
+        route.compile()
+        router.register_route(controller, route, 'another')
+        self.assertEqual(len(router.dispatch_cache), 0)
+
+        match, _ = RouteDispatcher(
+            router, controller, request_generator(['another'])).lookup()
+        self.assertIs(match.route, route)
+
+    def test_lookup_returns_route_from_children(self):
+
+        controller = StubController()
+        child = ChildStubController()
+        controller.children['child'] = child
+        request = request_generator(['child', 'test', '102'])
+        router = Router()
+        router.install_routes(controller)
+        router.install_routes(child)
+        route, found = RouteDispatcher(router, controller, request).lookup()
+
+        self.assertIs(found, child)
+        self.assertEqual(route.callback_args, {'child_id': 102})
+
 
 class Collaborator(object):
 
@@ -961,6 +1821,22 @@ class StubController(object):
         pass
 
 
+class ChildStubController(object):
+
+    __parent__ = 'stub'
+
+    def __init__(self):
+        self.path = ''
+        self.children = {}
+
+    def get_register_path(self):
+        return 'child'
+
+    @decoroute('/test/<int:child_id>')
+    def test(self, request, child_id, **kwargs):
+        return 'Child ID : {}'.format(child_id)
+
+
 def routes_generator(retval, method='GET'):
 
     @decoroute('/test2', method=method)
@@ -0,0 +1,110 @@
+# -*- test-case-name: mamba.test.test_deadline -*-
+# Copyright (c) 2012 - 2013 Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+.. module:: deadline
+    :platform: Unix, Windows
+    :synopsis: Request deadlines propagated to the database work
+
+.. moduleauthor:: Oscar Campos <oscar.campos@member.fsf.org>
+
+"""
+
+import time
+
+from twisted.python import context
+
+
+class DeadlineExceeded(Exception):
+    """
+    Fired when some work can not be done before the deadline of the request
+    that asked for it, `queued` is True if the work was dropped before it
+    even started (it waited too long in a queue)
+    """
+
+    def __init__(self, message='Deadline exceeded', queued=False):
+        super(DeadlineExceeded, self).__init__(message)
+        self.queued = queued
+
+
+class Deadline(object):
+    """
+    I am the point in time when the work of a request stops being useful.
+
+    The router sets me as the `deadline` attribute of the requests of the
+    routes with a timeout and makes me the current deadline while their
+    handler is called, the database work started from there finds me with
+    :func:`current` and gives up as soon as I expire. The current deadline
+    only lasts for the synchronous part of the handler, the work started
+    once it has yielded (or from a callback) must be given the deadline
+    explicitly (``deadline=request.deadline``)::
+
+        deadline = Deadline(2.5)
+        deadline.remaining()  # seconds left
+        deadline.check()      # raises DeadlineExceeded once expired
+
+    :param timeout: the time budget in seconds
+    :type timeout: float
+    :param clock: a callable that returns the current time in seconds
+    :type clock: callable
+    """
+
+    __slots__ = ('timeout', 'expires', 'clock')
+
+    def __init__(self, timeout, clock=time.time):
+        self.timeout = timeout
+        self.clock = clock
+        self.expires = clock() + timeout
+
+    @property
+    def expired(self):
+        """True if the deadline has been reached
+        """
+
+        return self.clock() >= self.expires
+
+    def remaining(self):
+        """Return the remaining seconds until the deadline (never negative)
+        """
+
+        return max(self.expires - self.clock(), 0)
+
+    def check(self, queued=False):
+        """
+        Raise :class:`DeadlineExceeded` if the deadline has been reached
+
+        :param queued: True if the work that checks has not started yet
+        :type queued: bool
+        """
+
+        if self.expired:
+            raise DeadlineExceeded(
+                'Deadline of {}s exceeded'.format(self.timeout), queued)
+
+    def __repr__(self):
+        return 'Deadline({!r}, expires={!r})'.format(
+            self.timeout, self.expires)
+
+
+def current():
+    """Return the deadline of the current call context or None
+    """
+
+    return context.get(Deadline)
+
+
+def call(deadline, function, *args, **kwargs):
+    """
+    Call the given function with the given deadline as the current one
+
+    :param deadline: the deadline
+    :type deadline: :class:`~mamba.utils.deadline.Deadline`
+    :param function: the function to call
+    :type function: callable
+    """
+
+    return context.call({Deadline: deadline}, function, *args, **kwargs)
+
+
+__all__ = ['Deadline', 'DeadlineExceeded', 'current', 'call']
@@ -0,0 +1,135 @@
+# -*- test-case-name: mamba.test.test_lru -*-
+# Copyright (c) 2012 - 2013 Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+.. module:: lru
+    :platform: Unix, Windows
+    :synopsis: Bounded Least Recently Used cache
+
+.. moduleauthor:: Oscar Campos <oscar.campos@member.fsf.org>
+
+"""
+
+import time
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Bounded Least Recently Used cache that counts its hits and misses.
+
+    When the cache is full, the least recently used entry is evicted to
+    make room for the new one. Usage example::
+
+        cache = LRUCache(maxsize=2)
+        cache.set('one', 1)
+        cache.set('two', 2)
+        cache.get('one')     # 'one' is now the most recently used
+        cache.set('three', 3)  # 'two' is evicted
+
+    If `ttl` is given the entries also expire `ttl` seconds after they
+    were stored, expired entries are dropped when they are looked up.
+
+    .. note::
+
+        The cache is not thread safe, it is meant to be used from the
+        reactor thread
+
+    :param maxsize: the maximum number of entries in the cache
+    :type maxsize: int
+    :param ttl: seconds that the entries live (forever if None)
+    :type ttl: float
+    :param clock: a callable that returns the current time in seconds
+    :type clock: callable
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._expires = {}
+
+    def get(self, key, default=None):
+        """
+        Return the value for the given key marking it as the most recently
+        used one or default if the key is not in the cache
+
+        :param key: the key to lookup for
+        :param default: the value to return on cache misses
+        """
+
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+
+        if self.ttl is not None and self._expires[key] <= self.clock():
+            del self._expires[key]
+            self.misses += 1
+            return default
+
+        self._entries[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """
+        Store the given value for the given key evicting the least recently
+        used entries if the cache is full
+
+        :param key: the key to store
+        :param value: the value to store
+        """
+
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        if self.ttl is not None:
+            self._expires[key] = self.clock() + self.ttl
+
+        while len(self._entries) > self.maxsize:
+            evicted, _ = self._entries.popitem(False)
+            self._expires.pop(evicted, None)
+
+    def invalidate(self, key):
+        """Remove the given key from the cache (if present)
+        """
+
+        self._entries.pop(key, None)
+        self._expires.pop(key, None)
+
+    def clear(self):
+        """Remove all the entries from the cache
+        """
+
+        self._entries.clear()
+        self._expires.clear()
+
+    def stats(self):
+        """Return back a dict with the cache size, hits and misses
+        """
+
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return 'LRUCache({})'.format(', '.join(
+            map(repr, [self.maxsize, len(self._entries)]))
+        )
+
+
+__all__ = ['LRUCache']
@@ -9,11 +9,22 @@ Subpackage containing the modules that implement web stuff for projects
 from twisted.web.server import NOT_DONE_YET
 
 from page import Page
-from routing import Router, Route, RouteDispatcher
+from cache import ResponseCache
+from metrics import MetricsRegistry, MetricsResource
+from admission import AdmissionControl, ConcurrencyLimiter
+from ratelimit import RateLimiter
+from compression import CompressionPolicy
+from routing import Router, Route, RouteMatch, RouteDispatcher
 from script import Script, ScriptManager, ScriptError
+from serializer import (
+    Serializer, SerializerRegistry, JSONSerializer, MsgpackSerializer,
+    PlainTextSerializer
+)
 from response import (
     Response, NotFound, NotImplemented, Ok, InternalServerError,
-    BadRequest, Conflict, AlreadyExists, Found, Unauthorized
+    BadRequest, Conflict, AlreadyExists, Found, Unauthorized,
+    RequestEntityTooLarge, NotModified, Streamed, StreamedJSON,
+    ServiceUnavailable, GatewayTimeout, TooManyRequests
 )
 from stylesheet import (
     Stylesheet, StylesheetError, InvalidFile, InvalidFileExtension,
@@ -24,10 +35,16 @@ from websocket import WebSocketError, WebSocketProtocol, WebSocketFactory
 
 
 __all__ = [
-    'Page',
-    'Router', 'Route', 'RouteDispatcher',
+    'Page', 'ResponseCache', 'MetricsRegistry', 'MetricsResource',
+    'AdmissionControl', 'ConcurrencyLimiter', 'RateLimiter',
+    'CompressionPolicy',
+    'Router', 'Route', 'RouteMatch', 'RouteDispatcher',
     'Response', 'NotFound', 'NotImplemented', 'Ok', 'InternalServerError',
     'BadRequest', 'Conflict', 'AlreadyExists', 'Found', 'Unauthorized',
+    'RequestEntityTooLarge', 'NotModified', 'Streamed', 'StreamedJSON',
+    'ServiceUnavailable', 'GatewayTimeout', 'TooManyRequests',
+    'Serializer', 'SerializerRegistry', 'JSONSerializer', 'MsgpackSerializer',
+    'PlainTextSerializer',
     'Script', 'ScriptManager', 'ScriptError',
     'Stylesheet', 'StylesheetError', 'InvalidFile', 'InvalidFileExtension',
     'FileDontExists',
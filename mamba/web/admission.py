@@ -0,0 +1,334 @@
+# -*- test-case-name: mamba.test.test_admission -*-
+# Copyright (c) 2012 - 2013 Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+.. module: admission
+    :platform: Unix, Windows
+    :synopsis: Admission control and load shedding for routed requests
+
+.. moduleauthor:: Oscar Campos <oscar.campos@member.fsf.org>
+"""
+
+import functools
+from collections import deque
+
+from twisted.internet import defer
+
+from mamba.utils import config
+from mamba.web.metrics import _escape, _sample
+
+
+class AdmissionRejected(Exception):
+    """
+    Fired when a request is rejected because there is no room for it,
+    `retry_after` is the number of seconds that the client should wait
+    before trying again
+    """
+
+    def __init__(self, message='Too many requests', retry_after=1):
+        super(AdmissionRejected, self).__init__(message)
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter(object):
+    """
+    I limit the number of requests in flight, requests over the limit wait
+    in a bounded queue and the ones that don't fit in the queue are
+    rejected immediately so they never pile up behind the database pool.
+
+    In adaptive mode the limit is adjusted with AIMD using the observed
+    latency as gradient: it grows by one every `limit` requests that
+    complete faster than the target latency and it shrinks multiplying it
+    by `backoff` when a request is slower (or fails for being overloaded).
+    The target latency is `tolerance` times the minimum latency observed
+    in the last `window` requests unless a fixed `target_latency` is given
+
+    :param limit: the (initial) maximum number of requests in flight
+    :type limit: int
+    :param queue_size: the maximum number of requests waiting for room
+    :type queue_size: int
+    :param adaptive: if True the limit adapts to the observed latency
+    :type adaptive: bool
+    :param min_limit: the adaptive limit never goes below this
+    :type min_limit: int
+    :param max_limit: the adaptive limit never goes above this
+    :type max_limit: int
+    :param tolerance: latencies up to this times the minimum are fine
+    :type tolerance: float
+    :param target_latency: fixed target latency in seconds (optional)
+    :type target_latency: float
+    :param backoff: the limit is multiplied by this when overloaded
+    :type backoff: float
+    :param window: requests used to estimate the minimum latency
+    :type window: int
+    :param retry_after: seconds sent in the Retry-After header of rejects
+    :type retry_after: int
+    """
+
+    def __init__(self, limit=100, queue_size=0, adaptive=False, min_limit=1,
+                 max_limit=1000, tolerance=2.0, target_latency=None,
+                 backoff=0.9, window=100, retry_after=1):
+        self.limit = float(limit)
+        self.queue_size = queue_size
+        self.adaptive = adaptive
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.window = window
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._queue = deque()
+        self._min_latency = None
+        self._window_min = None
+        self._samples = 0
+
+    @property
+    def current_limit(self):
+        """The number of requests that can be in flight right now
+        """
+
+        return max(int(self.limit), self.min_limit)
+
+    @property
+    def queued(self):
+        """The number of requests waiting for room
+        """
+
+        return len(self._queue)
+
+    def acquire(self):
+        """
+        Return a Deferred that fires when the request is admitted (right
+        now if there is room for it), raises
+        :class:`~mamba.web.admission.AdmissionRejected` if the request
+        does not even fit in the queue. Every admitted request must be
+        released with :meth:`release`
+        """
+
+        if self.in_flight < self.current_limit and not self._queue:
+            self.in_flight += 1
+            self.admitted += 1
+            return defer.succeed(None)
+
+        if len(self._queue) < self.queue_size:
+            waiting = defer.Deferred(self._queue.remove)
+            self._queue.append(waiting)
+            return waiting
+
+        self.rejected += 1
+        raise AdmissionRejected(
+            'Too many requests in flight ({})'.format(self.in_flight),
+            self.retry_after
+        )
+
+    def release(self, latency=None, overloaded=False):
+        """
+        Release an admitted request and admit the queued ones that fit
+
+        :param latency: the request latency in seconds (if it completed)
+        :type latency: float
+        :param overloaded: True if the request failed for being overloaded
+        :type overloaded: bool
+        """
+
+        if self.adaptive:
+            self._adapt(latency, overloaded)
+
+        self.in_flight -= 1
+        while self._queue and self.in_flight < self.current_limit:
+            self.in_flight += 1
+            self.admitted += 1
+            self._queue.popleft().callback(None)
+
+    def stats(self):
+        """
+        Return back a dict with the current limit, requests in flight and
+        queued and the admitted and rejected counters
+        """
+
+        return {
+            'limit': self.current_limit,
+            'in_flight': self.in_flight,
+            'queued': len(self._queue),
+            'queue_size': self.queue_size,
+            'admitted': self.admitted,
+            'rejected': self.rejected
+        }
+
+    def _adapt(self, latency, overloaded):
+        """Adjust the limit with the outcome of a request (AIMD)
+        """
+
+        if latency is not None:
+            if self._window_min is None or latency < self._window_min:
+                self._window_min = latency
+            if self._min_latency is None or latency < self._min_latency:
+                self._min_latency = latency
+
+            self._samples += 1
+            if self._samples >= self.window:
+                # forget old minimums so the target follows the backend
+                self._min_latency, self._window_min = self._window_min, None
+                self._samples = 0
+
+        target = self.target_latency
+        if target is None and self._min_latency is not None:
+            target = self._min_latency * self.tolerance
+
+        if overloaded or (
+                latency is not None and target is not None
+                and latency > target):
+            self.limit = max(self.limit * self.backoff, self.min_limit)
+        elif latency is not None and self.in_flight * 2 >= self.limit:
+            # only grow if the current limit is actually being used
+            self.limit = min(self.limit + 1.0 / self.limit, self.max_limit)
+
+    def __repr__(self):
+        return 'ConcurrencyLimiter({})'.format(', '.join(
+            map(repr, [self.current_limit, self.queue_size, self.adaptive]))
+        )
+
+
+class AdmissionControl(object):
+    """
+    I admit routed requests through a global
+    :class:`~mamba.web.admission.ConcurrencyLimiter` and a per controller
+    one, both optional. The global one is configured with the `admission`
+    option in the `application.json` file::
+
+        "admission": {"limit": 200, "queue_size": 100, "adaptive": true}
+
+    and the per controller ones with the `__admission__` class attribute
+    of the controller (same options)::
+
+        class Reports(Controller):
+            __admission__ = {'limit': 10, 'retry_after': 5}
+
+    :param options: the global limiter options (no global limit if None)
+    :type options: dict
+    """
+
+    def __init__(self, options=None):
+        self.limiter = None
+        if options is not None:
+            self.limiter = ConcurrencyLimiter(**options)
+        self.limiters = {}
+
+    @classmethod
+    def from_config(cls):
+        """Build the admission control from the `application.json` file
+        """
+
+        return cls(getattr(config.Application(), 'admission', None))
+
+    def get(self, controller):
+        """Return the limiter of the given controller or None
+        """
+
+        name = controller.__class__.__name__
+        try:
+            return self.limiters[name]
+        except KeyError:
+            options = getattr(controller, '__admission__', None)
+            limiter = None
+            if options is not None:
+                limiter = ConcurrencyLimiter(**options)
+            self.limiters[name] = limiter
+            return limiter
+
+    def acquire(self, controller):
+        """
+        Admit a request for the given controller, returns None if there
+        is no limit at all or a Deferred that fires with the callable that
+        releases the request (it accepts the same arguments than
+        :meth:`ConcurrencyLimiter.release`) or fails with
+        :class:`~mamba.web.admission.AdmissionRejected`
+        """
+
+        limiters = [
+            limiter for limiter in (self.limiter, self.get(controller))
+            if limiter is not None
+        ]
+        if not limiters:
+            return None
+
+        return self._acquire(limiters, [])
+
+    def _acquire(self, limiters, acquired):
+        """Acquire the given limiters in order
+        """
+
+        if len(acquired) == len(limiters):
+            return defer.succeed(functools.partial(self._release, acquired))
+
+        limiter = limiters[len(acquired)]
+        try:
+            admitted = limiter.acquire()
+        except AdmissionRejected as error:
+            self._release(acquired)
+            return defer.fail(error)
+
+        def failed(failure):
+            # cancelled while queued
+            self._release(acquired)
+            return failure
+
+        return admitted.addCallbacks(
+            lambda _: self._acquire(limiters, acquired + [limiter]), failed)
+
+    def _release(self, acquired, latency=None, overloaded=False):
+        for limiter in acquired:
+            limiter.release(latency, overloaded)
+
+    def stats(self):
+        """
+        Return back a dict with the stats of every limiter, the global one
+        is under the `global` key
+        """
+
+        stats = dict(
+            (name, limiter.stats())
+            for name, limiter in self.limiters.iteritems()
+            if limiter is not None
+        )
+        if self.limiter is not None:
+            stats['global'] = self.limiter.stats()
+
+        return stats
+
+    def collect(self):
+        """Return the limiters stats as Prometheus text format lines
+        """
+
+        metrics = (
+            ('limit', 'gauge', 'Requests that can be in flight'),
+            ('in_flight', 'gauge', 'Requests in flight'),
+            ('queued', 'gauge', 'Requests waiting for room'),
+            ('admitted', 'counter', 'Requests admitted'),
+            ('rejected', 'counter', 'Requests rejected with a 503')
+        )
+        stats = self.stats()
+        lines = []
+        for key, kind, description in metrics:
+            name = 'mamba_admission_{}'.format(key)
+            if kind == 'counter':
+                name += '_total'
+            lines.extend([
+                '# HELP {} {}'.format(name, description),
+                '# TYPE {} {}'.format(name, kind)
+            ])
+            for limiter in sorted(stats):
+                lines.append(_sample(
+                    name, 'limiter="{}"'.format(_escape(limiter)),
+                    stats[limiter][key]
+                ))
+
+        return lines
+
+
+__all__ = ['AdmissionRejected', 'ConcurrencyLimiter', 'AdmissionControl']
@@ -0,0 +1,253 @@
+# -*- test-case-name: mamba.test.test_body -*-
+# Copyright (c) 2012 - 2013 Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+.. module: body
+    :platform: Unix, Windows
+    :synopsis: Lazy access to HTTP request bodies
+
+.. moduleauthor:: Oscar Campos <oscar.campos@member.fsf.org>
+"""
+
+import json  # use standard library json here, we need raw_decode
+
+from twisted.web.http import parse_qs
+
+
+class RequestBodyTooLarge(Exception):
+    """Fired when a request body is bigger than the allowed size
+    """
+
+
+class RequestBody(object):
+    """
+    I give lazy access to the body of a request, the body (that Twisted
+    has already buffered in `request.content`) is never read from there
+    until some of my attributes are accessed and then the outcome is cached
+    so the body is parsed only once per request.
+
+    :param request: the HTTP request
+    :type request: :class:`twisted.web.server.Request`
+    :param max_size: the maximum allowed size of the body in bytes
+    :type max_size: int
+    """
+
+    chunk_size = 65536
+
+    def __init__(self, request, max_size=None):
+        self.request = request
+        self.max_size = max_size
+        self._data = None
+        self._json = None
+        self._form = None
+
+    @property
+    def size(self):
+        """
+        Return the body size using the Content-Length header if present,
+        the body is never read to calculate it
+        """
+
+        length = self.request.getHeader('content-length')
+        if length is not None:
+            try:
+                return int(length)
+            except ValueError:
+                pass
+
+        content = self.request.content
+        if content is None:
+            return 0
+
+        position = content.tell()
+        content.seek(0, 2)
+        size = content.tell()
+        content.seek(position, 0)
+        return size
+
+    @property
+    def content_type(self):
+        """Return the request content type (if any)
+        """
+
+        return self.request.getHeader('content-type') or ''
+
+    def check_size(self):
+        """
+        Raise :class:`~mamba.web.body.RequestBodyTooLarge` if the body is
+        bigger than the maximum allowed size
+        """
+
+        if self.max_size is not None and self.size > self.max_size:
+            raise RequestBodyTooLarge(
+                'Request body is larger than {} bytes'.format(self.max_size)
+            )
+
+    def read(self):
+        """Read and return the full body (it is read only once)
+        """
+
+        if self._data is None:
+            self.check_size()
+            content = self.request.content
+            if content is None:
+                self._data = ''
+            else:
+                content.seek(0, 0)
+                self._data = content.read()
+
+        return self._data
+
+    @property
+    def json(self):
+        """
+        Return the JSON decoded body, an empty dict is returned if the body
+        is not valid JSON or the content type is not application/json
+        """
+
+        if self._json is None:
+            self._json = {}
+            if 'application/json' in self.content_type:
+                try:
+                    self._json = json.loads(self.read())
+                except ValueError:
+                    pass
+
+        return self._json
+
+    @property
+    def form(self):
+        """
+        Return the form arguments, for POST requests Twisted has already
+        parsed them, for others we parse the body if it is form encoded
+        """
+
+        if self._form is None:
+            if self.request.method == 'POST':
+                self._form = self.request.args
+            elif 'application/x-www-form-urlencoded' in self.content_type:
+                self._form = parse_qs(self.read(), 1)
+            else:
+                self._form = {}
+
+        return self._form
+
+    def iter_json(self):
+        """
+        Decode a JSON array body incrementally yielding its elements one by
+        one, the body is read in chunks so large arrays are never fully
+        loaded in memory. If the body is not an array, the decoded value is
+        yielded as the single element
+        """
+
+        self.check_size()
+        content = self.request.content
+        content.seek(0, 0)
+        decoder = json.JSONDecoder()
+        buf, eof = self._read_chunk(content, '')
+        buf = buf.lstrip()
+
+        if not buf.startswith('['):
+            buf += content.read()
+            yield decoder.decode(buf)
+            return
+
+        buf = buf[1:]
+        while True:
+            buf = buf.lstrip().lstrip(',').lstrip()
+            while not buf and not eof:
+                buf, eof = self._read_chunk(content, buf)
+                buf = buf.lstrip().lstrip(',').lstrip()
+
+            if buf.startswith(']'):
+                return
+
+            if not buf:
+                raise ValueError('Unterminated JSON array')
+
+            try:
+                value, end = decoder.raw_decode(buf)
+            except ValueError:
+                if eof:
+                    raise
+                buf, eof = self._read_chunk(content, buf)
+                continue
+
+            if end == len(buf) and not eof:
+                # the value may be cut in the middle of a chunk (numbers)
+                buf, eof = self._read_chunk(content, buf)
+                continue
+
+            buf = buf[end:]
+            yield value
+
+    def _read_chunk(self, content, buf):
+        """Read a new chunk appending it to the given buffer
+        """
+
+        chunk = content.read(self.chunk_size)
+        return buf + chunk, len(chunk) < self.chunk_size
+
+
+class LazyBodyAttribute(object):
+    """
+    Non data descriptor that exposes a :class:`~mamba.web.body.RequestBody`
+    attribute in the request object and caches it in the request instance
+    so it is computed only once (values set explicitly on the request take
+    precedence over the descriptor)
+
+    :param name: the name of the RequestBody attribute
+    :type name: str
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, request, owner=None):
+        if request is None:
+            return self
+
+        value = getattr(get_body(request), self.name)
+        request.__dict__[self.name] = value
+        return value
+
+
+def get_body(request, max_size=None):
+    """
+    Return the :class:`~mamba.web.body.RequestBody` for the given request
+    creating it if needed
+
+    :param request: the HTTP request
+    :type request: :class:`twisted.web.server.Request`
+    :param max_size: the maximum allowed size of the body in bytes
+    :type max_size: int
+    """
+
+    body = request.__dict__.get('_mamba_body')
+    if body is None:
+        body = RequestBody(request, max_size)
+        request.__dict__['_mamba_body'] = body
+    elif max_size is not None:
+        body.max_size = max_size
+
+    return body
+
+
+def patch_request(klass):
+    """
+    Add lazy `json` and `form` attributes to the given request class
+
+    :param klass: the request class to patch
+    :type klass: :class:`twisted.web.http.Request`
+    """
+
+    for name in ('json', 'form'):
+        if not isinstance(getattr(klass, name, None), LazyBodyAttribute):
+            setattr(klass, name, LazyBodyAttribute(name))
+
+
+__all__ = [
+    'RequestBodyTooLarge', 'RequestBody', 'LazyBodyAttribute',
+    'get_body', 'patch_request'
+]
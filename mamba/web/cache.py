@@ -0,0 +1,260 @@
+# -*- test-case-name: mamba.test.test_cache -*-
+# Copyright (c) 2012 - 2013 Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+.. module: cache
+    :platform: Unix, Windows
+    :synopsis: In process HTTP response cache
+
+.. moduleauthor:: Oscar Campos <oscar.campos@member.fsf.org>
+"""
+
+import time
+from collections import OrderedDict
+
+
+class CacheEntry(object):
+    """
+    I am a cached response, I keep the encoded body and the headers so
+    they can be sent back without calling the route handler
+
+    :param code: the HTTP response code
+    :type code: int
+    :param subject: the encoded response body
+    :type subject: str
+    :param headers: the HTTP response headers
+    :type headers: dict
+    :param created: the time when the response was cached
+    :type created: float
+    :param ttl: time in seconds that the entry is fresh
+    :type ttl: float
+    :param stale: time in seconds that the entry can be served once expired
+    :type stale: float
+    """
+
+    __slots__ = (
+        'code', 'subject', 'headers', 'created', 'expires', 'stale_until',
+        'refreshing', 'size'
+    )
+
+    def __init__(self, code, subject, headers, created, ttl, stale=0):
+        self.code = code
+        self.subject = subject
+        self.headers = headers
+        self.created = created
+        self.expires = created + ttl
+        self.stale_until = self.expires + stale
+        self.refreshing = False
+        self.size = len(subject) + sum(
+            len(str(k)) + len(str(v)) for k, v in headers.iteritems()
+        )
+
+    def age(self, now):
+        """Return the age in seconds of the entry
+        """
+
+        return int(now - self.created)
+
+    def __repr__(self):
+        return 'CacheEntry({})'.format(', '.join(
+            map(repr, [self.code, self.size, self.expires]))
+        )
+
+
+class ResponseCache(object):
+    """
+    I am a Least Recently Used cache of HTTP responses bounded by the size
+    in bytes of the responses that I hold.
+
+    Expired entries can still be served during their stale-while-revalidate
+    window, :meth:`lookup` tells the caller when an entry is stale so it can
+    refresh it in background.
+
+    :param maxbytes: the maximum size of the cached responses in bytes
+    :type maxbytes: int
+    :param clock: a callable that returns the current time in seconds
+    :type clock: callable
+    """
+
+    FRESH = 'fresh'
+    STALE = 'stale'
+
+    def __init__(self, maxbytes=64 * 1024 * 1024, clock=time.time):
+        self.maxbytes = maxbytes
+        self.clock = clock
+        self.bytes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def make_key(controller, url, request, vary=(), vary_args=None):
+        """
+        Build the cache key for a request. The Accept header (it chooses
+        the serializer of the response) and the given request headers are
+        part of the key and so are all the request arguments unless the
+        ones that the response varies on are given
+
+        :param controller: the controller name
+        :type controller: str
+        :param url: the sanitized URL
+        :type url: str
+        :param request: the HTTP request
+        :type request: :class:`twisted.web.server.Request`
+        :param vary: the request headers that the response varies on
+        :type vary: tuple
+        :param vary_args: the request arguments that the response varies
+            on, all of them if None
+        :type vary_args: tuple
+        """
+
+        args = request.args or {}
+        if vary_args is None:
+            query = tuple(sorted(
+                (arg, tuple(values)) for arg, values in args.iteritems()))
+        else:
+            query = tuple(tuple(args.get(arg, ())) for arg in vary_args)
+
+        headers = ('accept',) + tuple(
+            header for header in vary if header.lower() != 'accept')
+        return (
+            controller, url,
+            tuple(request.getHeader(header) for header in headers), query
+        )
+
+    def lookup(self, key):
+        """
+        Return a tuple with the entry for the given key and its state
+        (:attr:`FRESH` or :attr:`STALE`) or (None, None) if there is no
+        entry or it can not be served anymore
+
+        :param key: the key to lookup for
+        """
+
+        entry = self._entries.pop(key, None)
+        now = self.clock()
+        if entry is None or now >= entry.stale_until:
+            if entry is not None:
+                self.bytes -= entry.size
+            self.misses += 1
+            return None, None
+
+        self._entries[key] = entry
+        if now < entry.expires:
+            self.hits += 1
+            return entry, self.FRESH
+
+        self.stale_hits += 1
+        return entry, self.STALE
+
+    def store(self, key, code, subject, headers, ttl, stale=0):
+        """
+        Cache a response evicting the least recently used responses if
+        there is no room for it, responses larger than the whole cache are
+        never stored
+
+        :param key: the cache key
+        :param code: the HTTP response code
+        :type code: int
+        :param subject: the encoded response body
+        :type subject: str
+        :param headers: the HTTP response headers
+        :type headers: dict
+        :param ttl: time in seconds that the entry is fresh
+        :type ttl: float
+        :param stale: time in seconds that the entry can be served stale
+        :type stale: float
+        """
+
+        entry = CacheEntry(
+            code, subject, dict(headers), self.clock(), ttl, stale)
+        self.invalidate(key)
+        if entry.size > self.maxbytes:
+            return None
+
+        self._entries[key] = entry
+        self.bytes += entry.size
+        while self.bytes > self.maxbytes:
+            _, evicted = self._entries.popitem(False)
+            self.bytes -= evicted.size
+            self.evictions += 1
+
+        return entry
+
+    def invalidate(self, key):
+        """Remove the given key from the cache (if present)
+        """
+
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def clear(self):
+        """Remove all the entries from the cache
+        """
+
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        """
+        Return back a dict with the cache size in entries and bytes, the
+        hits (fresh and stale), misses, evictions and hit ratio
+        """
+
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'bytes': self.bytes,
+            'maxbytes': self.maxbytes,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': (
+                float(self.hits + self.stale_hits) / lookups if lookups else 0
+            )
+        }
+
+    def collect(self):
+        """Return the cache stats as Prometheus text format lines
+        """
+
+        metrics = (
+            ('hits', 'counter', 'Fresh responses served from the cache'),
+            ('stale_hits', 'counter', 'Stale responses served from the cache'),
+            ('misses', 'counter', 'Lookups not served from the cache'),
+            ('evictions', 'counter', 'Responses evicted to make room'),
+            ('size', 'gauge', 'Responses in the cache'),
+            ('bytes', 'gauge', 'Size of the cached responses in bytes')
+        )
+        stats = self.stats()
+        lines = []
+        for key, kind, description in metrics:
+            name = 'mamba_response_cache_{}'.format(key)
+            if kind == 'counter':
+                name += '_total'
+            lines.extend([
+                '# HELP {} {}'.format(name, description),
+                '# TYPE {} {}'.format(name, kind),
+                '{} {}'.format(name, stats[key])
+            ])
+
+        return lines
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return 'ResponseCache({})'.format(', '.join(
+            map(repr, [self.maxbytes, self.bytes]))
+        )
+
+
+__all__ = ['CacheEntry', 'ResponseCache']
@@ -0,0 +1,291 @@
+# -*- test-case-name: mamba.test.test_compression -*-
+# Copyright (c) 2012 - 2013 Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+.. module: compression
+    :platform: Unix, Windows
+    :synopsis: Negotiated HTTP response compression
+
+.. moduleauthor:: Oscar Campos <oscar.campos@member.fsf.org>
+"""
+
+import zlib
+import inspect
+
+from twisted.internet import threads
+from twisted.web.server import NOT_DONE_YET
+
+from mamba.utils import config, log
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# content types that are already compressed (or not worth compressing)
+COMPRESSED_TYPES = (
+    'image/', 'video/', 'audio/', 'font/woff', 'application/zip',
+    'application/gzip', 'application/x-gzip', 'application/x-bzip2',
+    'application/x-7z-compressed', 'application/x-rar-compressed',
+    'application/pdf', 'application/octet-stream', 'application/msgpack',
+    'application/x-msgpack'
+)
+
+
+def _gzip(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _deflate(data, level):
+    return zlib.compress(data, level)
+
+
+def _brotli(data, level):
+    return brotli.compress(data, quality=min(level, 11))
+
+
+ENCODERS = {'gzip': _gzip, 'deflate': _deflate}
+if brotli is not None:
+    ENCODERS['br'] = _brotli
+
+
+def compress(data, encoding, level=6):
+    """
+    Compress the given data with the given content encoding
+
+    :param data: the data to compress
+    :type data: str
+    :param encoding: the content encoding (gzip, deflate or br)
+    :type encoding: str
+    :param level: the compression level
+    :type level: int
+    """
+
+    return ENCODERS[encoding](data, level)
+
+
+class CompressionPolicy(object):
+    """
+    I decide if a response should be compressed and which content encoding
+    should be used for it. Compression is disabled unless it is enabled
+    with the `compression` option in the `application.json` file (or
+    with the `compress` option of a route)::
+
+        "compression": {
+            "enabled": true,
+            "min_size": 1024,
+            "level": 6,
+            "offload_size": 262144,
+            "encodings": ["br", "gzip", "deflate"]
+        }
+
+    :param enabled: if False (the default) responses are never compressed
+    :type enabled: bool
+    :param min_size: responses smaller than this are not compressed
+    :type min_size: int
+    :param level: the compression level (from 1 to 9)
+    :type level: int
+    :param offload_size: responses of this size or larger are compressed
+                         outside the reactor thread
+    :type offload_size: int
+    :param encodings: supported content encodings in preference order
+    :type encodings: list
+    """
+
+    def __init__(self, enabled=False, min_size=1024, level=6,
+                 offload_size=256 * 1024,
+                 encodings=('br', 'gzip', 'deflate')):
+        self.enabled = enabled
+        self.min_size = min_size
+        self.level = level
+        self.offload_size = offload_size
+        self.encodings = tuple(e for e in encodings if e in ENCODERS)
+
+    @classmethod
+    def from_options(cls, options=None, overrides=None):
+        """
+        Build a policy from a dict of options (as in the `application.json`
+        file) applying the given overrides, overrides can be a dict of
+        options or a boolean that enables or disables the compression.
+        Unknown options are logged and ignored
+
+        :param options: the base options
+        :type options: dict
+        :param overrides: the overrides to apply
+        :type overrides: dict or bool
+        """
+
+        options = dict(options or {})
+        if isinstance(overrides, dict):
+            options.update(overrides)
+        elif overrides is not None:
+            options['enabled'] = bool(overrides)
+
+        known = inspect.getargspec(cls.__init__).args[1:]
+        for name in sorted(set(options) - set(known)):
+            log.warning(
+                'ignoring unknown compression option {}'.format(name))
+            del options[name]
+
+        return cls(**options)
+
+    @classmethod
+    def from_config(cls):
+        """Build a policy from the `application.json` file
+        """
+
+        return cls.from_options(
+            getattr(config.Application(), 'compression', None))
+
+    def negotiate(self, accept_encoding):
+        """
+        Return the content encoding to use for the given Accept-Encoding
+        header or None if the response should not be compressed
+
+        :param accept_encoding: the request Accept-Encoding header
+        :type accept_encoding: str
+        """
+
+        if not self.enabled or not accept_encoding:
+            return None
+
+        qualities = {}
+        for part in accept_encoding.split(','):
+            params = part.split(';')
+            coding = params[0].strip().lower()
+            quality = 1.0
+            for param in params[1:]:
+                name, _, value = param.partition('=')
+                if name.strip() == 'q':
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            qualities[coding] = quality
+
+        best, best_quality = None, 0
+        for encoding in self.encodings:
+            quality = qualities.get(encoding, qualities.get('*', 0))
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+
+        return best
+
+    def accepts(self, content_type, size):
+        """
+        Return True if a body of the given content type and size should be
+        compressed
+
+        :param content_type: the response content type
+        :type content_type: str
+        :param size: the response body size in bytes
+        :type size: int
+        """
+
+        if not self.enabled or size < self.min_size:
+            return False
+
+        content_type = (content_type or '').lower()
+        return not (
+            content_type.startswith(COMPRESSED_TYPES)
+            and not content_type.startswith('image/svg')
+        )
+
+    def compress(self, data, encoding, threadpool=None):
+        """
+        Compress the given data returning a Deferred if the data is large
+        enough to be offloaded to the given thread pool (or the reactor one)
+
+        :param data: the data to compress
+        :type data: str
+        :param encoding: the content encoding
+        :type encoding: str
+        :param threadpool: the thread pool where to offload the compression
+        :type threadpool: :class:`twisted.python.threadpool.ThreadPool`
+        """
+
+        if len(data) < self.offload_size:
+            return compress(data, encoding, self.level)
+
+        from twisted.internet import reactor
+        if threadpool is None:
+            threadpool = reactor.getThreadPool()
+
+        return threads.deferToThreadPool(
+            reactor, threadpool, compress, data, encoding, self.level)
+
+
+def add_vary(headers, header='Accept-Encoding'):
+    """
+    Add the given header to the Vary header in the given headers dict
+
+    :param headers: the response headers
+    :type headers: dict
+    :param header: the header name to add
+    :type header: str
+    """
+
+    for name in headers.keys():
+        if name.lower() == 'vary':
+            values = [value.strip() for value in headers[name].split(',')]
+            if header.lower() not in [value.lower() for value in values]:
+                headers[name] = ', '.join(values + [header])
+            return
+
+    headers['vary'] = header
+
+
+def render_compressed(request, data, content_type, policy):
+    """
+    Write the given data compressed (if the policy and the request allow
+    it) and return what a :class:`twisted.web.resource.Resource` render
+    method is supposed to return: the data or NOT_DONE_YET when the
+    compression has been offloaded from the reactor thread. The
+    Content-Encoding header is set only once the data has been compressed
+
+    :param request: the HTTP request
+    :type request: :class:`twisted.web.server.Request`
+    :param data: the response body
+    :type data: str
+    :param content_type: the response content type
+    :type content_type: str
+    :param policy: the compression policy
+    :type policy: :class:`~mamba.web.compression.CompressionPolicy`
+    """
+
+    if not policy.accepts(content_type, len(data)):
+        return data
+
+    # keep the Vary values already set (Origin, the handler ones...)
+    headers = {}
+    current = request.responseHeaders.getRawHeaders('vary')
+    if current:
+        headers['vary'] = ', '.join(current)
+    add_vary(headers)
+    request.responseHeaders.setRawHeaders('vary', [headers['vary']])
+    encoding = policy.negotiate(request.getHeader('accept-encoding'))
+    if encoding is None:
+        return data
+
+    result = policy.compress(data, encoding)
+    if isinstance(result, str):
+        request.setHeader('content-encoding', encoding)
+        return result
+
+    def write(data):
+        request.setHeader('content-encoding', encoding)
+        request.write(data)
+        request.finish()
+
+    # failures are rendered as any other error raised while rendering
+    result.addCallbacks(write, request.processingFailed)
+    return NOT_DONE_YET
+
+
+__all__ = [
+    'CompressionPolicy', 'compress', 'add_vary', 'render_compressed',
+    'COMPRESSED_TYPES'
+]
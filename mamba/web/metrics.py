@@ -0,0 +1,302 @@
+# -*- test-case-name: mamba.test.test_metrics -*-
+# Copyright (c) 2012 - 2013 Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+.. module: metrics
+    :platform: Unix, Windows
+    :synopsis: Per route request metrics exposed in Prometheus format
+
+.. moduleauthor:: Oscar Campos <oscar.campos@member.fsf.org>
+"""
+
+from twisted.web import resource, http
+
+from mamba.web.ratelimit import peer_address
+
+
+class LatencyHistogram(object):
+    """
+    I am a HDR style log-linear histogram of latencies, every power of two
+    is split in `2 ** (precision - 1)` linear buckets so the recorded values
+    have a bounded relative error (about 6% with the default precision)
+    while the memory used does not depend on the number of samples.
+
+    Values are recorded in seconds with microsecond resolution
+
+    :param precision: the number of significant bits of the buckets
+    :type precision: int
+    """
+
+    __slots__ = ('precision', 'count', 'total', 'max', 'buckets', '_half')
+
+    def __init__(self, precision=5):
+        self.precision = precision
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = {}
+        self._half = 1 << (precision - 1)
+
+    def record(self, value):
+        """Record a value in seconds
+        """
+
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+        index = self._index(int(value * 1e6))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def percentile(self, percentile):
+        """
+        Return the value (in seconds) below which the given percentile of
+        the recorded values fall
+
+        :param percentile: the percentile between 0 and 100
+        :type percentile: float
+        """
+
+        if self.count == 0:
+            return 0.0
+
+        threshold = self.count * percentile / 100.0
+        accumulated = 0
+        for index in sorted(self.buckets):
+            accumulated += self.buckets[index]
+            if accumulated >= threshold:
+                return min(self._upper(index) / 1e6, self.max)
+
+        return self.max
+
+    def _index(self, value):
+        """Return the bucket index of the given value in microseconds
+        """
+
+        if value < self._half << 1:
+            return max(value, 0)
+
+        shift = value.bit_length() - self.precision
+        return shift * self._half + (value >> shift)
+
+    def _upper(self, index):
+        """Return the upper bound in microseconds of the given bucket
+        """
+
+        if index < self._half << 1:
+            return index + 1
+
+        shift = index // self._half - 1
+        return (index - shift * self._half + 1) << shift
+
+
+class RouteMetrics(object):
+    """
+    I hold the metrics of a (controller, route, method) tuple: requests
+    count, errors count, latency histogram and response sizes
+    """
+
+    __slots__ = ('count', 'errors', 'latency', 'bytes')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.latency = LatencyHistogram()
+        self.bytes = 0
+
+    def record(self, elapsed, size=0, error=False):
+        """
+        Record a request
+
+        :param elapsed: the request latency in seconds
+        :type elapsed: float
+        :param size: the response body size in bytes
+        :type size: int
+        :param error: True if the request failed
+        :type error: bool
+        """
+
+        self.count += 1
+        self.bytes += size
+        if error:
+            self.errors += 1
+        self.latency.record(elapsed)
+
+
+class MetricsRegistry(object):
+    """
+    I store the :class:`~mamba.web.metrics.RouteMetrics` of every route
+    and render them in the Prometheus text exposition format, other
+    components can add their own metrics registering a collector
+    """
+
+    quantiles = (50, 90, 99)
+
+    def __init__(self):
+        self.routes = {}
+        self.collectors = {}
+
+    def register_collector(self, name, collector):
+        """
+        Register (or replace) a collector, a callable that returns a list
+        of Prometheus text format lines that are rendered after the routes
+
+        :param name: the collector name
+        :type name: str
+        :param collector: the collector
+        :type collector: callable
+        """
+
+        self.collectors[name] = collector
+
+    def record(self, controller, route, method, elapsed, size=0, error=False):
+        """
+        Record a request of the given route
+
+        :param controller: the controller name
+        :type controller: str
+        :param route: the route URL
+        :type route: str
+        :param method: the HTTP method
+        :type method: str
+        :param elapsed: the request latency in seconds
+        :type elapsed: float
+        :param size: the response body size in bytes
+        :type size: int
+        :param error: True if the request failed
+        :type error: bool
+        """
+
+        key = (controller, route, method)
+        metrics = self.routes.get(key)
+        if metrics is None:
+            metrics = self.routes[key] = RouteMetrics()
+
+        metrics.record(elapsed, size, error)
+
+    def get(self, controller, route, method):
+        """Return the metrics for the given route or None
+        """
+
+        return self.routes.get((controller, route, method))
+
+    def clear(self):
+        """Forget all the recorded metrics
+        """
+
+        self.routes.clear()
+
+    def render(self):
+        """Render the metrics in Prometheus text format
+        """
+
+        lines = [
+            '# HELP mamba_request_duration_seconds Route requests latency',
+            '# TYPE mamba_request_duration_seconds summary'
+        ]
+        errors = [
+            '# HELP mamba_request_errors_total Route requests that failed',
+            '# TYPE mamba_request_errors_total counter'
+        ]
+        maximum = [
+            '# HELP mamba_request_duration_seconds_max Route max latency',
+            '# TYPE mamba_request_duration_seconds_max gauge'
+        ]
+        sizes = [
+            '# HELP mamba_response_size_bytes Route response body sizes',
+            '# TYPE mamba_response_size_bytes summary'
+        ]
+
+        for key in sorted(self.routes):
+            metrics = self.routes[key]
+            labels = 'controller="{}",route="{}",method="{}"'.format(
+                *map(_escape, key))
+            latency = metrics.latency
+            for quantile in self.quantiles:
+                lines.append(_sample(
+                    'mamba_request_duration_seconds',
+                    '{},quantile="{}"'.format(labels, quantile / 100.0),
+                    latency.percentile(quantile)
+                ))
+            lines.extend([
+                _sample('mamba_request_duration_seconds_sum', labels,
+                        latency.total),
+                _sample('mamba_request_duration_seconds_count', labels,
+                        metrics.count)
+            ])
+            errors.append(
+                _sample('mamba_request_errors_total', labels, metrics.errors))
+            maximum.append(_sample(
+                'mamba_request_duration_seconds_max', labels, latency.max))
+            sizes.extend([
+                _sample('mamba_response_size_bytes_sum', labels,
+                        metrics.bytes),
+                _sample('mamba_response_size_bytes_count', labels,
+                        metrics.count)
+            ])
+
+        lines += errors + maximum + sizes
+        for name in sorted(self.collectors):
+            lines.extend(self.collectors[name]())
+
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsResource(resource.Resource):
+    """
+    I render a :class:`~mamba.web.metrics.MetricsRegistry` in Prometheus
+    text format, :class:`~mamba.web.Page` mounts me at `/_mamba/metrics`
+    when the `metrics` option of the `application.json` file enables me
+
+    :param metrics: the metrics registry to render (the global one if None)
+    :type metrics: :class:`~mamba.web.metrics.MetricsRegistry`
+    :param allow: the client addresses that can read the metrics (any
+        client if None), other clients get a 403 Forbidden
+    :type allow: list
+    """
+
+    isLeaf = True
+
+    def __init__(self, metrics=None, allow=None):
+        resource.Resource.__init__(self)
+        self.registry = registry if metrics is None else metrics
+        self.allow = None if allow is None else frozenset(allow)
+
+    def render_GET(self, request):
+        # the transport peer, X-Forwarded-For can be forged by anyone
+        if self.allow is not None and (
+                peer_address(request) not in self.allow):
+            request.setResponseCode(http.FORBIDDEN)
+            return ''
+
+        request.setHeader('content-type', 'text/plain; version=0.0.4')
+        return self.registry.render()
+
+
+def _escape(value):
+    """Escape a Prometheus label value
+    """
+
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n')
+
+
+def _sample(name, labels, value):
+    """Format a Prometheus sample line
+    """
+
+    if isinstance(value, float):
+        return '{}{{{}}} {:.6f}'.format(name, labels, value)
+
+    return '{}{{{}}} {}'.format(name, labels, value)
+
+
+registry = MetricsRegistry()
+
+
+__all__ = [
+    'LatencyHistogram', 'RouteMetrics', 'MetricsRegistry', 'MetricsResource',
+    'registry'
+]
@@ -14,9 +14,12 @@ from singledispatch import singledispatch
 
 from twisted.web import static, server
 from twisted.python import filepath
+from twisted.web.resource import Resource as TwistedResource
 
 from mamba.utils.less import LessResource
-from mamba.utils import log
+from mamba.utils import config, log
+from mamba.web.metrics import MetricsResource
+from mamba.web.compression import CompressionPolicy, render_compressed
 from mamba.core import templating, resource
 
 os = filepath.os
@@ -70,10 +73,15 @@ class Page(resource.Resource):
         self.insert_scripts()
         # register service ponger
         self.putChild('_mamba_pong', static.Data('PONG', 'text/plain'))
+        # register the metrics endpoint (if it is enabled)
+        self.mount_metrics(getattr(config.Application(), 'metrics', None))
 
         # static accessible data (scripts, css, images, and others)
         self.putChild('assets', self._assets)
 
+        # compression of the rendered templates
+        self.compression = CompressionPolicy.from_config()
+
         # other initializations
         self.generate_dispatches()
         self.initialize_templating_system(template_paths, cache_size, loader)
@@ -112,25 +120,17 @@ class Page(resource.Resource):
         if not request.prepath[0].endswith('.html'):
             request.prepath[0] += '.html'
 
-        try:
-            template = templating.Template(
-                self.environment, template=request.prepath[0]
-            )
-            return template.render(**self.render_keys).encode('utf-8')
-        except templating.TemplateNotFound:
+        for name in (request.prepath[0], 'index.html', 'root_page.html'):
             try:
-                template = templating.Template(
-                    self.environment, template='index.html'
-                )
-                return template.render(**self.render_keys).encode('utf-8')
+                template = templating.Template(self.environment, template=name)
+                data = template.render(**self.render_keys).encode('utf-8')
+                break
             except templating.TemplateNotFound:
-                pass
+                if name == 'root_page.html':
+                    raise
 
-        template = templating.Template(
-            self.environment,
-            template='root_page.html'
-        )
-        return template.render(**self.render_keys).encode('utf-8')
+        return render_compressed(
+            request, data, 'text/html', self.compression)
 
     def generate_dispatches(self):
         """Generate singledispatches
@@ -220,6 +220,45 @@ class Page(resource.Resource):
 
             self.containers['styles'].putChild(name, static.File(style.path))
 
+    def mount_metrics(self, options=None):
+        """
+        Mount a :class:`~mamba.web.metrics.MetricsResource` if it is enabled
+        with the `metrics` option in the `application.json` file::
+
+            "metrics": {
+                "enabled": true,
+                "path": "_mamba/metrics",
+                "allow": ["127.0.0.1", "::1"]
+            }
+
+        `allow` is the list of client addresses that can read the metrics
+        (the local host only by default), "*" allows any client
+
+        :param options: the metrics options
+        :type options: dict
+        """
+
+        options = options or {}
+        if not options.get('enabled', False):
+            return
+
+        allow = options.get('allow', ['127.0.0.1', '::1'])
+        if allow == '*':
+            allow = None
+
+        segments = [
+            segment for segment in
+            options.get('path', '_mamba/metrics').split('/') if segment
+        ] or ['_mamba', 'metrics']
+
+        parent = self
+        for segment in segments[:-1]:
+            if segment not in parent.children:
+                parent.putChild(segment, TwistedResource())
+            parent = parent.children[segment]
+
+        parent.putChild(segments[-1], MetricsResource(allow=allow))
+
     def insert_scripts(self):
         """Insert scripts to the HTML
         """
@@ -0,0 +1,225 @@
+# -*- test-case-name: mamba.test.test_ratelimit -*-
+# Copyright (c) 2012 - 2013 Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+.. module: ratelimit
+    :platform: Unix, Windows
+    :synopsis: Token bucket rate limiting of routed requests
+
+.. moduleauthor:: Oscar Campos <oscar.campos@member.fsf.org>
+"""
+
+import time
+import math
+import functools
+
+from mamba.utils import config
+from mamba.utils.lru import LRUCache
+
+
+class RateLimited(Exception):
+    """
+    Fired when a client exceeds the rate limit of a route, `retry_after` is
+    the number of seconds until the client gets a token again
+    """
+
+    def __init__(self, message='Rate limit exceeded', retry_after=1):
+        super(RateLimited, self).__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket(object):
+    """
+    I am the token bucket of a single client, tokens are refilled lazily
+    when they are taken so I don't need any timer
+
+    :param tokens: the initial number of tokens
+    :type tokens: float
+    :param updated: the time of the last refill
+    :type updated: float
+    """
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+    def take(self, now, rate, burst):
+        """
+        Refill the tokens for the elapsed time and take one, returns 0 if
+        there was a token for the request or the seconds until there is
+        one otherwise
+
+        :param now: the current time
+        :type now: float
+        :param rate: tokens per second
+        :type rate: float
+        :param burst: maximum number of tokens
+        :type burst: float
+        """
+
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+
+        return (1 - self.tokens) / float(rate)
+
+
+def peer_address(request):
+    """
+    Return the host of the transport peer of the given request (IPv4 or
+    IPv6), the X-Forwarded-For header is never taken into account
+    """
+
+    return getattr(getattr(request, 'client', None), 'host', None)
+
+
+def ip_key(request, trusted_proxies=()):
+    """
+    Key requests by client IP, that is the transport peer address unless
+    the peer is one of the given trusted proxies, then the right most
+    X-Forwarded-For address that is not a trusted proxy is used
+    """
+
+    address = peer_address(request)
+    if address not in trusted_proxies:
+        return address
+
+    forwarded = request.getHeader('x-forwarded-for')
+    if forwarded is None:
+        return address
+
+    hops = [hop.strip() for hop in forwarded.split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if hop not in trusted_proxies:
+            return hop
+
+    return hops[0] if hops else address
+
+
+def session_key(request, trusted_proxies=()):
+    """
+    Key requests by the UID of their existing session, no session is
+    created for anonymous requests (they are keyed by client IP)
+    """
+
+    site = getattr(request, 'site', None)
+    if site is not None:
+        for prefix in ('TWISTED_SECURE_SESSION', 'TWISTED_SESSION'):
+            uid = request.getCookie('_'.join([prefix] + request.sitepath))
+            if uid is None:
+                continue
+            try:
+                return site.getSession(uid).uid
+            except KeyError:
+                # expired or forged session cookie
+                continue
+
+    return ip_key(request, trusted_proxies)
+
+
+class RateLimiter(object):
+    """
+    I limit the rate of requests per client with a token bucket, every
+    client can do `rate` requests per second with bursts of up to `burst`
+    requests. Clients are identified by client IP, session UID or a
+    custom key function that receives the request and returns the key.
+
+    The buckets are held in a :class:`~mamba.utils.lru.LRUCache` so the
+    memory used is bounded by `maxsize` clients no matter how many
+    different clients we get, forgotten clients just start with a full
+    bucket. Routes declare me with the `rate_limit` option::
+
+        @route('/login', method='POST', rate_limit={'rate': 1, 'burst': 5})
+        def login(self, request, **kwargs):
+            ...
+
+    :param rate: requests per second
+    :type rate: float
+    :param burst: maximum number of requests in a burst (rate if None)
+    :type burst: int
+    :param key: 'ip', 'session' or a callable that returns the client key
+    :type key: str or callable
+    :param trusted_proxies: addresses of the reverse proxies whose
+        X-Forwarded-For header is honored by the 'ip' and 'session' keys,
+        the `trusted_proxies` option in the `application.json` file is
+        used by :meth:`from_options` if they are not given
+    :type trusted_proxies: list
+    :param maxsize: maximum number of clients to remember
+    :type maxsize: int
+    :param clock: a callable that returns the current time in seconds
+    :type clock: callable
+    """
+
+    keys = {'ip': ip_key, 'session': session_key}
+
+    def __init__(self, rate, burst=None, key='ip', maxsize=10000,
+                 clock=time.time, trusted_proxies=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self.trusted_proxies = frozenset(trusted_proxies or ())
+        if isinstance(key, basestring):
+            key = functools.partial(
+                self.keys[key], trusted_proxies=self.trusted_proxies)
+        self.key = key
+        self.clock = clock
+        self.limited = 0
+        self.buckets = LRUCache(maxsize)
+
+    @classmethod
+    def from_options(cls, options):
+        """
+        Build a rate limiter from a route `rate_limit` option, it can be a
+        dict of options or the number of requests per second
+        """
+
+        if options is None or options is False:
+            return None
+
+        if not isinstance(options, dict):
+            options = {'rate': options}
+
+        options = dict(options)
+        if options.get('trusted_proxies') is None:
+            options['trusted_proxies'] = getattr(
+                config.Application(), 'trusted_proxies', None)
+
+        return cls(**options)
+
+    def check(self, request):
+        """
+        Take a token for the client of the given request, raises
+        :class:`~mamba.web.ratelimit.RateLimited` if there is none
+
+        :param request: the HTTP request
+        :type request: :class:`twisted.web.server.Request`
+        """
+
+        key = self.key(request)
+        now = self.clock()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.burst, now)
+            self.buckets.set(key, bucket)
+
+        wait = bucket.take(now, self.rate, self.burst)
+        if wait:
+            self.limited += 1
+            raise RateLimited(
+                'Rate limit of {} requests per second exceeded'.format(
+                    self.rate), int(math.ceil(wait))
+            )
+
+    def __repr__(self):
+        return 'RateLimiter({})'.format(', '.join(
+            map(repr, [self.rate, self.burst, len(self.buckets)]))
+        )
+
+
+__all__ = [
+    'RateLimited', 'TokenBucket', 'RateLimiter', 'ip_key', 'session_key'
+]
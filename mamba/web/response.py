@@ -15,6 +15,7 @@ from twisted.web import http
 from zope.interface import implementer
 
 from mamba.core.interfaces import IResponse
+from mamba.web.stream import JSONArrayProducer
 
 
 class Response(object):
@@ -73,6 +74,68 @@ class Created(Response):
         super(Created, self).__init__(http.CREATED, subject, headers)
 
 
+@implementer(IResponse)
+class Streamed(Response):
+    """
+    Ok 200 HTTP Response that is streamed to the browser
+
+    The subject is a generator, an iterator or a body producer (an object
+    with a `startProducing(consumer)` method) that is written incrementally
+    with chunked transfer encoding honoring the transport backpressure
+
+    :param source: the generator, iterator or producer to stream
+    :param content_type: the content type of the streamed data
+    :type content_type: str
+    :param headers: the HTTP headers to return back in the response to the
+                    browser
+    :type headers: dict or a list of dicts
+    """
+
+    def __init__(
+            self, source, content_type='application/octet-stream',
+            headers={}):
+        headers = dict(headers)
+        if 'content-type' not in [h.lower() for h in headers]:
+            headers['content-type'] = content_type
+
+        super(Streamed, self).__init__(http.OK, source, headers)
+
+
+@implementer(IResponse)
+class StreamedJSON(Streamed):
+    """
+    Ok 200 HTTP Response that streams a result set as a JSON array, the
+    rows are pulled and encoded in batches outside the reactor thread so
+    the memory used does not depend on the number of rows
+
+    .. seealso:: :class:`~mamba.web.stream.JSONArrayProducer`
+
+    :param result_set: the result set (or a callable that returns it)
+    :param fields: the fields of every row to include (all if None)
+    :type fields: list
+    :param exclude: the fields of every row to exclude
+    :type exclude: list
+    :param batch_size: the number of rows pulled and encoded at once
+    :type batch_size: int
+    :param headers: the HTTP headers to return back in the response to the
+                    browser
+    :type headers: dict or a list of dicts
+    :param pause_timeout: seconds that a paused (slow) client is waited
+    :type pause_timeout: float
+    """
+
+    def __init__(
+            self, result_set, fields=None, exclude=None, batch_size=500,
+            headers={}, pause_timeout=30):
+        super(StreamedJSON, self).__init__(
+            JSONArrayProducer(
+                result_set, fields, exclude, batch_size,
+                pause_timeout=pause_timeout
+            ),
+            'application/json', headers
+        )
+
+
 @implementer(IResponse)
 class Unknown(Response):
     """
@@ -149,6 +212,23 @@ class SeeOther(Response):
         )
 
 
+@implementer(IResponse)
+class NotModified(Response):
+    """
+    Ok 304 Not Modified HTTP Response
+
+    The response never has a body, the headers should contain the
+    validators (ETag, Last-Modified) of the cached representation
+
+    :param headers: the HTTP headers to return back in the response to the
+                    browser
+    :type headers: dict or a list of dicts
+    """
+
+    def __init__(self, headers={}):
+        super(NotModified, self).__init__(http.NOT_MODIFIED, '', headers)
+
+
 @implementer(IResponse)
 class BadRequest(Response):
     """
@@ -262,6 +342,53 @@ class AlreadyExists(Conflict):
         )
 
 
+@implementer(IResponse)
+class RequestEntityTooLarge(Response):
+    """
+    Error 413 Request Entity Too Large
+
+    :param subject: the subject body of he response
+    :type subject: :class:`~mamba.web.Response` or dict or str
+    :param headers: the HTTP headers to return back in the response to the
+                    browser
+    :type headers: dict or a list of dicts
+    """
+
+    def __init__(self, subject='', headers={}):
+        if not subject:
+            subject = 'Request Entity Too Large'
+
+        super(RequestEntityTooLarge, self).__init__(
+            http.REQUEST_ENTITY_TOO_LARGE, subject, headers
+        )
+
+
+@implementer(IResponse)
+class TooManyRequests(Response):
+    """
+    Error 429 Too Many Requests
+
+    :param subject: the subject body of he response
+    :type subject: :class:`~mamba.web.Response` or dict or str
+    :param headers: the HTTP headers to return back in the response to the
+                    browser
+    :type headers: dict or a list of dicts
+    :param retry_after: seconds that the client should wait before retrying
+    :type retry_after: int
+    """
+
+    def __init__(self, subject='', headers={}, retry_after=None):
+        if not subject:
+            subject = 'Too Many Requests'
+
+        if retry_after is not None:
+            headers = dict(headers)
+            headers['retry-after'] = str(retry_after)
+
+        # Twisted does not define the 429 code (RFC 6585)
+        super(TooManyRequests, self).__init__(429, subject, headers)
+
+
 @implementer(IResponse)
 class InternalServerError(Response):
     """
@@ -299,3 +426,52 @@ class NotImplemented(Response):
             ),
             {'content-type': 'text/plain'}
         )
+
+
+@implementer(IResponse)
+class ServiceUnavailable(Response):
+    """
+    Error 503 Service Unavailable
+
+    :param subject: the subject body of he response
+    :type subject: :class:`~mamba.web.Response` or dict or str
+    :param headers: the HTTP headers to return back in the response to the
+                    browser
+    :type headers: dict or a list of dicts
+    :param retry_after: seconds that the client should wait before retrying
+    :type retry_after: int
+    """
+
+    def __init__(self, subject='', headers={}, retry_after=None):
+        if not subject:
+            subject = 'Service Unavailable'
+
+        if retry_after is not None:
+            headers = dict(headers)
+            headers['retry-after'] = str(retry_after)
+
+        super(ServiceUnavailable, self).__init__(
+            http.SERVICE_UNAVAILABLE, subject, headers
+        )
+
+
+@implementer(IResponse)
+class GatewayTimeout(Response):
+    """
+    Error 504 Gateway Timeout, the request could not be completed before
+    its deadline
+
+    :param subject: the subject body of he response
+    :type subject: :class:`~mamba.web.Response` or dict or str
+    :param headers: the HTTP headers to return back in the response to the
+                    browser
+    :type headers: dict or a list of dicts
+    """
+
+    def __init__(self, subject='', headers={}):
+        if not subject:
+            subject = 'Gateway Timeout'
+
+        super(GatewayTimeout, self).__init__(
+            http.GATEWAY_TIMEOUT, subject, headers
+        )
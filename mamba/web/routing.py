@@ -11,20 +11,40 @@
 """
 
 import re
+import time
+import hashlib
 import inspect
+import calendar
+import datetime
 import functools
 from singledispatch import singledispatch
 from collections import defaultdict, OrderedDict
 
 from mamba.utils import log
-from twisted.internet import defer
-from twisted.web.http import parse_qs
-
-from mamba.web import response
-from mamba.utils import output, config, json
-from mamba.application.model import Model
-from mamba.utils.converter import Converter
+from twisted.python.threadpool import ThreadPool
+from twisted.web import http
+from twisted.internet import defer, threads
+
+from mamba.utils import deadline
+from mamba.utils.lru import LRUCache
+from mamba.utils.deadline import Deadline, DeadlineExceeded
+from mamba.web.cache import ResponseCache
+from mamba.web.ratelimit import RateLimiter, RateLimited
+from mamba.web.admission import AdmissionControl, AdmissionRejected
+from mamba.web.stream import is_streamable
+from mamba.web.compression import CompressionPolicy, add_vary
+from mamba.utils import output, config
+from mamba.web import response, serializer, metrics
+from mamba.application.model import Model, Page, Row, InvalidCursor
 from mamba.web.url_sanitizer import UrlSanitizer
+from mamba.web.body import RequestBodyTooLarge, get_body
+
+
+serializer.register_adapter(Model, lambda model: model.dict(json=True))
+serializer.register_adapter(Page, lambda page: page.dict(json=True))
+serializer.register_adapter(Row, lambda row: row.dict(json=True))
+
+CONDITIONAL = ('GET', 'HEAD')
 
 
 class RouterError(Exception):
@@ -47,12 +67,49 @@ class UrlRegex(object):
         "\"|\\?'.*?'|[^'\">\s]+))?)+\s*|\s*)\/?>"
     )
 
+    @staticmethod
+    def parse(url):
+        """
+        Translates an URL template into a regex pattern string and an
+        ordered dict of argument names and their type converters
+
+        :param url: the URL template (e.g. /user/<int:user_id>)
+        :type url: str
+        :returns: a tuple with the pattern and the arguments
+        """
+
+        pattern = url
+        arguments = OrderedDict()
+
+        for match in UrlRegex.url_matcher.findall(url):
+            if not match[0]:  # string
+                pattern = pattern.replace(
+                    '<{}>'.format(match[1]),
+                    UrlRegex.type_regex[match[0]].replace('type', match[1])
+                )
+            else:
+                pattern = pattern.replace(
+                    '<{}:{}>'.format(*match),
+                    UrlRegex.type_regex[match[0]].replace('type', match[1])
+                )
+
+            arguments.update({
+                match[1]: None if not match[0] else eval(match[0])
+            })
+
+        return pattern, arguments
+
 
 class Route(object):
-    """I am a Route in the Mamba routing system.
+    """
+    I am a Route in the Mamba routing system.
+
+    Routes are immutable once they have been compiled so they can be safely
+    shared between requests (and threads), the arguments extracted from a
+    given URL are stored in a per request :class:`~mamba.web.RouteMatch`
     """
 
-    def __init__(self, method, url, callback):
+    def __init__(self, method, url, callback, **options):
         """
         Initializes the Route object with the given data from decorator
 
@@ -62,45 +119,93 @@ class Route(object):
         :type url: string
         :param callback: the callable callback
         :type callback: callabe object
+        :param options: the route options (e.g. threaded=True)
+        :type options: dict
         """
         self.url = url
         self.match = ''
         self.arguments = OrderedDict()
         self.method = method
         self.callback = callback
-        self.callback_args = {}
+        self.options = options
 
         super(Route, self).__init__()
 
+    def __setattr__(self, name, value):
+        if getattr(self, '_compiled', False):
+            raise RouterError(
+                'Route {} is immutable once compiled, can not set {}'.format(
+                    self.url, name
+                )
+            )
+
+        super(Route, self).__setattr__(name, value)
+
+    @property
+    def conditional(self):
+        """Should this route answer conditional GET requests?
+        """
+
+        return bool(
+            self.options.get('etag', False) or self.options.get('validator')
+        )
+
+    @property
+    def cached(self):
+        """Should the responses of this route be cached?
+        """
+
+        return bool(self.options.get('cache_ttl'))
+
+    @property
+    def threaded(self):
+        """Should this route be dispatched in the handler thread pool?
+        """
+
+        return self.options.get('threaded', False)
+
     def compile(self):
         """
-        Compiles the regex matches using the complete URL
+        Compiles the regex matches using the complete URL and freezes
+        the route
         """
 
-        url_matcher = '^{url}$'.format(url=self.url)
+        if getattr(self, '_compiled', False):
+            return
 
-        for match in UrlRegex.url_matcher.findall(self.url):
-            if not match[0]:  # string
-                url_matcher = url_matcher.replace(
-                    '<{}>'.format(match[1]),
-                    UrlRegex.type_regex[match[0]].replace('type', match[1])
-                )
-            else:
-                url_matcher = url_matcher.replace(
-                    '<{}:{}>'.format(*match),
-                    UrlRegex.type_regex[match[0]].replace('type', match[1])
-                )
+        pattern, arguments = UrlRegex.parse(self.url)
+        self.arguments.update(arguments)
+        self.match = re.compile('^{pattern}$'.format(pattern=pattern))
+        self.body_args = self._accepts_body_args()
+        self.serializers = self._build_serializers()
+        self.compression = CompressionPolicy.from_options(
+            self.options.get('compression'), self.options.get('compress')
+        )
+        self.rate_limiter = RateLimiter.from_options(
+            self.options.get('rate_limit'))
+        self._compiled = True
 
-            self.arguments.update({
-                match[1]: None if not match[0] else eval(match[0])
-            })
+    def bind(self, url, **defaults):
+        """
+        Return a compiled copy of this route for the given (full) URL
+
+        :param url: the full URL path of the new route
+        :type url: str
+        :param defaults: default options for the options that this route
+                         does not define
+        :type defaults: dict
+        """
 
-        self.match = re.compile(url_matcher)
+        options = dict(defaults)
+        options.update(self.options)
+        route = Route(self.method, url, self.callback, **options)
+        route.compile()
+        return route
 
     def validate(self, dispatcher):
         """
         Validate a given path against stored URLs. Returns None if
-        nothing matched itself otherwise
+        nothing matched, a :class:`~mamba.web.RouteMatch` otherwise
 
         :param dispatcher: the dispatcher object that containing the
                            information to validate
@@ -109,24 +214,58 @@ class Route(object):
 
         group = self.match.search(dispatcher.url)
         if group is not None:
-            self.callback_args = group.groupdict()
+            callback_args = group.groupdict()
+            for key, value in callback_args.iteritems():
+                if self.arguments.get(key) is not None:
+                    # convert to the correct type
+                    callback_args[key] = self.arguments.get(key)(value)
+
+            return RouteMatch(self, callback_args)
+
+    def _accepts_body_args(self):
+        """
+        Return True if the route callback can receive arguments that are
+        not present in the URL (so request body arguments are passed to it)
+        """
+
+        if self.options.get('lazy_body', False) is True:
+            return False
+
+        try:
+            args, _, keywords, _ = inspect.getargspec(self.callback)
+        except TypeError:
+            return True
+
+        if keywords is not None:
+            return True
+
+        if 'request' in args:
+            args = args[args.index('request') + 1:]
+
+        return len([a for a in args if a not in self.arguments]) > 0
+
+    def _build_serializers(self):
+        """
+        Return the :class:`~mamba.web.serializer.SerializerRegistry` for
+        this route, the global one is used unless the `serializers` option
+        is defined
+        """
+
+        serializers = self.options.get('serializers')
+        if serializers is None:
+            return serializer.registry
 
-            if len(self.callback_args):
-                for key, value in self.callback_args.iteritems():
-                    if self.arguments.get(key) is not None:
-                        # convert to the correct type
-                        self.callback_args.update({
-                            key: self.arguments.get(key)(value)
-                        })
+        if isinstance(serializers, serializer.SerializerRegistry):
+            return serializers
 
-            return self
+        return serializer.SerializerRegistry(serializers)
 
     def __repr__(self):
         return 'Route({})'.format(', '.join(
             map(repr, [self.method, self.url, self.callback, self.arguments]))
         )
 
-    def __call__(self, controller, request):
+    def __call__(self, controller, request, **kwargs):
         """
         Make sure we call the decorated method with the correct args
 
@@ -134,7 +273,240 @@ class Route(object):
         :type request: :class:`~twisted.web.server.Request`
         """
 
-        return self.callback(controller, request, **self.callback_args)
+        return self.callback(controller, request, **kwargs)
+
+
+class RouteMatch(object):
+    """
+    I am the outcome of matching a request against a
+    :class:`~mamba.web.Route`, I hold the converted arguments for a single
+    request so the route itself never changes
+
+    :param route: the matched route
+    :type route: :class:`~mamba.web.Route`
+    :param callback_args: the arguments to call the route callback with
+    :type callback_args: dict
+    """
+
+    __slots__ = ('route', 'callback_args')
+
+    def __init__(self, route, callback_args):
+        self.route = route
+        self.callback_args = callback_args
+
+    def __repr__(self):
+        return 'RouteMatch({})'.format(', '.join(
+            map(repr, [self.route, self.callback_args]))
+        )
+
+    def __call__(self, controller, request):
+        """
+        Call the matched route with the request arguments
+
+        :param request: the HTTP request
+        :type request: :class:`~twisted.web.server.Request`
+        """
+
+        return self.route(controller, request, **self.callback_args)
+
+
+class RouteTrieEdge(object):
+    """
+    I am a typed edge in the :class:`~mamba.web.routing.RouteTrie`, I match
+    URL segments that contains arguments like `<int:user_id>`
+
+    :param segment: the URL template segment
+    :type segment: str
+    """
+
+    __slots__ = ('segment', 'priority', 'regex', 'arguments', 'node')
+
+    # static segments are always checked before typed edges, then typed
+    # edges are checked in the order int, float, mixed and string
+    priorities = {'int': 0, 'float': 1, '': 3}
+
+    def __init__(self, segment):
+        pattern, self.arguments = UrlRegex.parse(segment)
+        self.segment = segment
+        self.regex = re.compile('^{pattern}$'.format(pattern=pattern))
+        self.node = RouteTrieNode()
+
+        match = UrlRegex.url_matcher.match(segment)
+        if match is not None and match.end() == len(segment):
+            self.priority = self.priorities[match.group(1)]
+        else:
+            self.priority = 2
+
+    def convert(self, segment):
+        """
+        Match the given URL segment and return its converted arguments or
+        None if the segment doesn't match this edge
+
+        :param segment: the URL segment to match
+        :type segment: str
+        """
+
+        group = self.regex.match(segment)
+        if group is None:
+            return None
+
+        arguments = group.groupdict()
+        try:
+            for key, value in arguments.iteritems():
+                converter = self.arguments.get(key)
+                if converter is not None:
+                    arguments[key] = converter(value)
+        except ValueError:
+            return None
+
+        return arguments
+
+
+class RouteTrieNode(object):
+    """
+    I am a node in the :class:`~mamba.web.routing.RouteTrie`, I store the
+    routes for an URL pattern indexed by HTTP method and the precomputed
+    value of the `Allow` header for it
+    """
+
+    __slots__ = ('static', 'typed', 'routes', 'allow')
+
+    def __init__(self):
+        self.static = {}
+        self.typed = []
+        self.routes = {}
+        self.allow = ''
+
+    def add_route(self, route, method):
+        """Add a route for the given method and update the allowed methods
+        """
+
+        self.routes[method] = route
+
+        allowed = set(self.routes) | set(['OPTIONS'])
+        if 'GET' in allowed:
+            allowed.add('HEAD')
+
+        self.allow = ', '.join(sorted(allowed))
+
+    def accepts(self, method):
+        """
+        Return True if this node can answer the given HTTP method, HEAD is
+        answered from GET routes and OPTIONS is always answered
+        """
+
+        if not self.routes:
+            return False
+
+        if method is None or method in self.routes or method == 'OPTIONS':
+            return True
+
+        return method == 'HEAD' and 'GET' in self.routes
+
+    def route_for(self, method):
+        """
+        Return the route for the given HTTP method (falling back to GET for
+        HEAD requests) or None if OPTIONS should be answered automatically
+        """
+
+        route = self.routes.get(method)
+        if route is None and method == 'HEAD':
+            route = self.routes.get('GET')
+
+        return route
+
+
+class RouteTrie(object):
+    """
+    I store the routes of a single controller as a tree of URL segments
+    so a lookup costs O(path depth) whatever the number of routes is.
+
+    Static segments are stored in dicts while segments containing arguments
+    are stored as :class:`~mamba.web.routing.RouteTrieEdge` typed edges
+    """
+
+    def __init__(self):
+        self.root = RouteTrieNode()
+
+    def insert(self, route, method):
+        """
+        Insert a compiled route in the trie for the given HTTP method
+
+        :param route: the route to insert
+        :type route: :class:`~mamba.web.routing.Route`
+        :param method: the HTTP method
+        :type method: str
+        """
+
+        node = self.root
+        for segment in self._split(route.url):
+            if UrlRegex.url_matcher.search(segment) is None:
+                node = node.static.setdefault(segment, RouteTrieNode())
+                continue
+
+            for edge in node.typed:
+                if edge.segment == segment:
+                    break
+            else:
+                edge = RouteTrieEdge(segment)
+                node.typed.append(edge)
+                node.typed.sort(key=lambda e: e.priority)
+
+            node = edge.node
+
+        node.add_route(route, method)
+
+    def match(self, url, method=None):
+        """
+        Match the given URL and return back a tuple with the matched node
+        and the converted arguments or (None, None) if nothing matches.
+
+        If method is not None, only nodes that can answer the given HTTP
+        method are matched
+
+        :param url: the sanitized URL to match
+        :type url: str
+        :param method: the HTTP method
+        :type method: str
+        """
+
+        return self._match(self.root, self._split(url), 0, method, {})
+
+    def _match(self, node, segments, depth, method, arguments):
+        """Recursively traverse the trie looking for a matching node
+        """
+
+        if depth == len(segments):
+            if node.accepts(method):
+                return node, arguments
+
+            return None, None
+
+        segment = segments[depth]
+        child = node.static.get(segment)
+        if child is not None:
+            found = self._match(child, segments, depth + 1, method, arguments)
+            if found[0] is not None:
+                return found
+
+        for edge in node.typed:
+            values = edge.convert(segment)
+            if values is None:
+                continue
+
+            values.update(arguments)
+            found = self._match(edge.node, segments, depth + 1, method, values)
+            if found[0] is not None:
+                return found
+
+        return None, None
+
+    @staticmethod
+    def _split(url):
+        """Split a sanitized URL into segments
+        """
+
+        return [segment for segment in url.split('/') if segment]
 
 
 class Router(object):
@@ -143,10 +515,35 @@ class Router(object):
 
     A route is stores as:
         [methods][route][Controller.__class__.__name__]
+
+    The outcome of every lookup (including not found and not implemented
+    ones) is cached in a bounded LRU dispatch cache that is invalidated
+    every time that a route is registered.
+
+    The responses of the routes that define a `cache_ttl` are stored in
+    a response cache bounded by size in bytes.
+
+    The latency, size and outcome of every dispatched route are recorded
+    in the :mod:`mamba.web.metrics` registry
+
+    :param cache_size: the maximum number of entries in the dispatch cache
+    :type cache_size: int
+    :param response_cache_bytes: the maximum size of the response cache
+    :type response_cache_bytes: int
     """
 
-    def __init__(self):
+    handler_pool = None
+    clock = None
+
+    def __init__(self, cache_size=1024, response_cache_bytes=64 * 1024 ** 2):
 
+        self.dispatch_cache = LRUCache(cache_size)
+        self.response_cache = ResponseCache(response_cache_bytes)
+        self.metrics = metrics.registry
+        self.admission = AdmissionControl.from_config()
+        self.metrics.register_collector('admission', self.admission.collect)
+        self.metrics.register_collector(
+            'response_cache', self.response_cache.collect)
         self.routes = {
             'GET': defaultdict(dict),
             'POST': defaultdict(dict),
@@ -156,10 +553,10 @@ class Router(object):
             'PATCH': defaultdict(dict),
             'HEAD': defaultdict(dict)
         }
+        self._tries = defaultdict(RouteTrie)
 
         self._prepare_response = singledispatch(self._prepare_response)
         self._prepare_response.register(str, self._prepare_response_str)
-        self._prepare_response.register(Model, self._prepare_response_model)
         self._prepare_response.register(
             response.Response, self._prepare_response_object)
 
@@ -175,20 +572,58 @@ class Router(object):
         """
 
         try:
-            route, obj = RouteDispatcher(self, controller, request).lookup()
-
-            if type(route) is Route:
-                # at this point we can get a Deferred or an inmediate result
-                # depending on the user code
-                result = defer.maybeDeferred(route, obj, request)
-                result.addCallback(self._process, request)
+            dispatcher = RouteDispatcher(self, controller, request)
+            route, obj = dispatcher.lookup()
+
+            if type(route) is RouteMatch:
+                started = time.time()
+                dispatch, args = self._dispatch_route, (route, obj, request)
+                if route.route.cached and request.method in CONDITIONAL:
+                    dispatch = self._dispatch_cached
+                    args += (dispatcher.url,)
+
+                def admitted(*args):
+                    # the body is read and parsed only once the request
+                    # is admitted, rejected requests never pay for it
+                    dispatcher.parse_request_args(route)
+                    return dispatch(*args)
+
+                timeout = route.route.options.get('timeout')
+                try:
+                    if route.route.rate_limiter is not None:
+                        # abusive clients never reach the admission control
+                        route.route.rate_limiter.check(request)
+                except RateLimited as error:
+                    result = defer.fail(error)
+                else:
+                    if timeout:
+                        clock = self.get_clock()
+                        request.deadline = Deadline(timeout, clock.seconds)
+                        result = self._dispatch_admitted(
+                            obj, request, admitted, *args)
+                        result.addTimeout(timeout, clock)
+                    else:
+                        request.deadline = None
+                        result = self._dispatch_admitted(
+                            obj, request, admitted, *args)
                 result.addErrback(self._process_error, request=request)
+                result.addCallback(self._add_cors_headers, request)
+                result.addCallback(
+                    self._compress_response, request, route.route)
+                result.addCallback(
+                    self._record_metrics, obj, route.route, request, started)
+            elif route == 'Options':
+                result = defer.succeed(
+                    self._prepare_options_response(dispatcher.allow, request)
+                )
             elif route == 'NotImplemented':
-                result = defer.succeed(response.NotImplemented(
+                result = response.NotImplemented(
                     UrlSanitizer().sanitize_container(
                         [controller.get_register_path()] + request.postpath
                     )
-                ))
+                )
+                result.headers['allow'] = dispatcher.allow
+                result = defer.succeed(result)
             else:
                 msg = 'ERROR 404: {} not found'.format(
                     UrlSanitizer().sanitize_container(
@@ -215,6 +650,57 @@ class Router(object):
 
         return result
 
+    @classmethod
+    def get_handler_pool(cls):
+        """
+        Return the thread pool where threaded routes are dispatched, the
+        pool is created and started on first use and it is separated from
+        the database pool so blocking handlers can not starve it.
+
+        Its size can be configured using the `handler_min_threads` and
+        `handler_max_threads` options in the `application.json` file
+        """
+
+        from twisted.internet import reactor
+
+        if cls.handler_pool is None:
+            app = config.Application()
+            cls.handler_pool = ThreadPool(
+                getattr(app, 'handler_min_threads', 0),
+                getattr(app, 'handler_max_threads', 10),
+                'HandlerPool'
+            )
+
+        if not cls.handler_pool.started:
+            cls.handler_pool.start()
+            reactor.addSystemEventTrigger(
+                'during', 'shutdown', cls.handler_pool.stop)
+
+        return cls.handler_pool
+
+    def get_clock(self):
+        """Return the clock used to schedule the request deadlines
+        """
+
+        if self.clock is None:
+            from twisted.internet import reactor
+            return reactor
+
+        return self.clock
+
+    def route_defaults(self):
+        """
+        Return the default route options from the `application.json` file,
+        they are applied to every installed route that does not define them
+        """
+
+        app = config.Application()
+        return {
+            'max_body_size': getattr(app, 'max_body_size', None),
+            'compression': getattr(app, 'compression', None),
+            'timeout': getattr(app, 'request_timeout', None)
+        }
+
     def install_routes(self, controller):
         """Install all the routes in a controller.
 
@@ -222,14 +708,14 @@ class Router(object):
         :type controller: :class:`~mamba.Controller`
         """
 
+        defaults = self.route_defaults()
         for func in inspect.getmembers(controller, predicate=inspect.ismethod):
             error = False
             if hasattr(func[1], 'route'):
                 route = getattr(func[1], 'route')
-                route.url = UrlSanitizer().sanitize_string(
+                route = route.bind(UrlSanitizer().sanitize_string(
                     controller.get_register_path() + route.url
-                )
-                route.compile()
+                ), **defaults)
                 # normalize parameters
                 real_args = inspect.getargspec(route.callback)[0]
                 if real_args:
@@ -274,18 +760,21 @@ class Router(object):
         """
 
         controller_name = controller.__class__.__name__
+        self.dispatch_cache.clear()
 
         if getattr(config.Application(), 'debug', False):
             bold = output.bold
             log.info(
                 bold('Registering route:') + ' {route}'.format(route=route))
 
+        methods = route.method
+        if type(methods) not in [tuple, list]:
+            methods = [methods]
+
         try:
-            if type(route.method) in [tuple, list]:
-                for method in route.method:
-                    self.routes[method][route.url][controller_name] = route
-            else:
-                self.routes[route.method][route.url][controller_name] = route
+            for method in methods:
+                self.routes[method][route.url][controller_name] = route
+                self._tries[controller_name].insert(route, method)
         except KeyError as error:
             raise RouterError(
                 '{} is not a valid request method, at action {} in controller '
@@ -295,33 +784,574 @@ class Router(object):
                 )
             )
 
+    def match(self, controller_name, url, method=None):
+        """
+        Match an URL against the routes trie of the given controller name
+        and return back a tuple with the matched trie node and the converted
+        arguments or (None, None) if there is no match
+
+        :param controller_name: the controller class name
+        :type controller_name: str
+        :param url: the sanitized URL
+        :type url: str
+        :param method: the HTTP method, any method matches if None
+        :type method: str
+        """
+
+        trie = self._tries.get(controller_name)
+        if trie is None:
+            return None, None
+
+        return trie.match(url, method)
+
     # decorator
-    def route(self, url, method='GET'):
+    def route(self, url, method='GET', **options):
         """Register routes for controllers or full REST resources.
+
+        Available options are:
+
+            *threaded*
+                if True, the route is dispatched in the bounded handler
+                thread pool instead of the reactor thread, use it for legacy
+                handlers that block (they should not return Deferreds)
+
+            *max_body_size*
+                maximum size in bytes of the request body, larger requests
+                are rejected with a 413 response before parsing the body
+                (Twisted has already received and buffered it by then, the
+                limit saves the parsing only). The `max_body_size` option
+                in the `application.json` file sets the default for every
+                route
+
+            *lazy_body*
+                if True, the request body arguments are never passed to the
+                route callback, they are accessible (and parsed on first
+                use) through `request.json` and `request.form`
+
+            *etag*
+                if True, successful GET and HEAD responses get ETag (a hash
+                of the encoded body unless the handler returns a response
+                with an ETag header) and Last-Modified headers, requests
+                with matching If-None-Match or If-Modified-Since headers get
+                a 304 response without body
+
+            *validator*
+                a cheap callable with the same signature than the route
+                that returns an entity tag, a Last-Modified datetime, a
+                tuple of both or None (it can return a Deferred), a 304 is
+                decided with them before the route handler is called and
+                it implies `etag`
+
+            *cache_ttl*
+                time in seconds that successful GET responses are cached,
+                cached responses are sent back without calling the handler
+
+            *vary*
+                the request headers that cached responses vary on (they
+                always vary on the Accept header)
+
+            *vary_args*
+                the request arguments that cached responses vary on, they
+                vary on the whole query string if it is not given (an empty
+                tuple ignores the query string)
+
+            *stale_while_revalidate*
+                time in seconds that an expired cached response is still
+                served while a single background refresh runs
+
+            *compress*
+                True enables and False disables the response compression
+                for the route (it is disabled unless it is enabled in the
+                `compression` options of the `application.json` file), a
+                dict overrides those options (see
+                :class:`~mamba.web.compression.CompressionPolicy`)
+
+            *content_type*
+                the declared content type of the route results, string
+                results are sent back as they are with it and any other
+                result is encoded with the serializer for it (if any)
+
+            *serializers*
+                a list of :class:`~mamba.web.serializer.Serializer` (or a
+                :class:`~mamba.web.serializer.SerializerRegistry`) that
+                negotiate the route results instead of the global ones
+
+            *timeout*
+                time budget in seconds of the request, the `@transact`
+                database work started by the route gets the request
+                deadline (it is dropped if it is still queued when the
+                deadline expires and its statements are limited to the
+                remaining time) and the request fails with a 504 once it
+                is exceeded (503 if the database work never started).
+                The deadline is the `deadline` attribute of the request,
+                it is the current one only until the handler returns or
+                yields for the first time so the database work started
+                after that must get it explicitly::
+
+                    yield self.authorize(request)
+                    yield Customer.find(deadline=request.deadline)
+
+                The `request_timeout` option in the `application.json`
+                file sets the default for every route
+
+            *rate_limit*
+                token bucket rate limit per client, a dict with the `rate`
+                (requests per second), `burst`, `key` ('ip', 'session' or
+                a callable that returns the client key for a request),
+                `maxsize` (clients to remember) and `trusted_proxies`
+                (proxies whose X-Forwarded-For header is honored, the
+                `trusted_proxies` option in the `application.json` file
+                by default) options or just the rate.
+                Clients over the limit get a 429 response with a
+                Retry-After header (see
+                :class:`~mamba.web.ratelimit.RateLimiter`)
         """
         def decorator(func):
             @functools.wraps(func)
             def wrapper(*args, **kwargs):
                 return func
 
-            setattr(wrapper, 'route', Route(method, url, func))
+            setattr(wrapper, 'route', Route(method, url, func, **options))
 
             return wrapper
 
         return decorator
 
-    def _process(self, result, request):
+    def _compress_response(self, result, request, route):
+        """
+        Compress the response body with the content encoding negotiated
+        with the request Accept-Encoding header if the route compression
+        policy allows it, large bodies are compressed in the handler pool
+        """
+
+        if not isinstance(result, response.Response) or (
+                not isinstance(result.subject, str) or not result.subject):
+            return result
+
+        headers = dict(
+            (header.lower(), value)
+            for header, value in result.headers.iteritems()
+        )
+        content_type = headers.get('content-type')
+        policy = route.compression
+        if 'content-encoding' in headers or not policy.accepts(
+                content_type, len(result.subject)):
+            return result
+
+        result.headers = dict(result.headers)
+        add_vary(result.headers)
+        encoding = policy.negotiate(request.getHeader('accept-encoding'))
+        if encoding is None:
+            return result
+
+        def set_subject(subject):
+            result.subject = subject
+            result.headers['content-encoding'] = encoding
+            etag = headers.get('etag')
+            if etag is not None and not etag.startswith('W/'):
+                # the compressed body is not byte per byte equal anymore
+                for header in result.headers.keys():
+                    if header.lower() == 'etag':
+                        result.headers[header] = 'W/' + etag
+            return result
+
+        subject = policy.compress(
+            result.subject, encoding, self.get_handler_pool())
+        if isinstance(subject, str):
+            return set_subject(subject)
+
+        return subject.addCallback(set_subject)
+
+    def _record_metrics(self, result, controller, route, request, started):
+        """
+        Record the latency, response size and outcome of a dispatched route
+        in the metrics registry
+        """
+
+        size, error = 0, True
+        if isinstance(result, response.Response):
+            error = result.code >= http.INTERNAL_SERVER_ERROR
+            if isinstance(result.subject, str):
+                size = len(result.subject)
+
+        self.metrics.record(
+            controller.__class__.__name__, route.url, request.method,
+            time.time() - started, size, error
+        )
+        return result
+
+    def _dispatch_admitted(self, controller, request, dispatch, *args):
+        """
+        Dispatch a matched route once the admission control admits it, the
+        request deadline (if any) is the current one while the route is
+        called so the database work started there gets it
+        """
+
+        def call(release=None):
+            started = time.time()
+            request_deadline = getattr(request, 'deadline', None)
+            if request_deadline is not None:
+                result = defer.maybeDeferred(
+                    deadline.call, request_deadline, dispatch, *args)
+            else:
+                result = defer.maybeDeferred(dispatch, *args)
+
+            if release is not None:
+                def done(outcome):
+                    overloaded = isinstance(
+                        getattr(outcome, 'value', outcome),
+                        (DeadlineExceeded, defer.TimeoutError)
+                    )
+                    release(time.time() - started, overloaded)
+                    return outcome
+
+                result.addBoth(done)
+
+            return result
+
+        admitted = self.admission.acquire(controller)
+        if admitted is None:
+            return call()
+
+        return admitted.addCallback(call)
+
+    def _dispatch_route(self, match, controller, request):
+        """Dispatch a matched route checking its validator first (if any)
+        """
+
+        validator = match.route.options.get('validator')
+        if validator is not None and request.method in CONDITIONAL:
+            # the validator can answer with a 304 before the
+            # (expensive) route handler is called at all
+            result = defer.maybeDeferred(
+                validator, controller, request, **match.callback_args
+            )
+            result.addCallback(
+                self._check_validators, match, controller, request)
+            return result
+
+        return self._call_route(match, controller, request)
+
+    def _dispatch_cached(self, match, controller, request, url):
+        """
+        Answer from the response cache if there is a fresh (or a stale that
+        can still be served) response for the request, stale responses are
+        refreshed in background (only one refresh runs at the same time)
+        """
+
+        route = match.route
+        key = self.response_cache.make_key(
+            controller.__class__.__name__, url, request,
+            route.options.get('vary', ()), route.options.get('vary_args')
+        )
+        entry, state = self.response_cache.lookup(key)
+        if entry is not None:
+            stale = state == ResponseCache.STALE
+            if stale and request.method == 'GET' and not entry.refreshing:
+                entry.refreshing = True
+                refresh = self._dispatch_route(match, controller, request)
+                refresh.addCallback(self._store_response, key, route)
+                refresh.addErrback(log.err)
+                refresh.addBoth(lambda _: setattr(entry, 'refreshing', False))
+
+            result = response.Response(
+                entry.code, entry.subject, dict(entry.headers))
+            result.headers['age'] = str(
+                entry.age(self.response_cache.clock()))
+            if route.conditional:
+                result = self._prepare_conditional_response(
+                    result, request, None)
+            if request.method == 'HEAD':
+                result.subject = ''
+
+            return defer.succeed(result)
+
+        result = self._dispatch_route(match, controller, request)
+        if request.method == 'GET':
+            result.addCallback(self._store_response, key, route)
+
+        return result
+
+    def _store_response(self, result, key, route):
+        """Store a successful response in the response cache
+        """
+
+        if not isinstance(result, response.Response):
+            return result
+
+        # the serializer is negotiated with the Accept header
+        result.headers = dict(result.headers)
+        for header in tuple(route.options.get('vary', ())) + ('Accept',):
+            add_vary(result.headers, header)
+
+        if result.code == http.OK and isinstance(result.subject, str):
+            self.response_cache.store(
+                key, result.code, result.subject, result.headers,
+                route.options['cache_ttl'],
+                route.options.get('stale_while_revalidate', 0)
+            )
+
+        return result
+
+    def _call_route(self, match, controller, request, validators=None):
+        """
+        Call the matched route and process its result, threaded routes are
+        called in the handler thread pool
+        """
+
+        # at this point we can get a Deferred or an inmediate result
+        # depending on the user code
+        if match.route.threaded:
+            from twisted.internet import reactor
+            result = threads.deferToThreadPool(
+                reactor, self.get_handler_pool(), match, controller, request
+            )
+        else:
+            result = defer.maybeDeferred(match, controller, request)
+
+        result.addCallback(self._process, request, match.route, validators)
+        return result
+
+    def _check_validators(self, validators, match, controller, request):
+        """
+        Answer with a 304 if the validators returned by the route validator
+        match the request conditional headers, call the route otherwise
+        """
+
+        etag, last_modified = self._normalize_validators(validators)
+        if self._not_modified(request, etag, last_modified):
+            return response.NotModified(
+                self._validator_headers(etag, last_modified))
+
+        return self._call_route(
+            match, controller, request, (etag, last_modified))
+
+    def _process(self, result, request, route=None, validators=None):
         """Prepare and process the result.
         """
 
         if result is None:
             return response.Unknown()
 
+        if is_streamable(result):
+            content_type = 'application/octet-stream'
+            if route is not None:
+                content_type = route.options.get('content_type', content_type)
+            return response.Streamed(result, content_type)
+
         try:
-            return self._prepare_response(result, request)
+            conditional = route is not None and route.conditional and (
+                request.method in CONDITIONAL
+            )
+            if request.method == 'HEAD' and not conditional:
+                return self._prepare_head_response(result, request, route)
+
+            result = self._prepare_response(result, request, route)
+            if conditional:
+                result = self._prepare_conditional_response(
+                    result, request, validators)
+                if request.method == 'HEAD':
+                    result.subject = ''
+
+            return result
         except Exception as error:
             return self._process_error(error, result, request)
 
+    def _prepare_conditional_response(self, result, request, validators):
+        """
+        Add the ETag and Last-Modified headers to a successful response and
+        return a 304 if they match the request conditional headers.
+
+        The validators returned by the route validator are used if any,
+        otherwise the handler supplied ETag header or a hash of the encoded
+        body is used as entity tag
+        """
+
+        if result.code != http.OK or not isinstance(result.subject, str):
+            return result
+
+        headers = dict(
+            (header.lower(), value)
+            for header, value in result.headers.iteritems()
+        )
+        etag, last_modified = validators or (None, None)
+        if etag is None:
+            etag = headers.get('etag')
+            if etag is None:
+                etag = hashlib.sha1(result.subject).hexdigest()
+        if last_modified is None:
+            last_modified = headers.get('last-modified')
+
+        etag, last_modified = self._normalize_validators(
+            (etag, last_modified))
+        validator_headers = self._validator_headers(etag, last_modified)
+        if self._not_modified(request, etag, last_modified):
+            return response.NotModified(validator_headers)
+
+        result.headers = dict(result.headers)
+        result.headers.update(validator_headers)
+        return result
+
+    def _normalize_validators(self, validators):
+        """
+        Convert the validators returned by a route validator into a tuple
+        of a quoted entity tag and a Last-Modified timestamp (both can be
+        None). Validators can be an entity tag string, a datetime (or a
+        timestamp) or a tuple of both
+        """
+
+        if isinstance(validators, tuple):
+            etag, last_modified = validators
+        elif isinstance(validators, basestring):
+            etag, last_modified = validators, None
+        else:
+            etag, last_modified = None, validators
+
+        if etag is not None:
+            etag = str(etag)
+            if not etag.startswith(('"', 'W/"')):
+                etag = '"{}"'.format(etag)
+
+        if isinstance(last_modified, basestring):
+            last_modified = http.stringToDatetime(last_modified)
+        elif isinstance(last_modified, datetime.datetime):
+            last_modified = calendar.timegm(last_modified.utctimetuple())
+        elif last_modified is not None:
+            last_modified = int(last_modified)
+
+        return etag, last_modified
+
+    def _validator_headers(self, etag, last_modified):
+        """Return the ETag and Last-Modified headers for the validators
+        """
+
+        headers = {}
+        if etag is not None:
+            headers['etag'] = etag
+        if last_modified is not None:
+            headers['last-modified'] = http.datetimeToString(last_modified)
+
+        return headers
+
+    def _not_modified(self, request, etag, last_modified):
+        """
+        Return True if the request conditional headers match the given
+        validators, If-None-Match takes precedence over If-Modified-Since
+        """
+
+        if_none_match = request.getHeader('if-none-match')
+        if if_none_match is not None:
+            if etag is None:
+                return False
+
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag.replace('W/', '', 1) in [
+                tag.replace('W/', '', 1) for tag in tags
+            ]
+
+        if_modified_since = request.getHeader('if-modified-since')
+        if if_modified_since is not None and last_modified is not None:
+            try:
+                since = http.stringToDatetime(if_modified_since)
+            except (ValueError, KeyError, IndexError):
+                return False
+
+            return last_modified <= since
+
+        return False
+
+    def _prepare_head_response(self, result, request, route=None):
+        """
+        Prepare the response of a HEAD request, the headers are the same
+        than the ones of the GET request but the body is never serialized
+        """
+
+        if isinstance(result, response.Response):
+            result.subject = ''
+        elif isinstance(result, str):
+            result = self._prepare_response_str(result, request, route)
+            result.subject = ''
+        else:
+            encoder = self._negotiate_serializer(result, request, route)
+            result = response.Ok('', {'content-type': encoder.header})
+
+        return result
+
+    def _prepare_options_response(self, allow, request):
+        """
+        Answer an OPTIONS request (or CORS preflight) using the allowed
+        methods index, the `cors` option in the `application.json` file
+        configures the CORS headers::
+
+            "cors": {
+                "allow_origin": "*",
+                "allow_credentials": false,
+                "max_age": 86400
+            }
+
+        `allow_origin` is "*" or the list of allowed origins (a single
+        origin can be given as a string), they are compared exactly. If
+        it is not configured, no CORS headers are added
+        """
+
+        headers = {'allow': allow, 'content-type': 'text/plain'}
+        cors = getattr(config.Application(), 'cors', None) or {}
+        if self._allow_cors_origin(request, cors, headers):
+            headers['access-control-allow-methods'] = allow
+            headers['access-control-max-age'] = str(cors.get('max_age', 86400))
+            request_headers = request.getHeader(
+                'access-control-request-headers')
+            if request_headers is not None:
+                headers['access-control-allow-headers'] = request_headers
+            if cors.get('allow_credentials', False) is True:
+                headers['access-control-allow-credentials'] = 'true'
+
+        return response.Ok('', headers)
+
+    def _add_cors_headers(self, result, request):
+        """
+        Add the CORS headers of the `cors` option in the `application.json`
+        file to a routed response for an allowed cross origin request
+        """
+
+        if not isinstance(result, response.Response):
+            return result
+
+        cors = getattr(config.Application(), 'cors', None) or {}
+        headers = dict(result.headers)
+        if self._allow_cors_origin(request, cors, headers):
+            if cors.get('allow_credentials', False) is True:
+                headers['access-control-allow-credentials'] = 'true'
+            result.headers = headers
+
+        return result
+
+    def _allow_cors_origin(self, request, cors, headers):
+        """
+        Add the Access-Control-Allow-Origin header (and Vary: Origin when
+        the origin is echoed back) to the given headers if the request
+        origin is allowed, returns True if it is
+        """
+
+        origin = request.getHeader('origin')
+        allow_origin = cors.get('allow_origin')
+        if origin is None or allow_origin is None:
+            return False
+
+        if allow_origin == '*':
+            headers['access-control-allow-origin'] = '*'
+            return True
+
+        if isinstance(allow_origin, basestring):
+            allow_origin = [allow_origin]
+
+        if origin not in frozenset(allow_origin):
+            return False
+
+        headers['access-control-allow-origin'] = origin
+        add_vary(headers, 'Origin')
+        return True
+
     def _process_error(self, error=None, result=None, request=None):
         """Process and sendback an error response
         """
@@ -329,50 +1359,152 @@ class Router(object):
         if isinstance(error, response.Response):
             error = error.subject
 
+        exception = getattr(error, 'value', error)
+        if isinstance(exception, (DeadlineExceeded, defer.TimeoutError)):
+            return self._deadline_response(exception)
+
+        if isinstance(exception, RateLimited):
+            return response.TooManyRequests(
+                'ERROR 429: {}'.format(exception),
+                {'content-type': 'text/plain'}, exception.retry_after
+            )
+
+        if isinstance(exception, InvalidCursor):
+            return response.BadRequest(
+                'ERROR 400: {}'.format(exception),
+                {'content-type': 'text/plain'}
+            )
+
+        if isinstance(exception, AdmissionRejected):
+            return response.ServiceUnavailable(
+                'ERROR 503: {}'.format(exception),
+                {'content-type': 'text/plain'}, exception.retry_after
+            )
+
+        if isinstance(exception, RequestBodyTooLarge):
+            return response.RequestEntityTooLarge(
+                str(exception), {'content-type': 'text/plain'})
+
         log.err(error, 'Deferred failed:')
         return response.InternalServerError(
             'ERROR 500: Internal server error {}\n{}'.format(error, result)
         )
 
-    def _prepare_response(self, result, request):
-        """Renders the result to convert it to the appropiate format
+    def _deadline_response(self, error):
+        """
+        Return a 503 if the request database work was dropped before it
+        started (the database is overloaded) or a 504 otherwise
         """
 
-        result = Converter.serialize(result)
-        headers = {'content-type': 'application/json'}
-        retval = response.Ok(result, headers)
+        headers = {'content-type': 'text/plain'}
+        if getattr(error, 'queued', False):
+            return response.ServiceUnavailable(
+                'ERROR 503: {}'.format(error), headers)
 
-        return retval
+        return response.GatewayTimeout(
+            'ERROR 504: request deadline exceeded', headers)
 
-    def _prepare_response_str(self, result, request):
-        """Renders the result into 'text/html' or 'text/plain' content-type
+    def _prepare_response(self, result, request, route=None):
+        """
+        Encode the result in a single pass with the serializer negotiated
+        for its type and the request Accept header
         """
 
-        if re.match(UrlRegex.html_regex, result):
-            result = response.Ok(result, {'content-type': 'text/html'})
-        else:
-            result = response.Ok(result, {'content-type': 'text/plain'})
+        encoder = self._negotiate_serializer(result, request, route)
+        return response.Ok(
+            encoder.serialize(result), {'content-type': encoder.header}
+        )
 
-        return result
+    def _prepare_response_str(self, result, request, route=None):
+        """
+        Renders the result with the route declared content type, if the
+        route does not declare it, 'text/html' or 'text/plain' is used
+        """
+
+        content_type = None
+        if route is not None:
+            content_type = route.options.get('content_type')
+
+        if content_type is None:
+            content_type = 'text/plain'
+            if result.startswith('<'):
+                # never scan further than the first tag
+                end = result.find('>') + 1
+                if end and UrlRegex.html_regex.match(result, 0, end):
+                    content_type = 'text/html'
 
-    def _prepare_response_object(self, result, request):
-        """Renders the result.subject into JSON if needed
+        return response.Ok(result, {'content-type': content_type})
+
+    def _prepare_response_object(self, result, request, route=None):
+        """
+        Encode the result.subject with the serializer for its declared
+        content type, if it does not declare any, the serializer is
+        negotiated and the content type header is added
         """
 
-        if isinstance(result.subject, Model):
-            result.subject = result.subject.json
-        elif 'application/json' in result.headers.values():
-            result.subject = Converter.serialize(result.subject)
+        if isinstance(result.subject, str) or is_streamable(result.subject):
+            return result
+
+        content_type = None
+        for header, value in result.headers.iteritems():
+            if header.lower() == 'content-type':
+                content_type = value
+                break
+
+        if content_type is None:
+            encoder = self._negotiate_serializer(
+                result.subject, request, route)
+            result.headers = dict(result.headers)
+            result.headers['content-type'] = encoder.header
+        else:
+            registry = serializer.registry if route is None else (
+                route.serializers
+            )
+            encoder = registry.get(content_type)
+            if encoder is None:
+                return result
 
+        result.subject = encoder.serialize(result.subject)
         return result
 
-    def _prepare_response_model(self, result, request):
-        """Convert a model object into JSON and return it back (try)
+    def _negotiate_serializer(self, result, request, route=None):
         """
+        Return the serializer for the route declared content type or the
+        one negotiated for the result type and the request Accept header
+        """
+
+        if route is None:
+            return serializer.registry.negotiate(
+                result, request.getHeader('accept'))
+
+        content_type = route.options.get('content_type')
+        if content_type is not None:
+            encoder = route.serializers.get(content_type)
+            if encoder is not None:
+                return encoder
 
-        headers = {'content-type': 'application/json'}
-        retval = response.Ok(result.json, headers)
-        return retval
+        return route.serializers.negotiate(result, request.getHeader('accept'))
+
+
+def cache_dispatch(func):
+    """
+    Cache the outcome of a :class:`~mamba.web.routing.RouteDispatcher`
+    resolution in the router dispatch cache keyed on the HTTP method, the
+    controller class and the sanitized URL. NotFound and NotImplemented
+    outcomes are cached as well
+    """
+
+    @functools.wraps(func)
+    def wrapper(self):
+        key = (self.method, self.controller, self.url)
+        outcome = self.router.dispatch_cache.get(key)
+        if outcome is None:
+            outcome = func(self)
+            self.router.dispatch_cache.set(key, outcome)
+
+        return outcome
+
+    return wrapper
 
 
 class RouteDispatcher(object):
@@ -390,121 +1522,137 @@ class RouteDispatcher(object):
                 [controller.get_register_path()] + request.postpath
             )
         else:
-            i = 0
-            if controller.__parent__ in request.postpath:
-                i = request.postpath.index(controller.__parent__) + 1
-
-            self.url = UrlSanitizer().sanitize_container(request.postpath[i:])
+            self.url = self._child_url(controller)
 
-    # @cache_dispatch
     def lookup(self):
         """
-        I traverse the URLs at router picking up the ones that match the
-        controller name and then process it to validate which ones match
-        by path/arguments to a particular Route
+        I match the URL against the routes trie of the controller (and its
+        children) to find the :class:`~mamba.web.routing.Route` that should
+        be dispatched for the request HTTP method
 
-        If nothing match just returns None
+        If the URL matches but not for the request method I return
+        'NotImplemented', if the request is an OPTIONS one that has no
+        route defined I return 'Options', if nothing match just returns None.
+
+        The allowed methods for the matched URL are stored in the `allow`
+        attribute of the dispatcher
         """
 
         # postpath '/' is not allowed when using mamba routing
         if len(self.request.postpath) and self.request.postpath[0] == '':
             return None, None
 
-        route, controller = self._lookup()
-        if route is not None:
-            return route, controller
+        route, controller, arguments, self.allow = self._resolve()
+        if type(route) is Route:
+            route = RouteMatch(route, dict(arguments))
 
-        for url in self.router.routes.values():
-            controllers = url.values()
-            if len(controllers):
-                for i in range(len(controllers)):
-                    if self.controller in controllers[i]:
-                        r = controllers[i].get(self.controller).validate(self)
-                        if r:
-                            return 'NotImplemented', None
+        return route, controller
 
-        return None, None
+    @cache_dispatch
+    def _resolve(self):
+        """
+        Resolve the route, the controller and the route arguments for
+        this dispatcher (the outcome is cached by the router)
+        """
+
+        found = self._lookup()
+        if found[0] is not None:
+            return found
+
+        node, _ = self.router.match(self.controller, self.url)
+        if node is not None:
+            return 'NotImplemented', None, None, node.allow
+
+        return None, None, None, None
 
     def _lookup(self):
         """Lookup the route
         """
 
-        for controllers in self.router.routes[self.method].values():
-            if self.controller in controllers:
-                route = controllers.get(self.controller).validate(self)
-                if route:
-                    self._parse_request_args(route)
-                    return route, self.controller_object
+        node, arguments = self.router.match(
+            self.controller, self.url, self.method)
+        if node is not None:
+            return self._found(node, self.controller_object, arguments)
 
-        return self._lookup_children()
+        return self._lookup_children(self.controller_object)
 
-    def _lookup_children(self, child=None, level=0):
-        """Lookup the route in children
+    def _lookup_children(self, controller):
+        """Lookup the route in the controller children (and theirs)
         """
 
-        found = None, None
-        if child is None:
-            for _, child in self.controller_object.children.items():
-                found = self._lookup_children(child, level + 1)
-                if found is not None:
-                    return found
-        else:
-            for controllers in self.router.routes[self.method].values():
-                if child.__class__.__name__ in controllers:
-                    rd = RouteDispatcher(
-                        self.router, child, self.request, False)
-                    route = controllers.get(
-                        child.__class__.__name__).validate(rd)
+        for child in controller.children.values():
+            node, arguments = self.router.match(
+                child.__class__.__name__, self._child_url(child), self.method
+            )
+            if node is not None:
+                return self._found(node, child, arguments)
+
+            found = self._lookup_children(child)
+            if found[0] is not None:
+                return found
 
-                    if route is not None:
-                        self._parse_request_args(route)
-                        return route, child
+        return None, None, None, None
 
-            if found[0] is None:
-                for _, next_child in child.children.items():
-                    found = self._lookup_children(next_child, level + 1)
-                    if found[0] is not None:
-                        return found
+    def _found(self, node, controller, arguments):
+        """Build the lookup outcome for the given matched node
+        """
 
-        return found
+        route = node.route_for(self.method)
+        if route is None:
+            # OPTIONS request without an explicit route
+            return 'Options', controller, None, node.allow
 
-    def _parse_request_args(self, route):
-        """Parses JSON data and request form if present
+        return route, controller, arguments, node.allow
+
+    def _child_url(self, child):
+        """Return the URL relative to the given child controller
         """
 
-        data = self.request.content.read()
-        data_json = {}
+        i = 0
+        if child.__parent__ in self.request.postpath:
+            i = self.request.postpath.index(child.__parent__) + 1
 
-        if self.request.method in ['POST', 'PUT', 'PATCH']:
-            ct = self.request.requestHeaders.getRawHeaders('content-type')
-            try:
-                if ct is not None and len(
-                        [h for h in ct if 'application/json' in h]) > 0:
-                    data_json = json.loads(data)
-                    self.request.json = data_json
-            except ValueError:
-                self.request.json = {}
+        return UrlSanitizer().sanitize_container(self.request.postpath[i:])
+
+    def parse_request_args(self, match):
+        """
+        Merge the request arguments into the match callback arguments, the
+        router calls me once the request has been admitted.
+
+        The request body is read and parsed only if the route callback can
+        receive body arguments, in any case it is lazily accessible through
+        `request.json` and `request.form`. Bodies larger than the route
+        `max_body_size` are rejected before being parsed
+        """
+
+        route = match.route
+        body = get_body(self.request, route.options.get('max_body_size'))
+        body.check_size()
 
         request_args = self.request.args
-        request_headers = self.request.requestHeaders.getRawHeaders(
-            'content-type'
-        )
+        data_json = {}
+
+        if self.request.method in ['POST', 'PUT', 'PATCH'] and route.body_args:
+            ct = body.content_type
+            if self.request.method == 'PUT':
+                if 'application/x-www-form-urlencoded' in ct:
+                    request_args = body.form
 
-        if self.request.method == 'PUT' and request_headers:
-            if 'application/x-www-form-urlencoded' in request_headers:
-                request_args = parse_qs(data, 1)
+            if not request_args and 'application/json' in ct:
+                data_json = body.json
+                self.request.json = data_json
 
         if len(request_args) > 0:
             for key, value in request_args.iteritems():
-                if key not in route.callback_args:
-                    route.callback_args.update(
+                if key not in match.callback_args:
+                    match.callback_args.update(
                         {key: value if len(value) > 1 else value[0]}
                     )
         elif data_json:
             if type(data_json) is dict:
                 for key, value in data_json.iteritems():
-                    if key not in route.callback_args:
-                        route.callback_args.update({key: value})
+                    if key not in match.callback_args:
+                        match.callback_args.update({key: value})
 
     def __repr__(self):
         return 'RouteDispatcher({})'.format(', '.join(
@@ -0,0 +1,361 @@
+# -*- test-case-name: mamba.test.test_serializer -*-
+# Copyright (c) 2012 - 2013 Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+.. module: serializer
+    :platform: Unix, Windows
+    :synopsis: Pluggable response serializers
+
+.. moduleauthor:: Oscar Campos <oscar.campos@member.fsf.org>
+"""
+
+import json  # standard library json, we need the default hook
+import decimal
+import datetime
+
+from mamba.utils.lru import LRUCache
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+_adapters = {
+    decimal.Decimal: str,
+    datetime.datetime: str,
+    datetime.date: str,
+    datetime.time: str,
+    datetime.timedelta: str,
+    set: list,
+    frozenset: list
+}
+# adapter (or None) found in the MRO of every adapted type
+_lookups = {}
+
+
+def register_adapter(klass, adapter):
+    """
+    Register an adapter that converts objects of the given class (and its
+    subclasses) into something that the serializers can encode::
+
+        register_adapter(Money, lambda money: money.amount)
+
+    :param klass: the class to adapt
+    :type klass: type
+    :param adapter: a callable that returns the adapted object
+    :type adapter: callable
+    """
+
+    _adapters[klass] = adapter
+    _lookups.clear()
+
+
+def unregister_adapter(klass):
+    """Unregister the adapter for the given class (if any)
+    """
+
+    _adapters.pop(klass, None)
+    _lookups.clear()
+
+
+def _lookup(klass):
+    """Return the adapter for the given class (cached) or None
+    """
+
+    try:
+        return _lookups[klass]
+    except KeyError:
+        pass
+
+    adapter = None
+    for base in getattr(klass, '__mro__', ()):
+        adapter = _adapters.get(base)
+        if adapter is not None:
+            break
+
+    _lookups[klass] = adapter
+    return adapter
+
+
+def adapt(obj):
+    """
+    Convert an object that is not natively supported by the serializers,
+    the registered adapters are looked up in the object MRO, if there is
+    no adapter, the public attributes of the object are returned as a dict
+    """
+
+    adapter = _lookup(type(obj))
+    if adapter is not None:
+        return adapter(obj)
+
+    if hasattr(obj, '__iter__') and not hasattr(obj, '__dict__'):
+        return list(obj)
+
+    if getattr(obj, '__dict__', False):
+        return dict(
+            (key, value) for key, value in obj.__dict__.iteritems()
+            if not key.startswith('_')
+        )
+
+    values = {}
+    for name in dir(obj):
+        if not name.startswith('_'):
+            value = getattr(obj, name)
+            if not callable(value):
+                values[name] = value
+
+    return values
+
+
+def parse_accept(accept):
+    """
+    Parse an HTTP Accept header and return its media ranges sorted by
+    quality (media ranges with quality 0 are discarded)
+
+    :param accept: the Accept header value
+    :type accept: str
+    """
+
+    ranges = []
+    for position, part in enumerate(accept.split(',')):
+        params = part.split(';')
+        media = params[0].strip().lower()
+        if not media:
+            continue
+
+        quality = 1.0
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if quality > 0:
+            ranges.append((-quality, position, media))
+
+    return [media for _, _, media in sorted(ranges)]
+
+
+class Serializer(object):
+    """
+    I am the base class for response serializers, I encode Python objects
+    into the bytes that are sent back to the browser in a single pass.
+
+    Subclasses must define the `content_type` that they produce, the
+    Python `types` that they are able to encode and override the
+    :meth:`serialize` method
+    """
+
+    content_type = None
+    aliases = ()
+    charset = None
+    types = (object,)
+
+    @property
+    def header(self):
+        """Return the value for the Content-Type header
+        """
+
+        if self.charset is not None:
+            return '{}; charset={}'.format(self.content_type, self.charset)
+
+        return self.content_type
+
+    def handles(self, klass):
+        """Return True if I can encode objects of the given class
+        """
+
+        return issubclass(klass, self.types)
+
+    def matches(self, media):
+        """Return True if I produce the given media range
+        """
+
+        if media == '*/*' or media == self.content_type:
+            return True
+
+        if media.endswith('/*'):
+            return self.content_type.startswith(media[:-1])
+
+        return media in self.aliases
+
+    def serialize(self, obj):
+        """Encode the given object into bytes
+        """
+
+        raise NotImplementedError('serialize')
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.content_type)
+
+
+class JSONSerializer(Serializer):
+    """
+    I encode any object into JSON in one pass, objects that are not
+    natively supported by JSON are converted using the registered adapters
+    """
+
+    content_type = 'application/json'
+
+    def __init__(self):
+        self.encoder = json.JSONEncoder(default=adapt)
+
+    def serialize(self, obj):
+        if type(obj) is list and obj:
+            # lists of models are adapted in one go instead of calling
+            # the encoder default hook for every item
+            klass = type(obj[0])
+            adapter = _lookup(klass)
+            if adapter is not None:
+                obj = [
+                    adapter(item) if type(item) is klass else item
+                    for item in obj
+                ]
+
+        return self.encoder.encode(obj)
+
+
+class MsgpackSerializer(Serializer):
+    """
+    I encode any object into MessagePack, I am only available if the
+    `msgpack` package is installed
+    """
+
+    content_type = 'application/msgpack'
+    aliases = ('application/x-msgpack',)
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError('msgpack is not installed')
+
+    def serialize(self, obj):
+        return msgpack.packb(obj, default=adapt)
+
+
+class PlainTextSerializer(Serializer):
+    """I encode strings and numbers into plain text
+    """
+
+    content_type = 'text/plain'
+    charset = 'utf-8'
+    types = (basestring, int, long, float)
+
+    def serialize(self, obj):
+        if isinstance(obj, unicode):
+            return obj.encode('utf-8')
+
+        return str(obj)
+
+
+class SerializerRegistry(object):
+    """
+    I am a registry of :class:`~mamba.web.serializer.Serializer` objects,
+    I choose the serializer for a given Python type and Accept header
+    (the outcome is cached per type and header).
+
+    When nothing in the Accept header matches, the first registered
+    serializer that handles the type is used.
+
+    :param serializers: the serializers to register (in preference order)
+    :type serializers: list
+    """
+
+    def __init__(self, serializers=()):
+        self._serializers = []
+        self._cache = LRUCache(256)
+        for serializer in serializers:
+            self.register(serializer)
+
+    def register(self, serializer, first=False):
+        """
+        Register a serializer replacing any other one that produces the
+        same content type
+
+        :param serializer: the serializer to register
+        :type serializer: :class:`~mamba.web.serializer.Serializer`
+        :param first: if True the serializer is preferred over the others
+        :type first: bool
+        """
+
+        self.unregister(serializer.content_type)
+        if first is True:
+            self._serializers.insert(0, serializer)
+        else:
+            self._serializers.append(serializer)
+
+    def unregister(self, content_type):
+        """Unregister the serializer for the given content type (if any)
+        """
+
+        self._serializers = [
+            s for s in self._serializers if s.content_type != content_type
+        ]
+        self._cache.clear()
+
+    def get(self, content_type):
+        """
+        Return the serializer that produces the given content type or None
+        """
+
+        media = content_type.split(';')[0].strip().lower()
+        for serializer in self._serializers:
+            if media == serializer.content_type or media in serializer.aliases:
+                return serializer
+
+    def negotiate(self, obj, accept=None):
+        """
+        Return the serializer that should encode the given object for
+        the given Accept header
+
+        :param obj: the object to encode
+        :param accept: the request Accept header
+        :type accept: str
+        """
+
+        key = (type(obj), accept)
+        serializer = self._cache.get(key)
+        if serializer is None:
+            serializer = self._negotiate(type(obj), accept)
+            self._cache.set(key, serializer)
+
+        return serializer
+
+    def _negotiate(self, klass, accept):
+        """Choose the serializer (uncached)
+        """
+
+        candidates = [s for s in self._serializers if s.handles(klass)]
+        if not candidates:
+            raise TypeError(
+                'There is no serializer for {} objects'.format(klass.__name__)
+            )
+
+        for media in parse_accept(accept or ''):
+            for serializer in candidates:
+                if serializer.matches(media):
+                    return serializer
+
+        return candidates[0]
+
+    def __iter__(self):
+        return iter(self._serializers)
+
+    def __len__(self):
+        return len(self._serializers)
+
+
+registry = SerializerRegistry([JSONSerializer()])
+if msgpack is not None:
+    registry.register(MsgpackSerializer())
+registry.register(PlainTextSerializer())
+
+
+__all__ = [
+    'Serializer', 'JSONSerializer', 'MsgpackSerializer',
+    'PlainTextSerializer', 'SerializerRegistry', 'registry',
+    'register_adapter', 'unregister_adapter', 'adapt', 'parse_accept'
+]
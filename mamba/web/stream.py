@@ -0,0 +1,326 @@
+# -*- test-case-name: mamba.test.test_stream -*-
+# Copyright (c) 2012 - 2013 Oscar Campos <oscar.campos@member.fsf.org>
+# See LICENSE for more details
+
+"""
+.. module: stream
+    :platform: Unix, Windows
+    :synopsis: Streaming of responses with transport backpressure
+
+.. moduleauthor:: Oscar Campos <oscar.campos@member.fsf.org>
+"""
+
+import types
+import itertools
+
+import transaction
+from zope.interface import implementer
+from twisted.internet import defer, task, threads
+from twisted.internet.interfaces import IPushProducer
+from twisted.web.iweb import IBodyProducer, UNKNOWN_LENGTH
+
+from mamba.web import serializer
+
+
+def is_streamable(obj):
+    """
+    Return True if the given object should be streamed instead of encoded
+    in memory: generators, iterators and body producers (objects that
+    define a `startProducing(consumer)` method)
+    """
+
+    if isinstance(obj, types.GeneratorType):
+        return True
+
+    if isinstance(obj, basestring):
+        return False
+
+    if callable(getattr(obj, 'startProducing', None)):
+        return True
+
+    if callable(getattr(obj, 'next', None)):
+        try:
+            return iter(obj) is obj
+        except TypeError:
+            return False
+
+    return False
+
+
+@implementer(IPushProducer)
+class IteratorProducer(object):
+    """
+    I write the chunks of an iterator into a request, I am registered as a
+    streaming producer of the request so the transport pauses me when the
+    client is slower than us and resumes me when it catches up.
+
+    The iterator can yield strings (unicode is encoded as UTF-8) or
+    Deferreds that fire with strings
+
+    :param iterator: the iterator to stream
+    :param request: the HTTP request
+    :type request: :class:`twisted.web.server.Request`
+    :param cooperator: the cooperator that schedules the writes
+    :type cooperator: :class:`twisted.internet.task.Cooperator`
+    """
+
+    def __init__(self, iterator, request, cooperator=task):
+        self.iterator = iterator
+        self.request = request
+        self.cooperator = cooperator
+        self._task = None
+
+    def start(self):
+        """
+        Start streaming, returns a Deferred that fires when the iterator
+        is exhausted (or fails)
+        """
+
+        self.request.registerProducer(self, True)
+        self._task = self.cooperator.cooperate(self._produce())
+        result = self._task.whenDone()
+        result.addBoth(self._unregister)
+        return result
+
+    def pauseProducing(self):
+        self._task.pause()
+
+    def resumeProducing(self):
+        self._task.resume()
+
+    def stopProducing(self):
+        try:
+            self._task.stop()
+        except task.TaskDone:
+            pass
+
+    def _produce(self):
+        for chunk in self.iterator:
+            if isinstance(chunk, defer.Deferred):
+                yield chunk.addCallback(self._write)
+            else:
+                self._write(chunk)
+                yield None
+
+    def _write(self, chunk):
+        if isinstance(chunk, unicode):
+            chunk = chunk.encode('utf-8')
+        elif not isinstance(chunk, str):
+            raise TypeError(
+                'Streamed chunks must be strings, got {}'.format(
+                    type(chunk).__name__)
+            )
+
+        if chunk:
+            self.request.write(chunk)
+
+    def _unregister(self, result):
+        self.request.unregisterProducer()
+        close = getattr(self.iterator, 'close', None)
+        if close is not None:
+            close()
+
+        return result
+
+
+@implementer(IBodyProducer)
+class JSONArrayProducer(object):
+    """
+    I write the rows of a result set as a JSON array. The rows are pulled
+    in batches in a thread of the database pool (or the given one) and
+    every batch is encoded in that same thread, the reactor thread only
+    writes the encoded batches.
+
+    The thread waits while the transport pauses me, so there is never more
+    than one batch in memory no matter how many rows the result set has.
+    It never waits longer than `pause_timeout` seconds, stalled clients
+    get their response aborted (and the transaction of the thread rolled
+    back) so they can not hold the threads of the database pool.
+
+    The source can be a Storm result set, any iterable or a callable that
+    returns one. Using a callable is recommended because the query is then
+    executed in the same thread that iterates it (Storm stores are per
+    thread)::
+
+        return response.StreamedJSON(
+            lambda: store.find(Customer), fields=['id', 'name'])
+
+    :param source: the result set, iterable or callable to stream
+    :param fields: the fields of every row to include (all if None)
+    :type fields: list
+    :param exclude: the fields of every row to exclude
+    :type exclude: list
+    :param batch_size: the number of rows pulled and encoded at once
+    :type batch_size: int
+    :param threadpool: the pool where the rows are pulled and encoded
+    :type threadpool: :class:`twisted.python.threadpool.ThreadPool`
+    :param pause_timeout: seconds that the thread waits while I am paused
+    :type pause_timeout: float
+    """
+
+    length = UNKNOWN_LENGTH
+
+    def __init__(self, source, fields=None, exclude=None, batch_size=500,
+                 threadpool=None, pause_timeout=30):
+        self.source = source
+        self.fields = fields
+        self.exclude = exclude
+        self.batch_size = batch_size
+        self.threadpool = threadpool
+        self.pause_timeout = pause_timeout
+        self.encoder = serializer.JSONSerializer().encoder
+        self._consumer = None
+        self._paused = None
+        self._stopped = False
+
+    def startProducing(self, consumer):
+        """
+        Start writing the JSON array into the consumer, returns a Deferred
+        that fires when the whole array has been written
+        """
+
+        from twisted.internet import reactor
+
+        threadpool = self.threadpool
+        if threadpool is None:
+            from mamba.enterprise.database import Database
+            threadpool = Database.pool
+
+        self._consumer = consumer
+        return threads.deferToThreadPool(
+            reactor, threadpool, self._produce, reactor)
+
+    def pauseProducing(self):
+        if self._paused is None:
+            self._paused = defer.Deferred()
+
+    def resumeProducing(self):
+        paused, self._paused = self._paused, None
+        if paused is not None:
+            paused.callback(None)
+
+    def stopProducing(self):
+        self._stopped = True
+        self.resumeProducing()
+
+    def _produce(self, reactor):
+        """Pull, encode and write the rows (runs in the pool thread)
+        """
+
+        try:
+            self._stream(reactor)
+        finally:
+            # we are not run by a transactor, end the (read only) database
+            # work of the source so the thread does not keep it open
+            transaction.abort()
+
+    def _stream(self, reactor):
+        source = self.source
+        if callable(source) and not hasattr(source, '__iter__'):
+            source = source()
+
+        rows = iter(source)
+        separator = '['
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+
+            data = separator + ','.join(
+                self.encoder.encode(self._row(row)) for row in batch)
+            separator = ','
+            self._wait(reactor, data)
+
+        self._wait(reactor, ']' if separator == ',' else '[]')
+
+    def _wait(self, reactor, data):
+        """
+        Write the data from the reactor thread and block until the consumer
+        is not paused anymore
+        """
+
+        if self._stopped:
+            raise task.TaskStopped()
+
+        try:
+            threads.blockingCallFromThread(
+                reactor, self._write, data, reactor)
+        except defer.TimeoutError:
+            self._stopped = True
+            raise
+
+        if self._stopped:
+            raise task.TaskStopped()
+
+    def _write(self, data, reactor):
+        self._consumer.write(data)
+        paused = self._paused
+        if paused is not None and self.pause_timeout is not None:
+            waiting = defer.Deferred()
+            paused.addCallback(
+                lambda _: waiting.called or waiting.callback(None))
+            return waiting.addTimeout(self.pause_timeout, reactor)
+
+        return paused
+
+    def _row(self, row):
+        """Convert a row into something that can be encoded as JSON
+        """
+
+        if callable(getattr(row, 'dict', None)):
+            kwargs = {'traverse': False, 'json': True}
+            if self.fields is not None:
+                kwargs['fields'] = self.fields
+            if self.exclude is not None:
+                kwargs['exclude'] = self.exclude
+            return row.dict(**kwargs)
+
+        if isinstance(row, dict):
+            if self.fields is not None:
+                return dict((k, v) for k, v in row.iteritems()
+                            if k in self.fields)
+            if self.exclude is not None:
+                return dict((k, v) for k, v in row.iteritems()
+                            if k not in self.exclude)
+
+        return row
+
+
+def stream(source, request):
+    """
+    Stream the given source (a generator, an iterator or a body producer)
+    into the request. The request is never finished here, the returned
+    Deferred fires when the whole source has been written.
+
+    As the response has no Content-Length (unless the body producer knows
+    its length) HTTP/1.1 clients get it with chunked transfer encoding
+
+    :param source: the source to stream
+    :param request: the HTTP request
+    :type request: :class:`twisted.web.server.Request`
+    """
+
+    if callable(getattr(source, 'startProducing', None)):
+        length = getattr(source, 'length', UNKNOWN_LENGTH)
+        if length is not UNKNOWN_LENGTH:
+            request.setHeader('content-length', str(length))
+
+        request.registerProducer(source, True)
+        result = defer.maybeDeferred(source.startProducing, request)
+
+        def unregister(result):
+            request.unregisterProducer()
+            return result
+
+        result.addBoth(unregister)
+        producer = source
+    else:
+        producer = IteratorProducer(iter(source), request)
+        result = producer.start()
+
+    # the client went away, stop producing
+    request.notifyFinish().addErrback(lambda _: producer.stopProducing())
+    return result
+
+
+__all__ = ['is_streamable', 'IteratorProducer', 'JSONArrayProducer', 'stream']
@@ -50,11 +50,11 @@ setup(
         'test/application/view/stylesheets/*.css',
         'test/application/view/stylesheets/*.less'
     ]},
-    tests_require=['twisted>=10.2.0', 'doublex', 'PyHamcrest'],
+    tests_require=['twisted>=16.5.0', 'doublex', 'PyHamcrest'],
     install_requires=[
-        'twisted>=10.2.0', 'storm', 'jinja2>=2.4', 'singledispatch'],
+        'twisted>=16.5.0', 'storm', 'jinja2>=2.4', 'singledispatch'],
     requires=[
-        'twisted(>=10.2.0)', 'storm', 'zope.component(>=4.1.0)', 'transaction',
+        'twisted(>=16.5.0)', 'storm', 'zope.component(>=4.1.0)', 'transaction',
         'jinja2(>=2.4)', 'singledispatch'
     ],
     dependency_links=[